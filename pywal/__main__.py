@@ -17,11 +17,20 @@ import sys
 import textwrap
 
 from .settings import __version__, CACHE_DIR, CONF_DIR
+from . import bundle
+from . import cache
 from . import colors
+from . import duplicates
 from . import export
 from . import image
+from . import index
+from . import pixels
+from . import precompute
+from . import registry
 from . import reload
+from . import runner
 from . import sequences
+from . import similar
 from . import theme
 from . import util
 from . import wallpaper
@@ -61,6 +70,15 @@ def get_args():
           NO_FUN                set to 1 to disable eastereggs.
           EASTEREGGS            set to 0 to disable eastereggs, set to 1 to enable them.
           SHITPOSTS             set to 1 to enable shitposts.
+          PYWAL_OCTREE_MEMORY   MiB of pixels the octree backend holds at once, default 64.
+          PYWAL_CACHE_MAX_ENTRIES  cached colorschemes kept at most, default 100000.
+          PYWAL_CACHE_MAX_SIZE  MiB of cached colorschemes kept at most, default 256.
+          PYWAL_CACHE_MAX_AGE   days a cached colorscheme is kept since its last use, default 365.
+          PYWAL_CACHE_FORMAT    binary or json, how cached colorschemes are stored, default binary.
+          PYWAL_PRECOMPUTE_MEMORY  MiB of memory each --precompute process may use, default 2048.
+          PYWAL_DUPLICATE_DISTANCE  bits the hashes of near-duplicate images may differ by, default 4.
+          PYWAL_DUPLICATE_REUSE  set to 1 to reuse the cached colorscheme of a near-duplicate image instead of running the backend.
+          PYWAL_FINGERPRINT     how images are identified in the cache: md5, blake2b, mmap or quick.
     '''
     arg = argparse.ArgumentParser(
             description=description,
@@ -88,12 +106,25 @@ def get_args():
         "--backend",
         metavar="backend",
         help="Which color backend to use. \
-                           Use 'wal --backend' to list backends.",
+                           Use 'wal --backend' to list backends. \
+                           'random' picks any installed backend, \
+                           'auto[:ms]' picks the best backend expected \
+                           to finish within ms (default 1000).",
         const="list_backends",
         type=str,
         nargs="?",
     )
 
+    arg.add_argument(
+        "--samples",
+        metavar="count[:ms]",
+        help="Hand at most count pixels, sampled evenly across the \
+              image, to the backends that decode images themselves \
+              (kmeans, wu). Sampling stops early once more pixels \
+              wouldn't change the colors or after ms milliseconds.",
+        type=pixels.sample_spec,
+    )
+
     arg.add_argument(
         "--out-dir",
         metavar="out_dir",
@@ -145,6 +176,45 @@ def get_args():
         "subdirectories instead of the root only.",
     )
 
+    arg.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="When pywal is given a directory as input and this "
+        "flag is used: List every directory again instead of only "
+        "those whose modification time changed.",
+    )
+
+    arg.add_argument(
+        "--min-resolution",
+        metavar="WIDTHxHEIGHT",
+        type=image.resolution_spec,
+        help="When pywal is given a directory as input: Only pick images "
+        "at least this large.",
+    )
+
+    arg.add_argument(
+        "--aspect",
+        metavar="W:H",
+        type=image.aspect_spec,
+        help="When pywal is given a directory as input: Only pick images "
+        "of this aspect ratio, ie: 16:9.",
+    )
+
+    arg.add_argument(
+        "--orientation",
+        choices=index.ORIENTATIONS,
+        help="When pywal is given a directory as input: Only pick "
+        "landscape, portrait or square images.",
+    )
+
+    arg.add_argument(
+        "--select",
+        choices=similar.MODES,
+        help="When pywal is given a directory as input and this "
+        "flag is used: Pick the image whose cached colorscheme is the "
+        "most similar to or different from the current one.",
+    )
+
     arg.add_argument(
         "--saturate", metavar="-1.0 - 1.0", help="Set the color saturation."
     )
@@ -165,6 +235,57 @@ def get_args():
         "-c", action="store_true", help="Delete all cached colorschemes."
     )
 
+    arg.add_argument(
+        "--precompute",
+        metavar="dir",
+        help="Cache the colorschemes of every image in dir for each of "
+        "the comma separated --backend(s) with the other options given, "
+        "in parallel. Already cached images are skipped.",
+    )
+
+    arg.add_argument(
+        "--jobs",
+        metavar="N",
+        type=int,
+        help="Processes --precompute uses, default: one per cpu.",
+    )
+
+    arg.add_argument(
+        "--duplicates",
+        metavar="dir",
+        help="List the clusters of near-duplicate images in dir, "
+        "resized, re-encoded or slightly cropped copies.",
+    )
+
+    arg.add_argument(
+        "--cache-gc",
+        action="store_true",
+        help="Evict the cached colorschemes past the cache limits "
+        "(PYWAL_CACHE_MAX_ENTRIES, PYWAL_CACHE_MAX_SIZE, "
+        "PYWAL_CACHE_MAX_AGE) and compact the cache.",
+    )
+
+    arg.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Show the cache hit rate, miss reasons, size and backend "
+        "run times.",
+    )
+
+    arg.add_argument(
+        "--cache-export",
+        metavar="bundle.tar",
+        help="Pack the cached colorschemes into a tar bundle (.tar.gz, "
+        ".tar.xz and .tar.bz2 are compressed) for --cache-import.",
+    )
+
+    arg.add_argument(
+        "--cache-import",
+        metavar="bundle.tar",
+        help="Merge the colorschemes of a bundle made with --cache-export "
+        "into the cache, cached ones are kept.",
+    )
+
     arg.add_argument(
         "-i",
         metavar='"/path/to/img.jpg"',
@@ -246,6 +367,15 @@ def get_args():
     return arg
 
 
+def image_filters(args):
+    """Directory image filters of the arguments."""
+    return {
+        "min_resolution": args.min_resolution,
+        "aspect": args.aspect,
+        "orientation": args.orientation,
+    }
+
+
 def parse_args_exit(parser):
     """Process args that exit."""
     args = parser.parse_args()
@@ -254,6 +384,13 @@ def parse_args_exit(parser):
         parser.print_help()
         sys.exit(1)
 
+    # Every command below may fingerprint images.
+    if util.FINGERPRINT not in util.FINGERPRINTS:
+        parser.error(
+            "PYWAL_FINGERPRINT must be one of: %s."
+            % ", ".join(util.FINGERPRINTS)
+        )
+
     if args.v:
         parser.exit(0, "wal %s\n" % __version__)
 
@@ -269,6 +406,45 @@ def parse_args_exit(parser):
     if args.c:
         scheme_dir = os.path.join(CACHE_DIR, "schemes")
         shutil.rmtree(scheme_dir, ignore_errors=True)
+        cache.clear(CACHE_DIR)
+        shutil.rmtree(
+            os.path.join(CACHE_DIR, runner.MEMO_DIR), ignore_errors=True
+        )
+        util.prune_checksums(CACHE_DIR, 0)
+        sys.exit(0)
+
+    if args.cache_gc:
+        logging.info("Evicted %s cached colorschemes.", cache.gc())
+        sys.exit(0)
+
+    if args.cache_stats:
+        cache.report_stats()
+        sys.exit(0)
+
+    if args.cache_export:
+        try:
+            count = bundle.export(args.cache_export)
+        except OSError as err:
+            logging.error("Couldn't export %s: %s", args.cache_export, err)
+            sys.exit(1)
+
+        logging.info(
+            "Exported %s colorschemes to %s.", count, args.cache_export
+        )
+        sys.exit(0)
+
+    if args.cache_import:
+        try:
+            counts = bundle.merge(args.cache_import)
+        except (OSError, ValueError) as err:
+            logging.error("Couldn't import %s: %s", args.cache_import, err)
+            sys.exit(1)
+
+        logging.info(
+            "Imported %(imported)s colorschemes, %(existing)s were "
+            "cached already, %(rejected)s rejected.",
+            counts,
+        )
         sys.exit(0)
 
     if (
@@ -277,6 +453,8 @@ def parse_args_exit(parser):
         and not args.R
         and not args.w
         and not args.backend
+        and not args.precompute
+        and not args.duplicates
     ):
         parser.error(
             "No input specified.\n" "--backend, --theme, -i or -R are required."
@@ -287,13 +465,44 @@ def parse_args_exit(parser):
         sys.exit(0)
 
     if args.backend == "list_backends":
+        available = registry.available()
         print(
             "\n - ".join(
-                ["\033[1;32mBackends\033[0m:", *colors.list_backends()]
+                [
+                    "\033[1;32mBackends\033[0m:",
+                    *[
+                        b if b in available else b + " (not installed)"
+                        for b in colors.list_backends()
+                    ],
+                ]
             )
         )
         sys.exit(0)
 
+    if args.precompute:
+        counts = precompute.run(
+            args.precompute,
+            args.backend.split(",") if args.backend else [None],
+            light=args.l,
+            sat=args.saturate,
+            c16=args.cols16,
+            cst=args.contrast,
+            recursive=args.recursive,
+            jobs=args.jobs,
+            filters=image_filters(args),
+            samples=args.samples,
+        )
+        sys.exit(1 if counts["error"] or not counts else 0)
+
+    if args.duplicates:
+        duplicates.report(
+            args.duplicates,
+            recursive=args.recursive,
+            rebuild=args.rebuild_index,
+            filters=image_filters(args),
+        )
+        sys.exit(0)
+
 
 def parse_args(parser):
     """Process args."""
@@ -310,7 +519,20 @@ def parse_args(parser):
 
     if args.i and not args.theme:
         image_file = image.get(
-            args.i, iterative=args.iterative, recursive=args.recursive
+            args.i,
+            iterative=args.iterative,
+            recursive=args.recursive,
+            rebuild=args.rebuild_index,
+            filters=image_filters(args),
+            select=args.select,
+            options=cache.options_key(
+                args.backend,
+                args.l,
+                args.saturate,
+                c16=args.cols16,
+                cst=args.contrast,
+                samples=args.samples[0] if args.samples else 0,
+            ),
         )
         colors_plain = colors.get(
             image_file,
@@ -319,6 +541,7 @@ def parse_args(parser):
             sat=args.saturate,
             c16=args.cols16,
             cst=args.contrast,
+            samples=args.samples,
         )
 
     if args.theme:
@@ -338,6 +561,7 @@ def parse_args(parser):
             sat=args.saturate,
             c16=args.cols16,
             cst=args.contrast,
+            samples=args.samples,
         )
 
     if args.b:
@@ -396,7 +620,16 @@ def main():
         CACHE_DIR = default_cache_dir
 
     parse_args_exit(parser)
-    parse_args(parser)
+
+    try:
+        parse_args(parser)
+    except (runner.RunnerError, registry.BackendError) as err:
+        logging.error("%s", err)
+        logging.error("Try another backend. (wal --backend)")
+        sys.exit(1)
+
+    cache.evict(batch=cache.EVICT_BATCH)
+
     donation.donation_message()
     eastereggs.eemsg()
 
@@ -6,7 +6,7 @@ import logging
 import sys
 
 try:
-    from colorthief import ColorThief
+    from colorthief import ColorThief, MMCQ, PQueue, CMap
 
 except ImportError:
     logging.error("ColorThief wasn't found on your system.")
@@ -14,27 +14,86 @@ except ImportError:
     sys.exit(1)
 
 from .. import colors
+from .. import instrument
 from .. import util
 
 
+class Quantizer:
+    """ColorThief's median cut with the image sampled and the color
+    histogram built once, only the box splitting is redone for each
+    palette size ColorThief(img).get_palette(color_count) would try."""
+
+    def __init__(self, img, quality=10):
+        image = ColorThief(img).image.convert("RGBA")
+        pixels = image.getdata()
+
+        # Same sampling as ColorThief.get_palette(): every quality-th
+        # pixel that is mostly opaque and not white.
+        valid_pixels = []
+        for i in range(0, image.size[0] * image.size[1], quality):
+            r, g, b, a = pixels[i]
+            if a >= 125 and not (r > 250 and g > 250 and b > 250):
+                valid_pixels.append((r, g, b))
+
+        if not valid_pixels:
+            raise ValueError("Empty pixels when quantize.")
+
+        self.histo = MMCQ.get_histo(valid_pixels)
+        self.vbox = MMCQ.vbox_from_pixels(valid_pixels, self.histo)
+
+    def split(self, queue, target):
+        """Median cut the boxes in queue until there are target boxes."""
+        n_color = 1
+        for _ in range(MMCQ.MAX_ITERATION):
+            vbox = queue.pop()
+            if not vbox.count:
+                queue.push(vbox)
+                continue
+
+            vbox1, vbox2 = MMCQ.median_cut_apply(self.histo, vbox)
+            queue.push(vbox1)
+            if vbox2:
+                queue.push(vbox2)
+                n_color += 1
+
+            if n_color >= target:
+                return
+
+    def get_palette(self, color_count):
+        """Quantize to color_count colors."""
+        queue = PQueue(lambda x: x.count)
+        queue.push(self.vbox)
+        self.split(queue, MMCQ.FRACT_BY_POPULATIONS * color_count)
+
+        volume_queue = PQueue(lambda x: x.count * x.volume)
+        while queue.size():
+            volume_queue.push(queue.pop())
+        self.split(volume_queue, color_count - volume_queue.size())
+
+        cmap = CMap()
+        while volume_queue.size():
+            cmap.push(volume_queue.pop())
+        return cmap.palette
+
+
 def gen_colors(img):
     """Loop until 16 colors are generated."""
-    color_cmd = ColorThief(img).get_palette
+    quantizer = Quantizer(img)
 
     for i in range(0, 10, 1):
-        raw_colors = color_cmd(color_count=8 + i)
+        raw_colors = quantizer.get_palette(color_count=8 + i)
 
         if len(raw_colors) >= 8:
             break
 
-        if i == 10:
-            logging.error("ColorThief couldn't generate a suitable palette.")
-            sys.exit(1)
+        logging.warning("ColorThief couldn't generate a palette.")
+        logging.warning("Trying a larger palette size %s", 8 + i + 1)
 
-        else:
-            logging.warning("ColorThief couldn't generate a palette.")
-            logging.warning("Trying a larger palette size %s", 8 + i)
+    else:
+        logging.error("ColorThief couldn't generate a suitable palette.")
+        sys.exit(1)
 
+    instrument.record("backend", "colorthief", palette_sizes=i + 1)
     return [util.rgb_to_hex(color) for color in raw_colors]
 
 
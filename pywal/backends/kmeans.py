@@ -0,0 +1,275 @@
+"""
+Generate a colorscheme using mini-batch k-means in OKLab.
+
+A random sample of the pixels is clustered in OKLab so that distances
+follow perceived color differences. The centers are seeded with
+k-means++ and centers left without pixels are moved onto the pixels
+farthest from theirs.
+"""
+
+import logging
+import random
+import time
+
+from .. import colors
+from .. import instrument
+from .. import pixels
+from .. import registry
+from .. import util
+
+if not pixels.has_pil:
+    raise ImportError("Pillow wasn't found on your system.")
+
+
+SAMPLE = 16384
+BATCH = 1024
+MAX_ITER = 100
+TOL = 1e-6
+PATIENCE = 10
+
+
+def sample(data, size, rng):
+    """Pick up to size random pixels of packed RGB bytes, in OKLab."""
+    count = len(data) // 3
+    indexes = rng.sample(range(count), min(size, count))
+    lab = {}
+    points = []
+
+    for i in indexes:
+        rgb = data[i * 3:i * 3 + 3]
+        if rgb not in lab:
+            lab[rgb] = util.rgb_to_oklab(rgb)
+        points.append(lab[rgb])
+
+    return points
+
+
+def distance(point, center):
+    """Squared euclidean distance."""
+    return (
+        (point[0] - center[0]) ** 2
+        + (point[1] - center[1]) ** 2
+        + (point[2] - center[2]) ** 2
+    )
+
+
+def nearest(point, centers):
+    """Index of the closest center and the squared distance to it."""
+    best, best_dist = 0, distance(point, centers[0])
+
+    for i in range(1, len(centers)):
+        dist = distance(point, centers[i])
+        if dist < best_dist:
+            best, best_dist = i, dist
+
+    return best, best_dist
+
+
+def seed(points, color_count, rng):
+    """k-means++ seeding, picks new centers far from the existing ones
+    until there are color_count of them."""
+    centers = [list(rng.choice(points))]
+
+    while len(centers) < color_count:
+        weights = [nearest(point, centers)[1] for point in points]
+
+        # Fewer distinct colors than centers.
+        if not any(weights):
+            break
+
+        centers.append(list(rng.choices(points, weights)[0]))
+
+    return centers
+
+
+def assign(points, centers):
+    """Number of points closest to each center and the squared distance
+    of every point to its closest center."""
+    weights = [0] * len(centers)
+    dists = []
+
+    for point in points:
+        i, dist = nearest(point, centers)
+        weights[i] += 1
+        dists.append(dist)
+
+    return weights, dists
+
+
+def reseed_empty(points, centers, counts):
+    """Move the centers no point is closest to onto the points farthest
+    from their own center. Returns how many were moved."""
+    weights, dists = assign(points, centers)
+    empty = [i for i, weight in enumerate(weights) if not weight]
+    if not empty:
+        return 0
+
+    far = sorted(range(len(points)), key=dists.__getitem__, reverse=True)
+    moved = 0
+    taken = set()
+
+    for p in far:
+        if moved == len(empty) or not dists[p]:
+            break
+
+        if points[p] in taken:
+            continue
+
+        taken.add(points[p])
+        centers[empty[moved]] = list(points[p])
+        counts[empty[moved]] = 0
+        moved += 1
+
+    return moved
+
+
+def recenter(points, centers):
+    """Move every center to the mean of the points closest to it, the
+    mini-batch updates leave them weighted by where they started.
+    Returns the number of points of each center."""
+    sums = [[0.0, 0.0, 0.0] for _ in centers]
+    weights = [0] * len(centers)
+
+    for point in points:
+        i = nearest(point, centers)[0]
+        weights[i] += 1
+        sums[i][0] += point[0]
+        sums[i][1] += point[1]
+        sums[i][2] += point[2]
+
+    for i, weight in enumerate(weights):
+        if weight:
+            centers[i] = [total / weight for total in sums[i]]
+
+    return weights
+
+
+def minibatch(points, centers, counts, rng):
+    """Refine centers in place with mini-batch updates.
+
+    Stops early once the centers move less than TOL in a batch or the
+    smoothed batch inertia hasn't improved for PATIENCE batches.
+    Returns (iterations, converged)."""
+    batch_size = min(BATCH, len(points))
+    alpha = min(batch_size * 2 / len(points), 1.0)
+    smoothed = best = None
+    stale = 0
+
+    for iteration in range(1, MAX_ITER + 1):
+        batch = rng.sample(points, batch_size)
+        assigned = [nearest(point, centers) for point in batch]
+        old = [center[:] for center in centers]
+
+        for point, (i, _) in zip(batch, assigned):
+            counts[i] += 1
+            rate = 1 / counts[i]
+            center = centers[i]
+            center[0] += (point[0] - center[0]) * rate
+            center[1] += (point[1] - center[1]) * rate
+            center[2] += (point[2] - center[2]) * rate
+
+        shift = sum(map(distance, old, centers)) / len(centers)
+        if shift < TOL:
+            return iteration, True
+
+        inertia = sum(dist for _, dist in assigned) / batch_size
+        if smoothed is None:
+            smoothed = inertia
+        else:
+            smoothed = smoothed * (1 - alpha) + inertia * alpha
+
+        if best is None or smoothed < best:
+            best, stale = smoothed, 0
+        else:
+            stale += 1
+            if stale >= PATIENCE:
+                return iteration, False
+
+    return MAX_ITER, False
+
+
+def quantize(data, color_count, rng_seed=0):
+    """Cluster packed RGB bytes into at most color_count colors,
+    most common first."""
+    rng = random.Random(rng_seed)
+
+    with instrument.timer("backend", "kmeans") as event:
+        points = sample(data, SAMPLE, rng)
+        if not points:
+            return []
+
+        start = time.perf_counter()
+        centers = seed(points, color_count, rng)
+        counts = [0] * len(centers)
+        event["seed_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        iterations, converged = minibatch(points, centers, counts, rng)
+        reseeded = 0
+
+        for _ in range(color_count):
+            moved = reseed_empty(points, centers, counts)
+            if not moved:
+                break
+
+            reseeded += moved
+            more, converged = minibatch(points, centers, counts, rng)
+            iterations += more
+
+        event["iterate_seconds"] = time.perf_counter() - start
+        weights = recenter(points, centers)
+
+        event["iterations"] = iterations
+        event["converged"] = converged
+        event["reseeded"] = reseeded
+
+    logging.debug(
+        "k-means: %s iterations, converged: %s.", iterations, converged
+    )
+
+    palette = sorted(zip(weights, centers), key=lambda c: c[0], reverse=True)
+    return [util.oklab_to_rgb(center) for weight, center in palette if weight]
+
+
+def gen_colors(img, samples=None):
+    """Generate 8 colors with mini-batch k-means."""
+    count, budget = samples or (0, None)
+    raw_colors = quantize(pixels.load(img, samples=count, budget=budget), 8)
+
+    if not raw_colors:
+        raise registry.BackendError("k-means couldn't generate a palette.")
+
+    while len(raw_colors) < 8:
+        raw_colors.extend(raw_colors)
+
+    return [util.rgb_to_hex(color) for color in raw_colors[:8]]
+
+
+def adjust(cols, light, **kwargs):
+    """Create palette.
+    :keyword-args:
+    -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
+    """
+    if "c16" in kwargs:
+        cols16 = kwargs["c16"]
+    else:
+        cols16 = False
+    cols.sort(key=util.rgb_to_yiq)
+    raw_colors = [*cols, *cols]
+    raw_colors[0] = util.darken_color(cols[0], 0.80)
+
+    return colors.generic_adjust(raw_colors, light, c16=cols16)
+
+
+def get(img, light=False, **kwargs):
+    """Get colorscheme.
+    :keyword-args:
+    -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
+    -    samples: (count, ms) pixels to sample, see pixels.sample()
+    """
+    if "c16" in kwargs:
+        cols16 = kwargs["c16"]
+    else:
+        cols16 = False
+    cols = gen_colors(img, kwargs.get("samples"))
+    return adjust(cols, light, c16=cols16)
@@ -0,0 +1,236 @@
+"""
+Generate a colorscheme using an octree quantizer.
+
+The image is streamed a strip of rows at a time and the octree never
+holds more than MAX_LEAVES colors, so memory stays the same whatever
+the resolution. The strip size comes from PYWAL_OCTREE_MEMORY (MiB).
+"""
+
+import collections
+import logging
+import os
+import sys
+
+try:
+    import resource
+
+except ImportError:
+    resource = None
+
+from .. import colors
+from .. import instrument
+from .. import pixels
+from .. import registry
+from .. import util
+
+
+MAX_DEPTH = 8
+MAX_LEAVES = 256
+SAMPLES = 1 << 20
+MEMORY = int(os.getenv("PYWAL_OCTREE_MEMORY", 64)) * 1024**2
+
+
+class Node:
+    """An octree node, leaves hold the summed colors of their pixels."""
+
+    __slots__ = ("count", "red", "green", "blue", "children", "leaf")
+
+    def __init__(self, leaf=False):
+        self.count = 0
+        self.red = 0
+        self.green = 0
+        self.blue = 0
+        self.children = [None] * 8
+        self.leaf = leaf
+
+
+class Octree:
+    """Octree color quantizer with a bounded number of leaves."""
+
+    def __init__(self, max_leaves=MAX_LEAVES):
+        self.max_leaves = max_leaves
+        self.root = Node()
+        self.leaves = 0
+        # Inner nodes by depth, the deepest ones get merged first.
+        self.levels = [[] for _ in range(MAX_DEPTH)]
+        self.levels[0].append(self.root)
+
+    def add(self, r, g, b, n=1):
+        """Add n pixels of a color."""
+        node = self.root
+
+        for depth in range(MAX_DEPTH):
+            if node.leaf:
+                break
+
+            shift = 7 - depth
+            i = ((r >> shift) & 1) << 2 | ((g >> shift) & 1) << 1
+            i |= (b >> shift) & 1
+            child = node.children[i]
+
+            if child is None:
+                child = Node(leaf=depth == MAX_DEPTH - 1)
+                node.children[i] = child
+
+                if child.leaf:
+                    self.leaves += 1
+                else:
+                    self.levels[depth + 1].append(child)
+
+            node = child
+
+        node.count += n
+        node.red += r * n
+        node.green += g * n
+        node.blue += b * n
+
+        while self.leaves > self.max_leaves:
+            self.reduce()
+
+    def reduce(self):
+        """Merge the least populated deepest inner node into a leaf."""
+        level = next(lvl for lvl in reversed(self.levels) if lvl)
+        node = min(
+            level,
+            key=lambda nd: sum(c.count for c in nd.children if c),
+        )
+        level.remove(node)
+
+        for child in node.children:
+            if child:
+                node.count += child.count
+                node.red += child.red
+                node.green += child.green
+                node.blue += child.blue
+                self.leaves -= 1
+
+        node.children = [None] * 8
+        node.leaf = True
+        self.leaves += 1
+
+    def palette(self, color_count):
+        """Reduce to color_count colors, most common first."""
+        while self.leaves > color_count and any(self.levels[1:]):
+            self.reduce()
+
+        leaves = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                if node.count:
+                    leaves.append(node)
+            else:
+                stack.extend(child for child in node.children if child)
+
+        leaves.sort(key=lambda nd: nd.count, reverse=True)
+        return [
+            [
+                nd.red // nd.count,
+                nd.green // nd.count,
+                nd.blue // nd.count,
+            ]
+            for nd in leaves[:color_count]
+        ]
+
+
+def peak_memory():
+    """Peak resident memory in MiB of wal and of its largest child."""
+    if not resource:
+        return None
+
+    scale = 1024**2 if sys.platform == "darwin" else 1024
+    return max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    ) // scale
+
+
+def quantize(width, height, strips, color_count, samples=SAMPLES):
+    """Quantize an image streamed as strips of packed RGB rows.
+    Only every n-th row and column is sampled to keep about
+    samples pixels, every row is still read."""
+    with instrument.timer("backend", "octree") as event:
+        tree = Octree()
+        step = max(int((width * height / samples) ** 0.5), 1)
+        row_size = width * 3
+        y = 0
+        reported = 0
+        leftover = b""
+
+        for strip in strips:
+            strip = leftover + strip
+            rows = len(strip) // row_size
+            leftover = strip[rows * row_size:]
+
+            for row in range(rows):
+                if (y + row) % step:
+                    continue
+
+                line = strip[row * row_size:(row + 1) * row_size]
+                step_size = step * 3
+                counts = collections.Counter(
+                    zip(
+                        line[0::step_size],
+                        line[1::step_size],
+                        line[2::step_size],
+                    )
+                )
+                for (r, g, b), n in counts.items():
+                    tree.add(r, g, b, n)
+
+            y += rows
+            progress = y * 4 // max(height, 1)
+            if progress > reported:
+                reported = progress
+                logging.info("Octree: %s%% of the rows read.", progress * 25)
+
+        event["rows"] = y
+        event["step"] = step
+        event["peak_memory_mib"] = peak_memory()
+
+    logging.info("Octree: peak memory %s MiB.", event["peak_memory_mib"])
+    return tree.palette(color_count)
+
+
+def gen_colors(img):
+    """Generate 8 colors with the octree quantizer."""
+    width, height, strips = pixels.stream_rows(img, MEMORY)
+    raw_colors = quantize(width, height, strips, 8)
+
+    if not raw_colors:
+        raise registry.BackendError("Octree couldn't generate a palette.")
+
+    while len(raw_colors) < 8:
+        raw_colors.extend(raw_colors)
+
+    return [util.rgb_to_hex(color) for color in raw_colors[:8]]
+
+
+def adjust(cols, light, **kwargs):
+    """Create palette.
+    :keyword-args:
+    -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
+    """
+    if "c16" in kwargs:
+        cols16 = kwargs["c16"]
+    else:
+        cols16 = False
+    cols.sort(key=util.rgb_to_yiq)
+    raw_colors = [*cols, *cols]
+    raw_colors[0] = util.darken_color(cols[0], 0.80)
+
+    return colors.generic_adjust(raw_colors, light, c16=cols16)
+
+
+def get(img, light=False, **kwargs):
+    """Get colorscheme.
+    :keyword-args:
+    -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
+    """
+    if "c16" in kwargs:
+        cols16 = kwargs["c16"]
+    else:
+        cols16 = False
+    cols = gen_colors(img)
+    return adjust(cols, light, c16=cols16)
@@ -2,20 +2,17 @@
 Generate a colorscheme using okthief.
 """
 
-import logging
-import shutil
-import subprocess
-import sys
 import json
 
 from .. import colors
+from .. import runner
 from .. import util
 
 
 def gen_colors(img):
     """Generate a colorscheme using okthief."""
     cmd = ["okthief", "--num-colors", "8", "--file"]
-    out = subprocess.check_output([*cmd, img])
+    out = runner.run([*cmd, img], input_file=img)
     cols = [x["hex"] for x in json.loads(out)]
     white, black, rest = (cols[0], cols[1], cols[2:])
     cols = [black]
@@ -46,11 +43,6 @@ def get(img, light=False, **kwargs):
         cols16 = kwargs["c16"]
     else:
         cols16 = False
-    if not shutil.which("okthief"):
-        logging.error("okthief wasn't found on your system.")
-        logging.error("Try another backend. (wal --backend)")
-        sys.exit(1)
-
     cols = gen_colors(img)
     cols[0] = util.darken_color(cols[0], 0.80)
     return adjust(cols, light, c16=cols16)
@@ -2,19 +2,15 @@
 Generate a colorscheme using Schemer2.
 """
 
-import logging
-import shutil
-import subprocess
-import sys
-
 from .. import colors
+from .. import runner
 from .. import util
 
 
 def gen_colors(img):
     """Generate a colorscheme using Colorz."""
     cmd = ["schemer2", "-format", "img::colors", "-minBright", "75", "-in"]
-    return subprocess.check_output([*cmd, img]).splitlines()
+    return runner.run([*cmd, img], input_file=img).splitlines()
 
 
 def adjust(cols, light, **kwargs):
@@ -42,10 +38,5 @@ def get(img, light=False, **kwargs):
         cols16 = kwargs["c16"]
     else:
         cols16 = False
-    if not shutil.which("schemer2"):
-        logging.error("Schemer2 wasn't found on your system.")
-        logging.error("Try another backend. (wal --backend)")
-        sys.exit(1)
-
     cols = [col.decode("UTF-8") for col in gen_colors(img)]
     return adjust(cols, light, c16=cols16)
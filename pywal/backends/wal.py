@@ -5,10 +5,9 @@ Generate a colorscheme using imagemagick.
 import logging
 import re
 import shutil
-import subprocess
-import sys
 
 from .. import colors
+from .. import runner
 
 
 def imagemagick(color_count, img, magick_command):
@@ -21,18 +20,19 @@ def imagemagick(color_count, img, magick_command):
         "-unique-colors",
         "txt:-",
     ]
-    img += "[0]"
 
     try:
-        output = subprocess.check_output(
-            [*magick_command.split(), img, *flags], stderr=subprocess.STDOUT
+        output = runner.run(
+            [*magick_command.split(), img + "[0]", *flags],
+            input_file=img,
+            merge_stderr=True,
         ).splitlines()
-    except subprocess.CalledProcessError as Err:
-        logging.error("Imagemagick error: %s", Err)
+    except runner.CommandFailed as err:
+        logging.error("Imagemagick error: %s", err)
         logging.error(
             "IM 7 disables stdout by default, check the manual or wiki to fix."
         )
-        sys.exit(1)
+        raise
     return output
 
 
@@ -49,9 +49,7 @@ def has_im():
     if len(magick_commands) > 0:
         return magick_commands
 
-    logging.error("Imagemagick wasn't found on your system.")
-    logging.error("Try another backend. (wal --backend)")
-    sys.exit(1)
+    raise runner.CommandNotFound(["magick"])
 
 
 def gen_colors_with_command(
@@ -105,7 +103,10 @@ def gen_colors(img):
     for magick_command in magick_commands:
         logging.debug(f"Trying {magick_command}...")
 
-        hex_colors = gen_colors_with_command(img, magick_command)
+        try:
+            hex_colors = gen_colors_with_command(img, magick_command)
+        except runner.CommandFailed:
+            hex_colors = []
 
         if not hex_colors:
             logging.warning(
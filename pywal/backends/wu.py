@@ -0,0 +1,297 @@
+"""
+Generate a colorscheme using Xiaolin Wu's color quantizer.
+
+The pixels are counted into a 32x32x32 histogram of color moments in a
+single pass, the partitioning after that only touches the histogram so
+its cost doesn't depend on the image size.
+"""
+
+import collections
+
+from .. import colors
+from .. import instrument
+from .. import pixels
+from .. import registry
+from .. import util
+
+if not pixels.has_pil:
+    raise ImportError("Pillow wasn't found on your system.")
+
+
+SIDE = 33
+RED, GREEN, BLUE = range(3)
+
+
+def index(r, g, b):
+    """Index of a histogram cell."""
+    return (r * SIDE + g) * SIDE + b
+
+
+class Moments:
+    """Cumulative color moments of the histogram, each list holds the
+    sum over the cells up to and including (r, g, b)."""
+
+    def __init__(self, data):
+        size = SIDE**3
+        self.wt = [0] * size
+        self.mr = [0] * size
+        self.mg = [0] * size
+        self.mb = [0] * size
+        self.m2 = [0] * size
+
+        # Count identical colors first, this is the only pass over
+        # every pixel and it runs in C.
+        counts = collections.Counter(pixels.iter_pixels(data))
+
+        for (r, g, b), n in counts.items():
+            i = index((r >> 3) + 1, (g >> 3) + 1, (b >> 3) + 1)
+            self.wt[i] += n
+            self.mr[i] += r * n
+            self.mg[i] += g * n
+            self.mb[i] += b * n
+            self.m2[i] += (r * r + g * g + b * b) * n
+
+        for moment in (self.wt, self.mr, self.mg, self.mb, self.m2):
+            cumulate(moment)
+
+
+def cumulate(moment):
+    """Turn a histogram into a cumulative one, in place."""
+    for r in range(1, SIDE):
+        area = [0] * SIDE
+
+        for g in range(1, SIDE):
+            line = 0
+
+            for b in range(1, SIDE):
+                i = index(r, g, b)
+                line += moment[i]
+                area[b] += line
+                moment[i] = moment[index(r - 1, g, b)] + area[b]
+
+
+def volume(box, moment):
+    """Sum of a moment over a box."""
+    r0, r1, g0, g1, b0, b1 = box
+    return (
+        moment[index(r1, g1, b1)]
+        - moment[index(r1, g1, b0)]
+        - moment[index(r1, g0, b1)]
+        + moment[index(r1, g0, b0)]
+        - moment[index(r0, g1, b1)]
+        + moment[index(r0, g1, b0)]
+        + moment[index(r0, g0, b1)]
+        - moment[index(r0, g0, b0)]
+    )
+
+
+def bottom(box, axis, moment):
+    """Part of volume() that doesn't depend on where the box is cut."""
+    r0, r1, g0, g1, b0, b1 = box
+
+    if axis == RED:
+        return (
+            -moment[index(r0, g1, b1)]
+            + moment[index(r0, g1, b0)]
+            + moment[index(r0, g0, b1)]
+            - moment[index(r0, g0, b0)]
+        )
+
+    if axis == GREEN:
+        return (
+            -moment[index(r1, g0, b1)]
+            + moment[index(r1, g0, b0)]
+            + moment[index(r0, g0, b1)]
+            - moment[index(r0, g0, b0)]
+        )
+
+    return (
+        -moment[index(r1, g1, b0)]
+        + moment[index(r1, g0, b0)]
+        + moment[index(r0, g1, b0)]
+        - moment[index(r0, g0, b0)]
+    )
+
+
+def top(box, axis, pos, moment):
+    """Part of volume() that depends on the cut position."""
+    r0, r1, g0, g1, b0, b1 = box
+
+    if axis == RED:
+        return (
+            moment[index(pos, g1, b1)]
+            - moment[index(pos, g1, b0)]
+            - moment[index(pos, g0, b1)]
+            + moment[index(pos, g0, b0)]
+        )
+
+    if axis == GREEN:
+        return (
+            moment[index(r1, pos, b1)]
+            - moment[index(r1, pos, b0)]
+            - moment[index(r0, pos, b1)]
+            + moment[index(r0, pos, b0)]
+        )
+
+    return (
+        moment[index(r1, g1, pos)]
+        - moment[index(r1, g0, pos)]
+        - moment[index(r0, g1, pos)]
+        + moment[index(r0, g0, pos)]
+    )
+
+
+def variance(box, mom):
+    """Weighted variance of the colors in a box."""
+    weight = volume(box, mom.wt)
+    if not weight:
+        return 0.0
+
+    dr = volume(box, mom.mr)
+    dg = volume(box, mom.mg)
+    db = volume(box, mom.mb)
+    return volume(box, mom.m2) - (dr * dr + dg * dg + db * db) / weight
+
+
+def maximize(box, axis, mom, whole):
+    """Find the cut along axis that minimizes the summed variance
+    of both halves, returns (score, position), position is -1 when
+    the box can't be cut along axis."""
+    base = [bottom(box, axis, m) for m in (mom.mr, mom.mg, mom.mb, mom.wt)]
+    best, cut_pos = 0.0, -1
+
+    for pos in range(box[axis * 2] + 1, box[axis * 2 + 1]):
+        half_r, half_g, half_b, half_w = [
+            b + top(box, axis, pos, m)
+            for b, m in zip(base, (mom.mr, mom.mg, mom.mb, mom.wt))
+        ]
+        if not half_w or half_w == whole[3]:
+            continue
+
+        score = (half_r**2 + half_g**2 + half_b**2) / half_w
+        half_r, half_g, half_b, half_w = (
+            whole[0] - half_r,
+            whole[1] - half_g,
+            whole[2] - half_b,
+            whole[3] - half_w,
+        )
+        score += (half_r**2 + half_g**2 + half_b**2) / half_w
+
+        if score > best:
+            best, cut_pos = score, pos
+
+    return best, cut_pos
+
+
+def cut(box, mom):
+    """Split a box in two, None if it can't be split."""
+    whole = [volume(box, m) for m in (mom.mr, mom.mg, mom.mb, mom.wt)]
+    cuts = [maximize(box, axis, mom, whole) for axis in (RED, GREEN, BLUE)]
+    axis = max((RED, GREEN, BLUE), key=lambda a: cuts[a][0])
+    pos = cuts[axis][1]
+
+    if pos < 0:
+        return None
+
+    box1, box2 = list(box), list(box)
+    box1[axis * 2 + 1] = pos
+    box2[axis * 2] = pos
+    return tuple(box1), tuple(box2)
+
+
+def box_size(box):
+    """Number of histogram cells in a box."""
+    r0, r1, g0, g1, b0, b1 = box
+    return (r1 - r0) * (g1 - g0) * (b1 - b0)
+
+
+def quantize(data, color_count):
+    """Quantize packed RGB bytes to at most color_count colors,
+    most common first."""
+    with instrument.timer("backend", "wu") as event:
+        mom = Moments(data)
+        boxes = [(0, SIDE - 1, 0, SIDE - 1, 0, SIDE - 1)]
+        variances = [variance(boxes[0], mom)]
+
+        while len(boxes) < color_count:
+            # Always split the box with the largest variance.
+            worst = max(range(len(boxes)), key=variances.__getitem__)
+            if variances[worst] <= 0:
+                break
+
+            halves = cut(boxes[worst], mom)
+            if not halves:
+                variances[worst] = 0.0
+                continue
+
+            boxes[worst] = halves[0]
+            boxes.append(halves[1])
+            variances[worst] = (
+                variance(halves[0], mom) if box_size(halves[0]) > 1 else 0.0
+            )
+            variances.append(
+                variance(halves[1], mom) if box_size(halves[1]) > 1 else 0.0
+            )
+
+        palette = []
+        for box in boxes:
+            weight = volume(box, mom.wt)
+            if weight:
+                palette.append(
+                    (
+                        weight,
+                        [
+                            int(volume(box, m) / weight + 0.5)
+                            for m in (mom.mr, mom.mg, mom.mb)
+                        ],
+                    )
+                )
+
+        event["colors"] = len(palette)
+
+    palette.sort(key=lambda col: col[0], reverse=True)
+    return [color for _, color in palette]
+
+
+def gen_colors(img, samples=None):
+    """Generate 8 colors with the Wu quantizer."""
+    count, budget = samples or (0, None)
+    raw_colors = quantize(pixels.load(img, samples=count, budget=budget), 8)
+
+    if not raw_colors:
+        raise registry.BackendError("Wu couldn't generate a palette.")
+
+    while len(raw_colors) < 8:
+        raw_colors.extend(raw_colors)
+
+    return [util.rgb_to_hex(color) for color in raw_colors[:8]]
+
+
+def adjust(cols, light, **kwargs):
+    """Create palette.
+    :keyword-args:
+    -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
+    """
+    if "c16" in kwargs:
+        cols16 = kwargs["c16"]
+    else:
+        cols16 = False
+    cols.sort(key=util.rgb_to_yiq)
+    raw_colors = [*cols, *cols]
+    raw_colors[0] = util.darken_color(cols[0], 0.80)
+
+    return colors.generic_adjust(raw_colors, light, c16=cols16)
+
+
+def get(img, light=False, **kwargs):
+    """Get colorscheme.
+    :keyword-args:
+    -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
+    -    samples: (count, ms) pixels to sample, see pixels.sample()
+    """
+    if "c16" in kwargs:
+        cols16 = kwargs["c16"]
+    else:
+        cols16 = False
+    cols = gen_colors(img, kwargs.get("samples"))
+    return adjust(cols, light, c16=cols16)
@@ -0,0 +1,673 @@
+"""
+Benchmark the color backends.
+
+    python -m pywal.bench [--backends wal,colorz] [--sizes 360p,1080p]
+
+A deterministic corpus of synthetic images is generated once, then
+every backend runs on every image in a fresh process so that wall time,
+peak memory and spawned processes can be attributed to it. The results
+are written as json, pass two result files to --compare to diff them.
+
+    python -m pywal.bench --fingerprints [--fingerprint-size 512]
+
+times the image fingerprint algorithms on a large image instead.
+
+    python -m pywal.bench --scheme-formats [--entries 10000]
+
+times loading cached colorschemes in each storage format.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+try:
+    import resource
+
+except ImportError:
+    resource = None
+
+from .settings import __version__, CACHE_DIR
+from . import codec
+from . import colors
+from . import instrument
+from . import registry
+from . import runner
+from . import theme
+from . import util
+
+
+SIZES = {
+    "360p": (640, 360),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+KINDS = ("gradient", "noise", "flat")
+SEED = 1337
+
+FLAT_COLORS = [
+    (32, 36, 48),
+    (200, 80, 60),
+    (60, 140, 90),
+    (230, 200, 120),
+    (40, 90, 170),
+    (150, 60, 150),
+    (220, 220, 230),
+    (20, 20, 20),
+]
+
+
+def gradient_rows(width, height):
+    """Red left to right, green top to bottom, blue right to left."""
+    red = bytes(x * 255 // max(width - 1, 1) for x in range(width))
+    row = bytearray(width * 3)
+    row[0::3] = red
+    row[2::3] = red[::-1]
+
+    for y in range(height):
+        row[1::3] = bytes([y * 255 // max(height - 1, 1)]) * width
+        yield bytes(row)
+
+
+def noise_rows(width, height):
+    """Seeded uniform noise."""
+    rand = random.Random(SEED + width * height)
+
+    for _ in range(height):
+        yield rand.randbytes(width * 3)
+
+
+def flat_rows(width, height):
+    """Eight flat regions and a small accent square in the middle."""
+    def band_row(cols):
+        row = bytearray()
+        for i, col in enumerate(cols):
+            row += bytes(col) * ((i + 1) * width // 4 - i * width // 4)
+        return row
+
+    top = band_row(FLAT_COLORS[:4])
+    bottom = band_row(FLAT_COLORS[4:])
+    size = max(width // 50, 1)
+    accent = bytes((250, 20, 200)) * size
+    accent_x = (width - size) // 2 * 3
+    accent_y = (height - size) // 2
+
+    for y in range(height):
+        row = bytearray(top if y < height // 2 else bottom)
+        if accent_y <= y < accent_y + size:
+            row[accent_x:accent_x + size * 3] = accent
+        yield bytes(row)
+
+
+GENERATORS = {
+    "gradient": gradient_rows,
+    "noise": noise_rows,
+    "flat": flat_rows,
+}
+
+
+def png_chunk(kind, data):
+    """Pack a PNG chunk."""
+    return b"".join(
+        (
+            struct.pack(">I", len(data)),
+            kind,
+            data,
+            struct.pack(">I", zlib.crc32(kind + data)),
+        )
+    )
+
+
+def write_png(path, width, height, rows, level=6):
+    """Write 8 bit RGB rows to a PNG file without holding the image
+    in memory."""
+    compressor = zlib.compressobj(level)
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    buf = b""
+
+    with open(path, "wb") as png:
+        png.write(b"\x89PNG\r\n\x1a\n")
+        png.write(png_chunk(b"IHDR", ihdr))
+
+        for row in rows:
+            buf += compressor.compress(b"\x00" + row)
+            if len(buf) >= 1 << 16:
+                png.write(png_chunk(b"IDAT", buf))
+                buf = b""
+
+        png.write(png_chunk(b"IDAT", buf + compressor.flush()))
+        png.write(png_chunk(b"IEND", b""))
+
+
+def corpus(corpus_dir, sizes=SIZES, kinds=KINDS):
+    """Generate the benchmark images, existing files are reused."""
+    util.create_dir(corpus_dir)
+    images = []
+
+    for size in sizes:
+        width, height = SIZES[size]
+
+        for kind in kinds:
+            name = "%s-%s.png" % (kind, size)
+            path = os.path.join(corpus_dir, name)
+
+            if not os.path.isfile(path):
+                logging.info("Generating %s.", name)
+                tmp_path = path + ".tmp"
+                write_png(
+                    tmp_path, width, height, GENERATORS[kind](width, height)
+                )
+                os.replace(tmp_path, path)
+
+            images.append(
+                {
+                    "name": name,
+                    "path": path,
+                    "kind": kind,
+                    "width": width,
+                    "height": height,
+                    "bytes": os.path.getsize(path),
+                }
+            )
+
+    return images
+
+
+def large_image(corpus_dir, size_mib):
+    """Generate a binary PPM of noise of about size_mib MiB."""
+    width = 8192
+    height = max(size_mib * 1024**2 // (width * 3), 1)
+    path = os.path.join(corpus_dir, "noise-%sMiB.ppm" % size_mib)
+
+    if not os.path.isfile(path):
+        logging.info("Generating %s.", os.path.basename(path))
+        util.create_dir(corpus_dir)
+        rng = random.Random(SEED)
+
+        with open(path + ".tmp", "wb") as ppm:
+            ppm.write(b"P6 %d %d 255\n" % (width, height))
+            for _ in range(height):
+                ppm.write(rng.randbytes(width * 3))
+
+        os.replace(path + ".tmp", path)
+
+    return path
+
+
+def fingerprints(img, repeat=3):
+    """Time every fingerprint algorithm on img, best of repeat runs.
+    The first run warms the page cache so disk speed doesn't count."""
+    size = os.path.getsize(img)
+    results = []
+
+    for name, fingerprint in util.FINGERPRINTS.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fingerprint(img)
+            times.append(time.perf_counter() - start)
+
+        best = min(times)
+        results.append(
+            {
+                "algorithm": name,
+                "bytes": size,
+                "time": best,
+                "mib_per_second": size / 1024**2 / best if best else None,
+            }
+        )
+
+    return results
+
+
+def report_fingerprints(results):
+    """Print a summary table of the fingerprint timings."""
+    print("%-10s %12s %10s %10s" % ("algorithm", "size (MiB)", "time (s)",
+                                    "MiB/s"))
+
+    for result in results:
+        print(
+            "%-10s %12.1f %10.4f %10.0f"
+            % (
+                result["algorithm"],
+                result["bytes"] / 1024**2,
+                result["time"],
+                result["mib_per_second"] or 0,
+            )
+        )
+
+
+def scheme_formats(entries=10000, repeat=3):
+    """Time decoding entries cached colorschemes in each format, best
+    of repeat runs. "json-indent" is the pretty-printed json files read
+    through theme.normalize of versions before the scheme store."""
+    rng = random.Random(0)
+    schemes = []
+
+    for i in range(entries):
+        palette = ["#%06x" % rng.getrandbits(24) for _ in range(16)]
+        schemes.append(
+            {
+                "checksum": "%032x" % rng.getrandbits(128),
+                "wallpaper": "/home/user/wallpapers/%s.jpg" % i,
+                "alpha": "100",
+                "special": {
+                    "background": palette[0],
+                    "foreground": palette[15],
+                    "cursor": palette[15],
+                },
+                "colors": {
+                    "color%s" % n: color for n, color in enumerate(palette)
+                },
+            }
+        )
+
+    alpha = util.Color.alpha_num
+    formats = {
+        "json-indent": (
+            lambda scheme: json.dumps(scheme, indent=4),
+            lambda data: theme.normalize(json.loads(data)),
+        ),
+        "json": (lambda scheme: codec.encode(scheme, "json"), codec.decode),
+        "binary": (lambda scheme: codec.encode(scheme, "binary"),
+                   codec.decode),
+    }
+    results = []
+
+    for name, (encode, decode) in formats.items():
+        data = [encode(scheme) for scheme in schemes]
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for entry in data:
+                decode(entry)
+            times.append(time.perf_counter() - start)
+
+        best = min(times)
+        results.append(
+            {
+                "format": name,
+                "entries": entries,
+                "bytes": sum(len(entry) for entry in data),
+                "time": best,
+                "us_per_entry": best / entries * 1e6,
+            }
+        )
+
+    util.Color.alpha_num = alpha
+    return results
+
+
+def report_scheme_formats(results):
+    """Print a summary table of the scheme format timings."""
+    print("%-12s %10s %12s %10s %10s" % ("format", "entries", "size (KiB)",
+                                         "time (s)", "us/entry"))
+
+    for result in results:
+        print(
+            "%-12s %10d %12.1f %10.4f %10.2f"
+            % (
+                result["format"],
+                result["entries"],
+                result["bytes"] / 1024,
+                result["time"],
+                result["us_per_entry"],
+            )
+        )
+
+
+def peak_rss():
+    """Peak resident memory in KiB of this process and of its
+    largest child."""
+    if not resource:
+        return None, None
+
+    scale = 1024 if sys.platform == "darwin" else 1
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+    child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+    return own, child
+
+
+def quality(colors):
+    """Score a 16 color palette."""
+    return {
+        "distinctness": util.palette_distinctness(colors),
+        "contrast": util.palette_contrast(colors),
+        "score": util.palette_score(colors),
+    }
+
+
+def measure(backend, img):
+    """Run a backend once, meant to run in a fresh process."""
+    spawned = [0]
+    phases = {}
+
+    class CountingPopen(subprocess.Popen):
+        """Popen that counts the processes the backend starts."""
+
+        def __init__(self, *args, **kwargs):
+            spawned[0] += 1
+            super().__init__(*args, **kwargs)
+
+    subprocess.Popen = CountingPopen
+    # Measure the commands, not their memoized output.
+    runner.MEMO = False
+
+    def end_phase(name, start, start_spawned, skip=0.0):
+        rss, child_rss = peak_rss()
+        phases[name] = {
+            "time": time.perf_counter() - start - skip,
+            "subprocesses": spawned[0] - start_spawned,
+            "peak_rss_kib": rss,
+            "peak_child_rss_kib": child_rss,
+        }
+
+    try:
+        start = time.perf_counter()
+        module = registry.load(backend)
+        end_phase("import", start, 0)
+
+        # Time gen_colors() on its own, the rest of get() is the
+        # backend specific adjustment.
+        extract = {"time": 0.0, "subprocesses": 0}
+        gen_colors = getattr(module, "gen_colors", None)
+
+        if gen_colors:
+            def timed_gen_colors(*args, **kwargs):
+                gen_start = time.perf_counter()
+                gen_spawned = spawned[0]
+                try:
+                    return gen_colors(*args, **kwargs)
+                finally:
+                    extract["time"] += time.perf_counter() - gen_start
+                    extract["subprocesses"] += spawned[0] - gen_spawned
+
+            module.gen_colors = timed_gen_colors
+
+        start = time.perf_counter()
+        start_spawned = spawned[0]
+        colors = module.get(img, False)[:16]
+        phases["extract"] = extract
+        end_phase("adjust", start, start_spawned, extract["time"])
+        phases["adjust"]["subprocesses"] -= extract["subprocesses"]
+        # Peak memory is a high water mark, it can't be split further.
+        phases["extract"]["peak_rss_kib"] = phases["adjust"]["peak_rss_kib"]
+        phases["extract"]["peak_child_rss_kib"] = phases["adjust"][
+            "peak_child_rss_kib"
+        ]
+
+    except BaseException as err:  # backends sys.exit() on failure
+        return {"error": repr(err), "phases": phases}
+
+    return {
+        "phases": phases,
+        "time": sum(phase["time"] for phase in phases.values()),
+        "subprocesses": spawned[0],
+        "events": instrument.events(),
+        "colors": colors,
+        "quality": quality(colors),
+    }
+
+
+def run(backends, images, timeout=300):
+    """Benchmark every backend on every image."""
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+
+    for backend in backends:
+        for img in images:
+            logging.info("Running %s on %s.", backend, img["name"])
+
+            with ctx.Pool(1) as pool:
+                job = pool.apply_async(measure, (backend, img["path"]))
+                try:
+                    result = job.get(timeout)
+                except multiprocessing.TimeoutError:
+                    result = {"error": "timeout after %ss" % timeout}
+
+            result.update(backend=backend, image=img["name"])
+            results.append(result)
+
+    return results
+
+
+def report(results):
+    """Print a summary table."""
+    print(
+        "%-18s %-18s %9s %9s %6s %6s"
+        % ("backend", "image", "time (s)", "rss (KiB)", "procs", "score")
+    )
+
+    for result in results:
+        if "error" in result:
+            print(
+                "%-18s %-18s %s"
+                % (result["backend"], result["image"], result["error"])
+            )
+            continue
+
+        print(
+            "%-18s %-18s %9.3f %9s %6s %6.3f"
+            % (
+                result["backend"],
+                result["image"],
+                result["time"],
+                result["phases"]["adjust"]["peak_rss_kib"],
+                result["subprocesses"],
+                result["quality"]["score"],
+            )
+        )
+
+
+def compare(old_file, new_file):
+    """Print time and score changes between two result files."""
+    old = util.read_file_json(old_file)
+    new = util.read_file_json(new_file)
+    old_results = {
+        (res["backend"], res["image"]): res
+        for res in old["results"]
+        if "error" not in res
+    }
+
+    print("%s -> %s" % (old["pywal"], new["pywal"]))
+    print("%-18s %-18s %9s %8s" % ("backend", "image", "time", "score"))
+
+    for result in new["results"]:
+        before = old_results.get((result["backend"], result["image"]))
+        if not before or "error" in result:
+            continue
+
+        print(
+            "%-18s %-18s %8.0f%% %+8.3f"
+            % (
+                result["backend"],
+                result["image"],
+                100 * result["time"] / max(before["time"], 1e-9),
+                result["quality"]["score"] - before["quality"]["score"],
+            )
+        )
+
+
+def get_args():
+    """Get the script arguments."""
+    arg = argparse.ArgumentParser(
+        prog="python -m pywal.bench",
+        description="Benchmark the wal color backends.",
+    )
+
+    arg.add_argument(
+        "--backends",
+        metavar="wal,colorz",
+        help="Comma separated backends to run, default: all installed.",
+    )
+
+    arg.add_argument(
+        "--sizes",
+        metavar=",".join(SIZES),
+        default=",".join(SIZES),
+        help="Comma separated image sizes to generate.",
+    )
+
+    arg.add_argument(
+        "--kinds",
+        metavar=",".join(KINDS),
+        default=",".join(KINDS),
+        help="Comma separated image kinds to generate.",
+    )
+
+    arg.add_argument(
+        "--corpus",
+        metavar="dir",
+        default=os.path.join(CACHE_DIR, "bench"),
+        help="Where to store the generated images.",
+    )
+
+    arg.add_argument(
+        "--output",
+        metavar="file.json",
+        default="bench-%s.json" % __version__,
+        help="Where to write the results.",
+    )
+
+    arg.add_argument(
+        "--timeout",
+        metavar="seconds",
+        type=int,
+        default=300,
+        help="Give up on a backend run after this long.",
+    )
+
+    arg.add_argument(
+        "--record",
+        action="store_true",
+        help="Add the results to the history 'wal --backend auto' "
+        "picks backends from.",
+    )
+
+    arg.add_argument(
+        "--fingerprints",
+        action="store_true",
+        help="Time the image fingerprint algorithms instead.",
+    )
+
+    arg.add_argument(
+        "--fingerprint-size",
+        metavar="MiB",
+        type=int,
+        default=512,
+        help="Size of the image the fingerprints are timed on.",
+    )
+
+    arg.add_argument(
+        "--scheme-formats",
+        action="store_true",
+        help="Time loading cached colorschemes in each format instead.",
+    )
+
+    arg.add_argument(
+        "--entries",
+        metavar="N",
+        type=int,
+        default=10000,
+        help="Colorschemes --scheme-formats loads.",
+    )
+
+    arg.add_argument(
+        "--compare",
+        metavar=("old.json", "new.json"),
+        nargs=2,
+        help="Compare two result files and exit.",
+    )
+
+    return arg
+
+
+def main():
+    """Benchmark script function."""
+    util.setup_logging()
+    args = get_args().parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.fingerprints:
+        img = large_image(args.corpus, args.fingerprint_size)
+        results = fingerprints(img)
+        util.save_file_json(
+            {
+                "pywal": __version__,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "fingerprints": results,
+            },
+            os.path.abspath(args.output),
+        )
+        report_fingerprints(results)
+        logging.info("Results written to %s.", args.output)
+        return
+
+    if args.scheme_formats:
+        results = scheme_formats(args.entries)
+        util.save_file_json(
+            {
+                "pywal": __version__,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "scheme_formats": results,
+            },
+            os.path.abspath(args.output),
+        )
+        report_scheme_formats(results)
+        logging.info("Results written to %s.", args.output)
+        return
+
+    backends = (
+        args.backends.split(",") if args.backends else registry.available()
+    )
+    images = corpus(args.corpus, args.sizes.split(","), args.kinds.split(","))
+    results = run(backends, images, args.timeout)
+
+    util.save_file_json(
+        {
+            "pywal": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "corpus": images,
+            "results": results,
+        },
+        os.path.abspath(args.output),
+    )
+
+    if args.record:
+        paths = {img["name"]: img["path"] for img in images}
+        for result in results:
+            if "error" not in result:
+                colors.record_backend_run(
+                    result["backend"],
+                    paths[result["image"]],
+                    result["phases"]["extract"]["time"]
+                    + result["phases"]["adjust"]["time"],
+                    result["colors"],
+                )
+
+    report(results)
+    logging.info("Results written to %s.", args.output)
+
+
+if __name__ == "__main__":
+    main()
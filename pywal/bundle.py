@@ -0,0 +1,241 @@
+"""
+Share cached colorschemes between machines.
+
+'wal --cache-export bundle.tar' packs the store into a tar bundle that
+'wal --cache-import' merges into the store of another machine, the
+schemes are keyed by content so they hit for the same images wherever
+they are.
+"""
+
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tarfile
+import time
+
+from .settings import CACHE_DIR, __cache_version__, __version__
+from . import cache
+from . import codec
+from . import util
+
+
+VERSION = 1
+# Compression of bundles by file extension, plain tar otherwise.
+COMPRESSION = {".gz": "gz", ".tgz": "gz", ".bz2": "bz2", ".xz": "xz"}
+
+
+def valid_checksum(checksum):
+    """Check that a checksum looks like one of our fingerprints."""
+    algorithm = util.checksum_algorithm(checksum)
+    digest = str(checksum).rpartition(":")[2]
+
+    return (
+        algorithm in util.FINGERPRINTS
+        and re.fullmatch("[0-9a-f]{16,128}", digest) is not None
+    )
+
+
+def valid_scheme(scheme):
+    """Check that a colorscheme has the 16 colors and the special ones,
+    all of them "#rrggbb"."""
+    cols = scheme["colors"]
+    special = scheme["special"]
+
+    return (
+        set(cols) == set(codec.COLORS)
+        and set(special) >= set(codec.SPECIAL)
+        and all(
+            isinstance(col, str) and codec.HEX_COLOR.fullmatch(col.lower())
+            for col in (*cols.values(), *special.values())
+        )
+    )
+
+
+def valid_number(value):
+    """Check that a value is a JSON number."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def normalize_options(options):
+    """options_key() of the options of an imported colorscheme, None
+    when they aren't the options of one."""
+    try:
+        backend, color_type, sat, c16, cst, samples = json.loads(options)
+    except (TypeError, ValueError):
+        return None
+
+    if (
+        not isinstance(backend, str)
+        or color_type not in ("light", "dark")
+        or not all(valid_number(num) or num == "" for num in (sat, cst))
+        or c16 not in (False, "lighten", "darken")
+        or not valid_number(samples)
+        or samples < 0
+    ):
+        return None
+
+    return cache.options_key(backend, color_type == "light", sat, c16, cst,
+                             int(samples))
+
+
+def tar_mode(bundle):
+    """tarfile mode to write a bundle file name with."""
+    ext = os.path.splitext(bundle)[1].lower()
+    compression = COMPRESSION.get(ext)
+    return "w:%s" % compression if compression else "w"
+
+
+def export(bundle, cache_dir=CACHE_DIR):
+    """Write the cached colorschemes of this version to a tar bundle,
+    a manifest.json and the schemes as json in schemes.json.
+    Returns how many schemes were exported, OSError when the bundle
+    can't be written."""
+    conn = cache.connect(cache_dir)
+    rows = conn.execute(
+        "SELECT checksum, options, scheme, created, last_hit FROM schemes "
+        "WHERE version = ? ORDER BY checksum, options",
+        (__cache_version__,),
+    )
+    schemes = [
+        {
+            "checksum": checksum,
+            "options": options,
+            "scheme": codec.decode(data),
+            "created": created,
+            "last_hit": last_hit,
+        }
+        for checksum, options, data, created, last_hit in rows
+    ]
+
+    data = json.dumps(schemes, separators=(",", ":")).encode()
+    manifest = {
+        "bundle": VERSION,
+        "pywal": __version__,
+        "cache_version": __cache_version__,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "entries": len(schemes),
+        "algorithms": sorted(
+            {util.checksum_algorithm(s["checksum"]) for s in schemes}
+        ),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+    members = [
+        ("manifest.json", json.dumps(manifest, indent=4).encode()),
+        ("schemes.json", data),
+    ]
+
+    try:
+        with tarfile.open(bundle + ".tmp", tar_mode(bundle)) as tar:
+            for name, content in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(content))
+
+        os.replace(bundle + ".tmp", bundle)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(bundle + ".tmp")
+        raise
+
+    return len(schemes)
+
+
+def read(bundle):
+    """Manifest and schemes of a bundle, ValueError if it isn't one of
+    ours or was corrupted. Nothing is extracted to the disk."""
+    try:
+        with tarfile.open(bundle) as tar:
+            manifest = json.load(tar.extractfile("manifest.json"))
+            data = tar.extractfile("schemes.json").read()
+    except (tarfile.ReadError, KeyError, AttributeError):
+        raise ValueError("not a wal cache bundle") from None
+
+    if not isinstance(manifest, dict):
+        raise ValueError("not a wal cache bundle")
+
+    if manifest.get("bundle") != VERSION:
+        raise ValueError("unsupported bundle version")
+
+    if hashlib.sha256(data).hexdigest() != manifest.get("sha256"):
+        raise ValueError("schemes.json doesn't match the manifest")
+
+    return manifest, json.loads(data)
+
+
+def merge(bundle, cache_dir=CACHE_DIR):
+    """Merge the colorschemes of a bundle into the store, existing ones
+    are kept. Schemes whose checksum isn't a fingerprint we know, whose
+    options aren't an options_key() or whose colors aren't all
+    "#rrggbb" are skipped, paths are only
+    recorded for images that exist here with the same fingerprint.
+    Returns the counts of imported, existing and rejected schemes."""
+    manifest, schemes = read(bundle)
+    counts = {"imported": 0, "existing": 0, "rejected": 0}
+
+    if manifest.get("cache_version") != __cache_version__:
+        logging.warning(
+            "Bundle cache version %s isn't %s, nothing to import.",
+            manifest.get("cache_version"),
+            __cache_version__,
+        )
+        counts["rejected"] = len(schemes)
+        return counts
+
+    conn = cache.connect(cache_dir)
+    now = time.time()
+
+    with conn:
+        for entry in schemes:
+            try:
+                checksum = entry["checksum"]
+                options = normalize_options(entry["options"])
+                scheme = entry["scheme"]
+                created = entry.get("created", now)
+                last_hit = entry.get("last_hit", now)
+                valid = (
+                    valid_checksum(checksum)
+                    and scheme["checksum"] == checksum
+                    and options is not None
+                    and valid_scheme(scheme)
+                    and valid_number(created)
+                    and valid_number(last_hit)
+                )
+            except (KeyError, TypeError, AttributeError):
+                valid = False
+
+            if not valid:
+                counts["rejected"] += 1
+                continue
+
+            data = codec.encode(scheme)
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO schemes "
+                "(checksum, options, version, scheme, size, created, "
+                "last_hit) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    checksum,
+                    options,
+                    __cache_version__,
+                    data,
+                    len(data),
+                    created,
+                    last_hit,
+                ),
+            )
+            counts["imported" if cursor.rowcount else "existing"] += 1
+
+            img = scheme.get("wallpaper")
+            if (
+                isinstance(img, str)
+                and os.path.isfile(img)
+                and util.check_img_checksum(img, checksum, cache_dir)
+            ):
+                cache.seen(conn, img, checksum, now)
+
+    return counts
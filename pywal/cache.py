@@ -0,0 +1,857 @@
+"""
+Colorscheme cache.
+
+Generated colorschemes are kept in a single SQLite database,
+CACHE_DIR/schemes.db, keyed by the image checksum and the options they
+were generated with. Paths are only kept as metadata so renamed, moved
+and copied images still hit the cache and edited ones miss it.
+
+The store is bounded by PYWAL_CACHE_MAX_ENTRIES, PYWAL_CACHE_MAX_SIZE
+(MiB) and PYWAL_CACHE_MAX_AGE (days since the last hit), 0 disables a
+limit. The least recently used schemes are evicted a few at a time at
+the end of every run, 'wal --cache-gc' evicts all of them at once.
+
+Schemes are stored packed in a fixed binary layout, see codec.py.
+'wal --cache-export' and 'wal --cache-import' share the store between
+machines, see bundle.py.
+
+Every lookup is counted by option set as a hit or a miss with its
+reason and backend run times are kept as histograms, 'wal --cache-stats'
+reports them.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import sqlite3
+import time
+
+try:
+    import fcntl
+
+except ImportError:
+    fcntl = None
+
+from .settings import CACHE_DIR, __cache_version__
+from . import codec
+from . import registry
+from . import runner
+from . import util
+
+
+DB_NAME = "schemes.db"
+
+MAX_ENTRIES = int(os.getenv("PYWAL_CACHE_MAX_ENTRIES", 100000))
+MAX_SIZE = int(os.getenv("PYWAL_CACHE_MAX_SIZE", 256)) * 1024**2
+MAX_AGE = int(os.getenv("PYWAL_CACHE_MAX_AGE", 365)) * 86400
+# Schemes evicted at most at the end of a run.
+EVICT_BATCH = 64
+
+# Palette snapshots of directories (see similar.py), the least recently
+# used ones are evicted past SNAPSHOT_MAX_SIZE bytes.
+SNAPSHOT_DIR = "palettes"
+SNAPSHOT_MAX_SIZE = 64 * 1024**2
+
+# Seconds to wait for another wal generating the same scheme.
+LOCK_TIMEOUT = 120
+# Seconds after which a held lock is considered abandoned.
+LOCK_STALE = 600
+LOCK_POLL = 0.05
+
+# Why a lookup missed: no scheme for the image and options, the image
+# changed since it was cached or the scheme was made by an older wal.
+MISS_REASONS = {
+    "no_entry": "no entry",
+    "checksum": "checksum mismatch",
+    "version": "version bump",
+}
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE schemes (
+    checksum TEXT NOT NULL,
+    options TEXT NOT NULL,
+    version TEXT NOT NULL,
+    scheme TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL DEFAULT 0,
+    last_hit REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (checksum, options)
+) WITHOUT ROWID;
+CREATE INDEX schemes_last_hit ON schemes (last_hit);
+CREATE TABLE paths (
+    path TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    last_seen REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX paths_checksum ON paths (checksum);
+CREATE TABLE stats (
+    options TEXT NOT NULL,
+    event TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (options, event)
+) WITHOUT ROWID;
+CREATE TABLE latency (
+    backend TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (backend, bucket)
+) WITHOUT ROWID;
+CREATE TABLE palettes (
+    checksum TEXT NOT NULL,
+    options TEXT NOT NULL,
+    features BLOB NOT NULL,
+    PRIMARY KEY (options, checksum)
+) WITHOUT ROWID;
+CREATE INDEX schemes_options ON schemes (options, version);
+CREATE TABLE generation (value INTEGER NOT NULL);
+INSERT INTO generation VALUES (0);
+"""
+
+_CONNECTIONS = {}
+
+
+def number(value):
+    """Normalize a numeric option, "" when unset."""
+    if value in (None, "", False):
+        return ""
+
+    try:
+        return float(value)
+    except ValueError:
+        return str(value)
+
+
+def options_key(backend, light, sat="", c16=False, cst="", samples=0):
+    """Normalized form of the options a colorscheme depends on, samples
+    only counts for the backends that sample pixels."""
+    entry = registry.get(backend)
+    if entry and not entry.pixels:
+        samples = 0
+
+    return json.dumps(
+        [
+            str(backend),
+            "light" if light else "dark",
+            number(sat),
+            c16 or False,
+            number(cst),
+            samples or 0,
+        ],
+        separators=(",", ":"),
+    )
+
+
+def connect(cache_dir=CACHE_DIR):
+    """Open the scheme store, it is created and the colorschemes of
+    older versions are migrated the first time."""
+    db_file = os.path.join(cache_dir, DB_NAME)
+
+    if db_file not in _CONNECTIONS:
+        util.create_dir(cache_dir)
+        new = not os.path.isfile(db_file)
+
+        conn = sqlite3.connect(db_file, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        create(conn)
+        _CONNECTIONS[db_file] = conn
+
+        if new:
+            migrate(conn, cache_dir)
+
+    return _CONNECTIONS[db_file]
+
+
+def create(conn):
+    """Create the tables the first time the store is opened."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        return
+
+    # Other processes may be creating the store at the same time, look
+    # again once holding the write lock.
+    conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+
+        # executescript() would commit and let go of the lock.
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+
+        conn.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+
+def close(cache_dir=CACHE_DIR):
+    """Close the scheme store."""
+    conn = _CONNECTIONS.pop(os.path.join(cache_dir, DB_NAME), None)
+    if conn:
+        conn.close()
+
+
+def clear(cache_dir=CACHE_DIR):
+    """Delete every cached colorscheme."""
+    close(cache_dir)
+    shutil.rmtree(os.path.join(cache_dir, SNAPSHOT_DIR), ignore_errors=True)
+
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(os.path.join(cache_dir, DB_NAME + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def lookup(conn, checksum, options):
+    """Stored scheme of an image checksum, None on a miss."""
+    row = conn.execute(
+        "SELECT scheme FROM schemes "
+        "WHERE checksum = ? AND options = ? AND version = ?",
+        (checksum, options, __cache_version__),
+    ).fetchone()
+
+    return row[0] if row else None
+
+
+def generation(conn):
+    """Counter bumped whenever the paths or palettes of the store
+    change, for the caches built from them."""
+    return conn.execute("SELECT value FROM generation").fetchone()[0]
+
+
+def bump(conn):
+    """Bump the store generation."""
+    conn.execute("UPDATE generation SET value = value + 1")
+
+
+def seen(conn, img, checksum, now):
+    """Remember where an image with checksum was last found."""
+    path = os.path.abspath(img)
+    row = conn.execute(
+        "SELECT checksum FROM paths WHERE path = ?", (path,)
+    ).fetchone()
+
+    if not row or row[0] != checksum:
+        bump(conn)
+
+    conn.execute(
+        "INSERT OR REPLACE INTO paths VALUES (?, ?, ?)",
+        (path, checksum, now),
+    )
+
+
+def count(conn, options, event):
+    """Add one to the count of a lookup event of an option set."""
+    conn.execute(
+        "INSERT INTO stats VALUES (?, ?, 1) "
+        "ON CONFLICT DO UPDATE SET count = count + 1",
+        (options, event),
+    )
+
+
+def get(img, options, cache_dir=CACHE_DIR, record=True):
+    """Cached colorscheme of img, None on a miss.
+
+    The "wallpaper" of the scheme is the path it was generated for,
+    which may be a copy of img or where img was before a rename.
+    The hit or miss is counted in the stats unless record is False."""
+    conn = connect(cache_dir)
+    checksum = util.get_img_checksum(img, cache_dir)
+    data = lookup(conn, checksum, options)
+    known = None
+
+    if data is None:
+        # The path may have been cached with another fingerprint
+        # algorithm, check the image with that one.
+        known = conn.execute(
+            "SELECT checksum FROM paths WHERE path = ?",
+            (os.path.abspath(img),),
+        ).fetchone()
+
+        if (
+            known
+            and known[0] != checksum
+            and util.check_img_checksum(img, known[0], cache_dir)
+        ):
+            checksum = known[0]
+            data = lookup(conn, checksum, options)
+
+    if data is None:
+        if record:
+            with conn:
+                count(conn, options, miss_reason(conn, checksum, known))
+        return None
+
+    now = time.time()
+    with conn:
+        conn.execute(
+            "UPDATE schemes SET last_hit = ? "
+            "WHERE checksum = ? AND options = ?",
+            (now, checksum, options),
+        )
+        seen(conn, img, checksum, now)
+
+        if record:
+            count(conn, options, "hit")
+
+    return codec.decode(data)
+
+
+def miss_reason(conn, checksum, known):
+    """Reason of a miss, known is the paths row of the image."""
+    old = conn.execute(
+        "SELECT 1 FROM schemes WHERE checksum = ? AND version != ?",
+        (checksum, __cache_version__),
+    ).fetchone()
+
+    if old:
+        return "version"
+
+    if known and known[0] != checksum:
+        return "checksum"
+
+    return "no_entry"
+
+
+def record_latency(backend, seconds, cache_dir=CACHE_DIR):
+    """Add a backend run to its histogram, bucket n holds the runs that
+    took up to 2**n milliseconds."""
+    bucket = max(math.ceil(math.log2(max(seconds * 1000, 1))), 0)
+    conn = connect(cache_dir)
+
+    with conn:
+        conn.execute(
+            "INSERT INTO latency VALUES (?, ?, 1, ?) "
+            "ON CONFLICT DO UPDATE SET count = count + 1, "
+            "total = total + excluded.total",
+            (str(backend), bucket, seconds),
+        )
+
+
+def percentile(buckets, share):
+    """Upper bound in milliseconds of the bucket a share of the runs
+    of a {bucket: count} histogram fall in."""
+    total = sum(buckets.values())
+    seen_runs = 0
+
+    for bucket in sorted(buckets):
+        seen_runs += buckets[bucket]
+        if seen_runs >= total * share:
+            return 2**bucket
+
+    return 0
+
+
+def describe(options):
+    """Short description of an options_key()."""
+    backend, color_type, sat, c16, cst, samples = json.loads(options)
+    parts = [backend, color_type]
+
+    for name, value in (("sat", sat), ("16", c16), ("cst", cst),
+                        ("samples", samples)):
+        if value:
+            parts.append("%s=%s" % (name, value))
+
+    return " ".join(parts)
+
+
+def stats(cache_dir=CACHE_DIR):
+    """Hit rates, entries and sizes by option set and the backend run
+    time histograms of the store."""
+    conn = connect(cache_dir)
+    by_options = {}
+
+    def options_stats(options):
+        return by_options.setdefault(
+            options,
+            {"hit": 0, **dict.fromkeys(MISS_REASONS, 0), "entries": 0,
+             "bytes": 0},
+        )
+
+    for options, event, num in conn.execute("SELECT * FROM stats"):
+        options_stats(options)[event] = num
+
+    for options, entries, size in conn.execute(
+        "SELECT options, count(*), sum(size) FROM schemes GROUP BY options"
+    ):
+        options_stats(options).update(entries=entries, bytes=size)
+
+    latency = {}
+    for backend, bucket, num, total in conn.execute(
+        "SELECT * FROM latency ORDER BY backend, bucket"
+    ):
+        hist = latency.setdefault(
+            backend, {"runs": 0, "seconds": 0.0, "buckets": {}}
+        )
+        hist["runs"] += num
+        hist["seconds"] += total
+        hist["buckets"][bucket] = num
+
+    disk = 0
+    for suffix in ("", "-wal", "-shm"):
+        with contextlib.suppress(OSError):
+            disk += os.path.getsize(os.path.join(cache_dir, DB_NAME + suffix))
+
+    return {"options": by_options, "latency": latency, "disk": disk}
+
+
+def report_stats(cache_dir=CACHE_DIR):
+    """Print the cache stats."""
+    data = stats(cache_dir)
+    rows = data["options"]
+    hits = sum(row["hit"] for row in rows.values())
+    misses = {
+        reason: sum(row[reason] for row in rows.values())
+        for reason in MISS_REASONS
+    }
+    lookups = hits + sum(misses.values())
+
+    print("Lookups:   %s" % lookups)
+    print("Hit rate:  %.1f%%" % (hits / lookups * 100 if lookups else 0))
+    print("Misses:    %s" % ", ".join(
+        "%s %s" % (num, MISS_REASONS[reason])
+        for reason, num in misses.items()
+    ))
+    print("Entries:   %s" % sum(row["entries"] for row in rows.values()))
+    print("Disk:      %.1f KiB" % (data["disk"] / 1024))
+
+    print("\n%-40s %8s %8s %8s %10s" % ("backend, options", "hits",
+                                        "misses", "entries", "size (KiB)"))
+    for options, row in sorted(rows.items()):
+        print(
+            "%-40s %8s %8s %8s %10.1f"
+            % (
+                describe(options),
+                row["hit"],
+                sum(row[reason] for reason in MISS_REASONS),
+                row["entries"],
+                row["bytes"] / 1024,
+            )
+        )
+
+    print("\n%-20s %8s %10s %10s %10s" % ("backend", "runs", "mean (ms)",
+                                          "p50 (ms)", "p90 (ms)"))
+    for backend, hist in data["latency"].items():
+        print(
+            "%-20s %8s %10.0f %10s %10s"
+            % (
+                backend,
+                hist["runs"],
+                hist["seconds"] / hist["runs"] * 1000,
+                "<%s" % percentile(hist["buckets"], 0.5),
+                "<%s" % percentile(hist["buckets"], 0.9),
+            )
+        )
+
+
+def put(img, options, scheme, cache_dir=CACHE_DIR):
+    """Store the colorscheme of img."""
+    conn = connect(cache_dir)
+    data = codec.encode(scheme)
+    now = time.time()
+
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO schemes "
+            "(checksum, options, version, scheme, size, created, "
+            "last_hit) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                scheme["checksum"],
+                options,
+                __cache_version__,
+                data,
+                len(data),
+                now,
+                now,
+            ),
+        )
+        # The palette of a replaced scheme is computed again.
+        if conn.execute(
+            "DELETE FROM palettes WHERE checksum = ? AND options = ?",
+            (scheme["checksum"], options),
+        ).rowcount:
+            bump(conn)
+        seen(conn, img, scheme["checksum"], now)
+
+
+def lock_file(img, options, cache_dir=CACHE_DIR):
+    """Lock file of the cache key of img and options."""
+    key = "%s\n%s" % (util.get_img_checksum(img, cache_dir), options)
+    name = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return os.path.join(cache_dir, "locks", name + ".lock")
+
+
+def lock_stale(path):
+    """Check whether a lock is held by a process that is gone or has
+    held it for longer than LOCK_STALE."""
+    try:
+        with open(path) as file:
+            pid, since = file.read().split()
+        pid, since = int(pid), float(since)
+    except (OSError, ValueError):
+        # Not written yet.
+        return False
+
+    if time.time() - since > LOCK_STALE:
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+
+    return False
+
+
+def acquire(path, timeout=LOCK_TIMEOUT):
+    """Take the lock at path, the file descriptor holding it or None
+    when waiting timed out."""
+    deadline = time.monotonic() + timeout
+
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+
+            if lock_stale(path):
+                logging.warning("Breaking the abandoned lock %s.", path)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                continue
+
+            if time.monotonic() >= deadline:
+                return None
+
+            time.sleep(LOCK_POLL)
+            continue
+
+        # The previous holder removes the file when it's done, a lock
+        # on the removed file doesn't count.
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+
+        os.close(fd)
+
+    os.ftruncate(fd, 0)
+    os.write(fd, b"%d %f" % (os.getpid(), time.time()))
+    return fd
+
+
+@contextlib.contextmanager
+def lock(img, options, cache_dir=CACHE_DIR, timeout=LOCK_TIMEOUT):
+    """Hold the lock of a cache key while its scheme is generated so
+    concurrent runs wait instead of generating it too.
+
+    Yields whether the lock is held, after timeout seconds the caller
+    goes on without it. Without fcntl nothing is locked."""
+    if not util.has_fcntl:
+        yield False
+        return
+
+    path = lock_file(img, options, cache_dir)
+    util.create_dir(os.path.dirname(path))
+    fd = acquire(path, timeout)
+
+    if fd is None:
+        logging.warning(
+            "Another wal is still generating this colorscheme, "
+            "generating it too."
+        )
+        yield False
+        return
+
+    try:
+        yield True
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        os.close(fd)
+
+
+def evict(
+    cache_dir=CACHE_DIR,
+    max_entries=MAX_ENTRIES,
+    max_size=MAX_SIZE,
+    max_age=MAX_AGE,
+    batch=None,
+):
+    """Delete the least recently used schemes until the store is
+    within its limits, at most batch of them (None for no limit).
+    The memoized command outputs and palette snapshots are evicted too.
+    Returns how many schemes were deleted."""
+    runner.evict_memo(cache_dir, max_age=max_age)
+    util.evict_files(
+        os.path.join(cache_dir, SNAPSHOT_DIR), SNAPSHOT_MAX_SIZE, max_age
+    )
+
+    if not os.path.isfile(os.path.join(cache_dir, DB_NAME)):
+        return 0
+
+    conn = connect(cache_dir)
+    entries, size = conn.execute(
+        "SELECT COUNT(*), TOTAL(size) FROM schemes"
+    ).fetchone()
+    oldest = time.time() - max_age if max_age else 0
+    limit = -1 if batch is None else batch
+    doomed = []
+
+    for checksum, options, row_size, last_hit in conn.execute(
+        "SELECT checksum, options, size, last_hit FROM schemes "
+        "ORDER BY last_hit LIMIT ?",
+        (limit,),
+    ):
+        if (
+            last_hit >= oldest
+            and not (max_entries and entries > max_entries)
+            and not (max_size and size > max_size)
+        ):
+            break
+
+        doomed.append((checksum, options))
+        entries -= 1
+        size -= row_size
+
+    with conn:
+        conn.executemany(
+            "DELETE FROM schemes WHERE checksum = ? AND options = ?", doomed
+        )
+        conn.executemany(
+            "DELETE FROM palettes WHERE checksum = ? AND options = ?", doomed
+        )
+        if doomed:
+            bump(conn)
+
+    if doomed:
+        logging.debug("Evicted %s cached colorschemes.", len(doomed))
+
+    return len(doomed)
+
+
+def gc(cache_dir=CACHE_DIR):
+    """Evict every scheme past the limits, forget the paths of images
+    without schemes and compact the store.
+    Returns how many schemes were deleted."""
+    deleted = evict(cache_dir)
+
+    if os.path.isfile(os.path.join(cache_dir, DB_NAME)):
+        conn = connect(cache_dir)
+        with conn:
+            if conn.execute(
+                "DELETE FROM paths WHERE checksum NOT IN "
+                "(SELECT checksum FROM schemes)"
+            ).rowcount:
+                bump(conn)
+        conn.execute("VACUUM")
+
+    return deleted
+
+
+def legacy_fname(img, backend, light, cache_dir, sat="", **kwargs):
+    """File name of a colorscheme cached by older versions.
+    :keyword-args:
+    -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
+    -    cst: palette contrast ratio - float
+    """
+    color_type = "light" if light else "dark"
+    if "c16" in kwargs:
+        cols16 = kwargs["c16"]
+    else:
+        cols16 = False
+    if "cst" in kwargs:
+        contrast = kwargs["cst"]
+    else:
+        contrast = False
+    color_num = "16" if cols16 else "9"
+    file_name = re.sub("[/|\\|.]", "_", img)
+    file_size = os.path.getsize(img)
+
+    if cols16 and contrast:
+        file_parts = [
+            file_name,
+            color_num,
+            cols16,
+            color_type,
+            backend,
+            sat,
+            contrast,
+            file_size,
+            __cache_version__,
+        ]
+        return [
+            cache_dir,
+            "schemes",
+            "%s_%s_%s_%s_%s_%s_%s_%s_%s.json" % (*file_parts,),
+        ]
+    if cols16 and (not contrast):
+        file_parts = [
+            file_name,
+            color_num,
+            cols16,
+            color_type,
+            backend,
+            sat,
+            file_size,
+            __cache_version__,
+        ]
+        return [
+            cache_dir,
+            "schemes",
+            "%s_%s_%s_%s_%s_%s_%s_%s.json" % (*file_parts,),
+        ]
+    if (not cols16) and contrast:
+        file_parts = [
+            file_name,
+            color_type,
+            backend,
+            sat,
+            contrast,
+            file_size,
+            __cache_version__,
+        ]
+        return [
+            cache_dir,
+            "schemes",
+            "%s_%s_%s_%s_%s_%s_%s.json" % (*file_parts,),
+        ]
+    else:
+        file_parts = [
+            file_name,
+            color_type,
+            backend,
+            sat,
+            file_size,
+            __cache_version__,
+        ]
+        return [
+            cache_dir,
+            "schemes",
+            "%s_%s_%s_%s_%s_%s.json" % (*file_parts,),
+        ]
+
+
+def legacy_options(file_name, scheme, cache_dir=CACHE_DIR):
+    """Recover the options_key() of a colorscheme cached as a json
+    file by older versions, None if it's stale or can't be told apart.
+
+    The options are joined by underscores in the file name, which
+    backend names contain too, so candidates are checked by building
+    their file name again."""
+    img = scheme.get("wallpaper", "")
+    prefix = re.sub("[/|\\|.]", "_", img) + "_"
+
+    if not file_name.startswith(prefix) or not os.path.isfile(img):
+        return None
+
+    tokens = file_name[len(prefix):-len(".json")].split("_")
+    c16 = False
+    if tokens[0] == "16":
+        c16, tokens = tokens[1], tokens[2:]
+
+    light = tokens[0] == "light"
+    # "None" when wal ran without --backend.
+    backends = {"None", "random", *registry.names()}
+    found = []
+
+    # backend, sat, [contrast], file size, version
+    for tail in (3, 4):
+        backend = "_".join(tokens[1:-tail])
+        sat, cst = tokens[-tail], tokens[-3] if tail == 4 else ""
+
+        if backend not in backends:
+            continue
+
+        name = legacy_fname(
+            img,
+            backend,
+            light,
+            cache_dir,
+            sat,
+            c16=c16,
+            **({"cst": number(cst)} if cst else {}),
+        )[-1]
+
+        if name == file_name:
+            found.append(
+                options_key(
+                    backend,
+                    light,
+                    "" if sat == "None" else sat,
+                    c16=c16,
+                    cst=cst,
+                )
+            )
+
+    return found[0] if len(found) == 1 else None
+
+
+def migrate(conn, cache_dir=CACHE_DIR):
+    """Import the json colorschemes of older versions."""
+    scheme_dir = os.path.join(cache_dir, "schemes")
+    if not os.path.isdir(scheme_dir):
+        return
+
+    rows = []
+    paths = []
+    for entry in os.scandir(scheme_dir):
+        if not entry.name.endswith(".json"):
+            continue
+
+        try:
+            scheme = util.read_file_json(entry.path)
+            options = legacy_options(entry.name, scheme, cache_dir)
+        except (OSError, ValueError, TypeError, AttributeError):
+            continue
+
+        if options:
+            data = codec.encode(scheme)
+            mtime = entry.stat().st_mtime
+            rows.append(
+                (
+                    scheme["checksum"],
+                    options,
+                    __cache_version__,
+                    data,
+                    len(data),
+                    mtime,
+                    mtime,
+                )
+            )
+            img = os.path.abspath(scheme["wallpaper"])
+            paths.append((img, scheme["checksum"], mtime))
+
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO schemes "
+            "(checksum, options, version, scheme, size, created, "
+            "last_hit) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO paths VALUES (?, ?, ?)", paths
+        )
+        if paths:
+            bump(conn)
+
+    if rows:
+        logging.info(
+            "Migrated %s cached colorschemes to %s, %s can be deleted.",
+            len(rows),
+            DB_NAME,
+            scheme_dir,
+        )
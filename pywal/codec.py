@@ -0,0 +1,89 @@
+"""
+Colorscheme encoding of the scheme store.
+
+Schemes are stored packed in a fixed binary layout (BINARY) decoded with
+a single struct.unpack, schemes that don't fit it are stored as json.
+PYWAL_CACHE_FORMAT=json stores json only, for other tools reading the
+database. Both formats are always readable.
+"""
+
+import json
+import os
+import re
+import struct
+
+
+FORMAT = os.getenv("PYWAL_CACHE_FORMAT", "binary")
+
+# Magic, alpha, flags, 16 colors, background, foreground and cursor
+# as packed RGB and the checksum padded with NULs. The wallpaper path
+# follows as UTF-8.
+BINARY = struct.Struct("<4sBB48s9s64s")
+MAGIC = b"WAL\x01"
+# The alpha was a string.
+ALPHA_STR = 1
+SPECIAL = ("background", "foreground", "cursor")
+COLORS = tuple("color%s" % i for i in range(16))
+HEX_COLOR = re.compile("#[0-9a-f]{6}")
+
+
+def encode(scheme, fmt=None):
+    """Serialize a colorscheme for the store, as BINARY bytes when it
+    fits the layout and FORMAT (or fmt) allows it, else as json."""
+    if (fmt or FORMAT) == "binary":
+        try:
+            return encode_binary(scheme)
+        except (ValueError, TypeError, KeyError, AttributeError,
+                struct.error):
+            pass
+
+    return json.dumps(scheme)
+
+
+def encode_binary(scheme):
+    """Pack a colorscheme into BINARY, ValueError if it doesn't fit."""
+    special = scheme["special"]
+    cols = scheme["colors"]
+    alpha = scheme["alpha"]
+    checksum = scheme["checksum"].encode("ascii")
+
+    if (
+        set(scheme) != {"checksum", "wallpaper", "alpha", "special", "colors"}
+        or tuple(special) != SPECIAL
+        or tuple(cols) != COLORS
+        or len(checksum) > 64
+        or str(int(alpha)) != str(alpha)
+        or not all(
+            HEX_COLOR.fullmatch(col)
+            for col in (*special.values(), *cols.values())
+        )
+    ):
+        raise ValueError("scheme doesn't fit the binary layout")
+
+    return BINARY.pack(
+        MAGIC,
+        int(alpha),
+        ALPHA_STR if isinstance(alpha, str) else 0,
+        bytes.fromhex("".join(col[1:] for col in cols.values())),
+        bytes.fromhex("".join(col[1:] for col in special.values())),
+        checksum,
+    ) + scheme["wallpaper"].encode("utf-8", "surrogateescape")
+
+
+def decode(data):
+    """Colorscheme of stored data in either format."""
+    if not isinstance(data, bytes) or data[:4] != MAGIC:
+        return json.loads(data)
+
+    _, alpha, flags, cols, special, checksum = BINARY.unpack_from(data)
+    # "#aabbcc,#ddeeff,..." without a python level loop over the colors.
+    cols = ("#" + cols.hex(",", 3).replace(",", ",#")).split(",")
+    special = ("#" + special.hex(",", 3).replace(",", ",#")).split(",")
+
+    return {
+        "checksum": checksum.rstrip(b"\0").decode("ascii"),
+        "wallpaper": data[BINARY.size:].decode("utf-8", "surrogateescape"),
+        "alpha": str(alpha) if flags & ALPHA_STR else alpha,
+        "special": dict(zip(SPECIAL, special)),
+        "colors": dict(zip(COLORS, cols)),
+    }
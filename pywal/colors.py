@@ -3,24 +3,32 @@ Generate a palette using various backends.
 """
 
 import colorsys
+import contextlib
 import logging
 import os
 import random
-import re
-import sys
+import time
 
+from . import cache
+from . import duplicates
+from . import index
+from . import registry
+from . import runner
 from . import theme
 from . import util
-from .settings import CACHE_DIR, MODULE_DIR, __cache_version__
+from .settings import CACHE_DIR
+
+
+AUTO_BUDGET = 1000
+HISTORY_SAMPLES = 50
+# Samples of older histories were timed against the file size.
+HISTORY_VERSION = 2
+HISTORY_FILE = "backends.json"
 
 
 def list_backends():
     """List color backends."""
-    return [
-        b.name.replace(".py", "")
-        for b in os.scandir(os.path.join(MODULE_DIR, "backends"))
-        if "__" not in b.name
-    ]
+    return registry.names()
 
 
 def normalize_img_path(img: str):
@@ -33,10 +41,10 @@ def normalize_img_path(img: str):
     return img
 
 
-def colors_to_dict(colors, img):
+def colors_to_dict(colors, img, cache_dir=CACHE_DIR):
     """Convert list of colors to pywal format."""
     return {
-        "checksum": util.get_img_checksum(img),
+        "checksum": util.get_img_checksum(img, cache_dir),
         "wallpaper": normalize_img_path(img),
         "alpha": util.Color.alpha_num,
         "special": {
@@ -280,7 +288,11 @@ def ensure_contrast(colors, contrast, light, image):
         return colors
 
     # Get the image background color
-    background_color = util.Color(util.image_average_color(image))
+    average_color = util.image_average_color(image)
+    if not average_color:
+        return colors
+
+    background_color = util.Color(average_color)
     background_luminance = background_color.w3_luminance
 
     # Calculate the required W3 luminance for the desired contrast ratio
@@ -313,8 +325,8 @@ def ensure_contrast(colors, contrast, light, image):
     colors_to_contrast = range(1, 15)
 
     # Modify colors
-    for index in colors_to_contrast:
-        color = util.Color(colors[index])
+    for i in colors_to_contrast:
+        color = util.Color(colors[i])
 
         # If the color already has sufficient contrast, do nothing
         if light and color.w3_luminance <= luminance_desired:
@@ -342,20 +354,20 @@ def ensure_contrast(colors, contrast, light, image):
             ).w3_luminance
             >= luminance_desired
         ):
-            colors[index] = binary_luminance_adjust(
+            colors[i] = binary_luminance_adjust(
                 luminance_desired, h, s, s, v, 1
             )
         # If the color is to be lighter than background and increasing value
         # to 1 doesn't produce the desired luminance, additionally decrease
         # saturation
         elif not light:
-            colors[index] = binary_luminance_adjust(
+            colors[i] = binary_luminance_adjust(
                 luminance_desired, h, 0, s, 1, 1
             )
         # If the color is to be darker than background, produce desired
         # luminance by decreasing value, and raising saturation
         else:
-            colors[index] = binary_luminance_adjust(
+            colors[i] = binary_luminance_adjust(
                 luminance_desired, h, s, 1, 0, v
             )
 
@@ -399,96 +411,163 @@ def binary_luminance_adjust(
     )
 
 
-def cache_fname(img, backend, light, cache_dir, sat="", **kwargs):
-    """Create the cache file name.
-    :keyword-args:
-    -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
-    -    cst: palette contrast ratio - float
-    """
-    color_type = "light" if light else "dark"
-    if "c16" in kwargs:
-        cols16 = kwargs["c16"]
-    else:
-        cols16 = False
-    if "cst" in kwargs:
-        contrast = kwargs["cst"]
-    else:
-        contrast = False
-    color_num = "16" if cols16 else "9"
-    file_name = re.sub("[/|\\|.]", "_", img)
-    file_size = os.path.getsize(img)
-
-    if cols16 and contrast:
-        file_parts = [
-            file_name,
-            color_num,
-            cols16,
-            color_type,
-            backend,
-            sat,
-            contrast,
-            file_size,
-            __cache_version__,
-        ]
-        return [
-            cache_dir,
-            "schemes",
-            "%s_%s_%s_%s_%s_%s_%s_%s_%s.json" % (*file_parts,),
-        ]
-    if cols16 and (not contrast):
-        file_parts = [
-            file_name,
-            color_num,
-            cols16,
-            color_type,
-            backend,
-            sat,
-            file_size,
-            __cache_version__,
-        ]
-        return [
-            cache_dir,
-            "schemes",
-            "%s_%s_%s_%s_%s_%s_%s_%s.json" % (*file_parts,),
-        ]
-    if (not cols16) and contrast:
-        file_parts = [
-            file_name,
-            color_type,
-            backend,
-            sat,
-            contrast,
-            file_size,
-            __cache_version__,
-        ]
-        return [
-            cache_dir,
-            "schemes",
-            "%s_%s_%s_%s_%s_%s_%s.json" % (*file_parts,),
-        ]
+def backend_history(cache_dir=CACHE_DIR):
+    """Read the recorded backend runs."""
+    history_file = os.path.join(cache_dir, HISTORY_FILE)
+
+    try:
+        history = util.read_file_json(history_file)
+    except (FileNotFoundError, ValueError):
+        history = None
+
+    if not isinstance(history, dict) or history.get(
+        "version"
+    ) != HISTORY_VERSION:
+        history = {"version": HISTORY_VERSION, "backends": {},
+                   "decisions": []}
+
+    return history
+
+
+@contextlib.contextmanager
+def update_history(cache_dir=CACHE_DIR):
+    """Read the backend history for a change and write it back, other
+    wal processes wait for the lock in between so no run is lost."""
+    history_file = os.path.join(cache_dir, HISTORY_FILE)
+    util.create_dir(cache_dir)
+
+    with open(history_file + ".lock", "a") as lock:
+        if util.has_fcntl:
+            util.fcntl.flock(lock, util.fcntl.LOCK_EX)
+
+        history = backend_history(cache_dir)
+        yield history
+
+        util.save_file_json(history, history_file + ".tmp")
+        os.replace(history_file + ".tmp", history_file)
+
+
+def megapixels(img):
+    """Size of an image in millions of pixels, from its header. Images
+    whose header can't be read count as 3 bytes per pixel of file."""
+    info = index.image_info(img)
+    if info:
+        return info[1] * info[2] / 1e6
+
+    return os.path.getsize(img) / 3e6
+
+
+def record_backend_run(backend, img, seconds, colors, cache_dir=CACHE_DIR):
+    """Record how long a backend took on an image and how good
+    the palette was, auto selection is based on these."""
+    sample = [megapixels(img), seconds * 1000, util.palette_score(colors[:16])]
+
+    with update_history(cache_dir) as history:
+        samples = history["backends"].setdefault(backend, [])
+        samples.append(sample)
+        del samples[:-HISTORY_SAMPLES]
+
+
+def predict_latency(samples, size):
+    """Predict the run time in ms for an image of size megapixels from
+    (size, ms, score) samples with a least squares line."""
+    sizes = [sample[0] for sample in samples]
+    times = [sample[1] for sample in samples]
+    mean_size = sum(sizes) / len(sizes)
+    mean_time = sum(times) / len(times)
+    variance = sum((x - mean_size) ** 2 for x in sizes)
+
+    if not variance:
+        return mean_time
+
+    slope = sum(
+        (x - mean_size) * (y - mean_time) for x, y in zip(sizes, times)
+    ) / variance
+
+    if slope < 0:
+        return mean_time
+
+    return max(mean_time + slope * (size - mean_size), 0)
+
+
+def auto_backend(img, budget, cache_dir=CACHE_DIR):
+    """Pick the best scoring backend expected to finish within
+    budget ms, or the fastest one when none does."""
+    history = backend_history(cache_dir)
+    size = megapixels(img)
+    candidates = []
+
+    for backend in registry.available():
+        samples = history["backends"].get(backend)
+        if samples:
+            candidates.append(
+                (
+                    backend,
+                    predict_latency(samples, size),
+                    sum(sample[2] for sample in samples) / len(samples),
+                )
+            )
+
+    within = [cand for cand in candidates if cand[1] <= budget]
+
+    if within:
+        backend, latency, score = max(within, key=lambda c: (c[2], -c[1]))
+        reason = "best score within budget"
+
+    elif candidates:
+        backend, latency, score = min(candidates, key=lambda c: c[1])
+        reason = "fastest, no backend fits the budget"
+
     else:
-        file_parts = [
-            file_name,
-            color_type,
-            backend,
-            sat,
-            file_size,
-            __cache_version__,
-        ]
-        return [
-            cache_dir,
-            "schemes",
-            "%s_%s_%s_%s_%s_%s.json" % (*file_parts,),
-        ]
-
-
-def get_backend(backend):
+        available = registry.available() or ["wal"]
+        backend = "wal" if "wal" in available else available[0]
+        latency = score = None
+        reason = "no history"
+
+    logging.info(
+        "Auto picked the %s backend (%s, %s ms expected).",
+        backend,
+        reason,
+        "?" if latency is None else "%.0f" % latency,
+    )
+
+    with update_history(cache_dir) as history:
+        history["decisions"].append(
+            {
+                "image": normalize_img_path(img),
+                "megapixels": size,
+                "budget": budget,
+                "backend": backend,
+                "latency": latency,
+                "score": score,
+                "reason": reason,
+            }
+        )
+        del history["decisions"][:-HISTORY_SAMPLES]
+
+    return backend
+
+
+def get_backend(backend, img=None, cache_dir=CACHE_DIR):
     """Figure out which backend to use."""
     if backend == "random":
-        backends = list_backends()
+        backends = registry.available() or list_backends()
         random.shuffle(backends)
         return backends[0]
 
+    if backend and backend.split(":")[0] == "auto" and img:
+        _, _, budget = backend.partition(":")
+
+        try:
+            budget = float(budget or AUTO_BUDGET)
+        except ValueError:
+            logging.error(
+                "Invalid auto budget '%s', using %s ms.", budget, AUTO_BUDGET
+            )
+            budget = AUTO_BUDGET
+
+        return auto_backend(img, budget, cache_dir)
+
     return backend
 
 
@@ -506,7 +585,7 @@ def palette():
     print("\n")
 
 
-def get(
+def generate(
     img,
     light=False,
     backend="wal",
@@ -514,10 +593,11 @@ def get(
     sat="",
     **kwargs,
 ):
-    """Generate a palette.
+    """Generate a palette with a backend, skipping the cache.
     :keyword-args:
     -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
     -    cst: apply contrast ratio to palette        - float
+    -    samples: (count, ms) pixels to sample       - tuple
     """
     if "c16" in kwargs:
         cols16 = kwargs["c16"]
@@ -528,52 +608,108 @@ def get(
     else:
         contrast = ""
 
-    # home_dylan_img_jpg_backend_1.2.2.json
-    if not contrast or contrast == "":
-        cache_name = cache_fname(
-            img, backend, light, cache_dir, sat,
-            c16=cols16
-        )
-    else:
-        cache_name = cache_fname(
-            img, backend, light, cache_dir, sat,
-            c16=cols16, cst=float(contrast)
-        )
+    logging.info("Generating a colorscheme.")
+    backend = get_backend(backend, img, cache_dir) or "wal"
 
-    cache_file = os.path.join(*cache_name)
+    # Dynamically import the backend we want to use.
+    # This keeps the dependencies "optional", the optional backends
+    # are checked first and wal is what they fall back to.
+    entry = registry.get(backend)
+    try:
+        if not entry:
+            raise ImportError("there is no such backend")
+
+        if backend != "wal" and not entry.available:
+            raise ImportError("its dependencies are missing")
+
+        backend_module = registry.load(backend)
+    except ImportError as err:
+        logging.warning("Can't use the %s backend, %s.", backend, err)
+        backend_module = registry.load("wal")
+        backend = "wal"
+
+    # Only the backends decoding pixels themselves can sample them.
+    backend_args = {"c16": cols16}
+    if kwargs.get("samples") and registry.get(backend).pixels:
+        backend_args["samples"] = kwargs["samples"]
+
+    logging.info("Using %s backend.", backend)
+    start = time.perf_counter()
+    hits = runner.memo_hits()
+    colors = getattr(backend_module, "get")(img, light, **backend_args)
+    seconds = time.perf_counter() - start
+
+    # A memoized run says nothing about how long the backend takes.
+    if runner.memo_hits() == hits:
+        record_backend_run(backend, img, seconds, colors, cache_dir)
+        cache.record_latency(backend, seconds, cache_dir)
+
+    # Post-processing steps from command-line arguments
+    colors = saturate_colors(colors, sat)
+    colors = ensure_contrast(colors, contrast, light, img)
+
+    colors = colors_to_dict(colors, img, cache_dir)
+    logging.info("Generation complete.")
+    return colors
 
-    # Check the wallpaper's checksum against the cache'
-    if os.path.isfile(cache_file) and theme.parse(cache_file)[
-        "checksum"
-    ] == util.get_img_checksum(img):
-        colors = theme.file(cache_file)
-        logging.info("Found cached colorscheme.")
 
+def get(
+    img,
+    light=False,
+    backend="wal",
+    cache_dir=CACHE_DIR,
+    sat="",
+    **kwargs,
+):
+    """Generate a palette or get it from the cache.
+    :keyword-args:
+    -    c16: use 16 colors through specified method - [ "lighten" | "darken" ]
+    -    cst: apply contrast ratio to palette        - float
+    -    samples: (count, ms) pixels to sample       - tuple
+    """
+    if "c16" in kwargs:
+        cols16 = kwargs["c16"]
     else:
-        logging.info("Generating a colorscheme.")
-        backend = get_backend(backend)
-
-        # Dynamically import the backend we want to use.
-        # This keeps the dependencies "optional".
-        try:
-            __import__("pywal.backends.%s" % backend)
-        except ImportError:
-            __import__("pywal.backends.wal")
-            backend = "wal"
-
-        logging.info("Using %s backend.", backend)
-        backend = sys.modules["pywal.backends.%s" % backend]
-        colors = getattr(backend, "get")(img, light, c16=cols16)
-
-        # Post-processing steps from command-line arguments
-        colors = saturate_colors(colors, sat)
-        colors = ensure_contrast(colors, contrast, light, img)
-
-        colors = colors_to_dict(colors, img)
+        cols16 = False
+    if "cst" in kwargs:
+        contrast = kwargs["cst"]
+    else:
+        contrast = ""
 
-        util.save_file_json(colors, cache_file)
-        logging.info("Generation complete.")
+    samples = kwargs.get("samples")
+    options = cache.options_key(
+        backend,
+        light,
+        sat,
+        c16=cols16,
+        cst=contrast,
+        samples=samples[0] if samples else 0,
+    )
+    colors = cache.get(img, options, cache_dir)
+
+    if not colors:
+        # Concurrent runs for the same image and options wait for the
+        # first one and reuse its colorscheme.
+        with cache.lock(img, options, cache_dir):
+            colors = cache.get(img, options, cache_dir, record=False)
+
+            if not colors:
+                colors = duplicates.reuse(img, options, cache_dir)
+                if colors:
+                    cache.put(img, options, colors, cache_dir)
+
+            if not colors:
+                colors = generate(
+                    img, light, backend, cache_dir, sat,
+                    c16=cols16, cst=contrast, samples=samples,
+                )
+                cache.put(img, options, colors, cache_dir)
+                return colors
 
+    # The scheme may have been generated for a copy of the image.
+    colors["wallpaper"] = normalize_img_path(img)
+    colors = theme.normalize(colors)
+    logging.info("Found cached colorscheme.")
     return colors
 
 
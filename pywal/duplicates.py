@@ -0,0 +1,291 @@
+"""
+Find near-duplicate wallpapers.
+
+    wal --duplicates DIR [--recursive]
+
+Images are compared by their difference hash (dHash): the image is
+squashed to 9x8 pixels and each of the 64 bits tells whether a pixel is
+brighter than its right neighbour. Resized, re-encoded or slightly
+cropped copies of an image get hashes a few bits apart, the Hamming
+distance of the hashes counts them. The hash only sees brightness, so
+duplicates must also have mean colors within COLOR_DISTANCE in OKLab.
+
+The hashes are kept in the index by checksum so every image is only
+decoded once, with their BANDS bands of bits so the hashes close to
+one are found with an indexed lookup.
+
+With PYWAL_DUPLICATE_REUSE=1, an image without a cached colorscheme
+first looks for a near-duplicate that has one for the same options and
+reuses it instead of running the backend.
+"""
+
+import logging
+import os
+
+from .settings import CACHE_DIR, __cache_version__
+from . import cache
+from . import codec
+from . import index
+from . import pixels
+from . import runner
+from . import util
+
+
+# Bits the hashes of two duplicates may differ by.
+DISTANCE = int(os.getenv("PYWAL_DUPLICATE_DISTANCE", 4))
+# Reuse the colorschemes of near-duplicates, off by default.
+REUSE = os.getenv("PYWAL_DUPLICATE_REUSE", "0") == "1"
+# OKLab distance the mean colors of two duplicates may be apart by.
+COLOR_DISTANCE = 0.04
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+HASH_BITS = (HASH_WIDTH - 1) * HASH_HEIGHT
+HASH_MASK = (1 << HASH_BITS) - 1
+# Hashes at most BANDS - 1 bits apart agree on one of their BANDS bands
+# of bits, which bounds the DISTANCE of indexed lookups.
+BANDS = 8
+BAND_BITS = HASH_BITS // BANDS
+
+# What makes an image impossible to hash, it is then left out.
+HASH_ERRORS = (OSError, ValueError, runner.RunnerError)
+
+
+def difference_hash(grey, width=HASH_WIDTH):
+    """dHash of rows of width grey pixels, one bit per pair of
+    neighbours set when the left one is brighter."""
+    value = 0
+
+    for row in range(0, len(grey), width):
+        for x in range(row, row + width - 1):
+            value = value << 1 | (grey[x] > grey[x + 1])
+
+    return value
+
+
+def mean_color(data):
+    """Mean of packed RGB bytes as a 0xRRGGBB integer."""
+    count = max(len(data) // 3, 1)
+    color = 0
+
+    for channel in range(3):
+        color = color << 8 | sum(data[channel::3]) // count
+
+    return color
+
+
+def distance(hash1, hash2):
+    """Number of bits two hashes differ by."""
+    return (hash1 ^ hash2).bit_count()
+
+
+def color_distance(color, color2):
+    """OKLab distance of two 0xRRGGBB colors."""
+    lab, lab2 = (
+        util.rgb_to_oklab((col >> 16, col >> 8 & 0xFF, col & 0xFF))
+        for col in (color, color2)
+    )
+    return sum((x - y) ** 2 for x, y in zip(lab, lab2)) ** 0.5
+
+
+def duplicate(sig, sig2, max_distance=DISTANCE):
+    """Whether two (hash, color) signatures are near-duplicates."""
+    return (
+        distance(sig[0], sig2[0]) <= max_distance
+        and color_distance(sig[1], sig2[1]) <= COLOR_DISTANCE
+    )
+
+
+def bands(value, count=BANDS):
+    """(band, bits) of the count bands of bits of a hash."""
+    width = HASH_BITS // count
+
+    for band in range(count):
+        bits = width if band < count - 1 else HASH_BITS - band * width
+        yield band, value >> (band * width) & ((1 << bits) - 1)
+
+
+def band_parts(value):
+    """The bands of a hash as the integers kept in the index."""
+    return [band << BAND_BITS | bits for band, bits in bands(value)]
+
+
+def store_hash(conn, checksum, value, color):
+    """Keep the hash and mean color of a checksum in the index."""
+    # SQLite integers are signed 64 bit.
+    signed = value - (1 << HASH_BITS) if value >> (HASH_BITS - 1) else value
+
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?)",
+            (checksum, signed, color),
+        )
+        conn.execute("DELETE FROM hash_bands WHERE checksum = ?", (checksum,))
+        conn.executemany(
+            "INSERT INTO hash_bands VALUES (?, ?)",
+            [(part, checksum) for part in band_parts(value)],
+        )
+
+
+def image_hash(img, checksum=None, cache_dir=CACHE_DIR):
+    """(dHash, mean color) of img, computed the first time its checksum
+    is seen."""
+    checksum = checksum or util.get_img_checksum(img, cache_dir)
+    conn = index.connect(cache_dir)
+    row = conn.execute(
+        "SELECT dhash, color FROM hashes WHERE checksum = ?", (checksum,)
+    ).fetchone()
+
+    if row:
+        return row[0] & HASH_MASK, row[1]
+
+    data = pixels.thumbnail(img, HASH_WIDTH, HASH_HEIGHT)
+    grey = bytes(
+        (r * 299 + g * 587 + b * 114) // 1000
+        for r, g, b in pixels.iter_pixels(data)
+    )
+    value = difference_hash(grey)
+    color = mean_color(data)
+
+    store_hash(conn, checksum, value, color)
+    return value, color
+
+
+def nearest(img, options, max_distance=DISTANCE, cache_dir=CACHE_DIR):
+    """Checksum and distance of the image closest to img, within
+    max_distance bits (at most BANDS - 1) and COLOR_DISTANCE, that has
+    a cached colorscheme for options. None when there is none."""
+    checksum = util.get_img_checksum(img, cache_dir)
+    sig = image_hash(img, checksum, cache_dir)
+    max_distance = min(max_distance, BANDS - 1)
+    conn = index.connect(cache_dir)
+    index.attach(conn, cache_dir)
+    parts = band_parts(sig[0])
+
+    rows = conn.execute(
+        "SELECT hashes.checksum, hashes.dhash, hashes.color FROM hashes "
+        "JOIN store.schemes AS schemes ON schemes.checksum = hashes.checksum "
+        "WHERE hashes.checksum IN (SELECT checksum FROM hash_bands "
+        "WHERE part IN (%s)) AND schemes.options = ? "
+        "AND schemes.version = ? AND hashes.checksum != ?"
+        % ", ".join("?" * len(parts)),
+        (*parts, options, __cache_version__, checksum),
+    )
+
+    best = None
+    for other, other_hash, other_color in rows:
+        other_sig = (other_hash & HASH_MASK, other_color)
+        if not duplicate(sig, other_sig, max_distance):
+            continue
+
+        dist = distance(sig[0], other_sig[0])
+        if not best or dist < best[1]:
+            best = (other, dist)
+
+    return best
+
+
+def reuse(img, options, cache_dir=CACHE_DIR):
+    """Cached colorscheme of a near-duplicate of img for options with
+    the checksum of img, None when there is none or REUSE is off."""
+    if not REUSE or DISTANCE < 0:
+        return None
+
+    try:
+        found = nearest(img, options, DISTANCE, cache_dir)
+    except HASH_ERRORS as err:
+        logging.debug("Couldn't hash %s: %s", img, err)
+        return None
+
+    if not found:
+        return None
+
+    data = cache.lookup(cache.connect(cache_dir), found[0], options)
+    if data is None:
+        return None
+
+    scheme = codec.decode(data)
+    scheme["checksum"] = util.get_img_checksum(img, cache_dir)
+    logging.info(
+        "Reusing the colorscheme of %s, a near-duplicate %s bits apart.",
+        scheme["wallpaper"],
+        found[1],
+    )
+    return scheme
+
+
+def clusters(sigs, max_distance=DISTANCE):
+    """Groups of the keys of a {key: (hash, color)} dict that are
+    near-duplicates of one another, directly or through other keys.
+
+    Only the hashes agreeing on one of max_distance + 1 bands of bits
+    are compared, two hashes that close always agree on one of them."""
+    count = min(max(max_distance, 0) + 1, HASH_BITS)
+    buckets = {}
+
+    for key, sig in sigs.items():
+        for band in bands(sig[0], count):
+            buckets.setdefault(band, []).append(key)
+
+    parent = {key: key for key in sigs}
+
+    def root(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for keys in buckets.values():
+        for i, key in enumerate(keys):
+            for other in keys[i + 1:]:
+                if duplicate(sigs[key], sigs[other], max_distance):
+                    parent[root(other)] = root(key)
+
+    groups = {}
+    for key in sigs:
+        groups.setdefault(root(key), []).append(key)
+
+    return sorted(sorted(group) for group in groups.values() if len(group) > 1)
+
+
+def find(
+    img_dir,
+    recursive=False,
+    rebuild=False,
+    cache_dir=CACHE_DIR,
+    filters=None,
+    max_distance=DISTANCE,
+):
+    """Clusters of near-duplicate images in img_dir matching filters."""
+    sigs = {}
+
+    for img in index.images(img_dir, recursive, rebuild, cache_dir, filters):
+        try:
+            sigs[img] = image_hash(img, cache_dir=cache_dir)
+        except HASH_ERRORS as err:
+            logging.warning("Couldn't hash %s: %s", img, err)
+
+    return clusters(sigs, max_distance)
+
+
+def report(
+    img_dir,
+    recursive=False,
+    rebuild=False,
+    cache_dir=CACHE_DIR,
+    filters=None,
+):
+    """Print the clusters of near-duplicate images in img_dir."""
+    groups = find(img_dir, recursive, rebuild, cache_dir, filters,
+                  max(DISTANCE, 0))
+
+    for i, group in enumerate(groups, 1):
+        print("Cluster %s (%s images):" % (i, len(group)))
+        for img in group:
+            print("  %s" % img)
+
+    logging.info(
+        "%s near-duplicate images in %s clusters.",
+        sum(len(group) for group in groups),
+        len(groups),
+    )
+    return groups
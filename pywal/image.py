@@ -2,106 +2,156 @@
 Get the image file.
 """
 
+import argparse
 import logging
 import os
-import random
-import re
 import sys
 
 from .settings import CACHE_DIR
+from . import index
+from . import similar
 from . import util
 from . import wallpaper
 
 
-def get_image_dir_recursive(img_dir):
-    """Get all images in a directory recursively."""
-    current_wall = wallpaper.get()
-    current_wall = os.path.basename(current_wall)
+def resolution_spec(spec):
+    """Parse the --min-resolution "WIDTHxHEIGHT" argument."""
+    width, _, height = spec.lower().partition("x")
 
-    file_types = (".png", ".jpg", ".jpeg", ".jpe", ".gif", ".webp")
+    try:
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected WIDTHxHEIGHT") from None
 
-    images = []
-    for path, _, files in os.walk(img_dir):
-        for name in files:
-            if name.lower().endswith(file_types):
-                if name.endswith(current_wall):
-                    current_wall = os.path.join(path, name)
-                images.append(os.path.join(path, name))
 
-    return images, current_wall
+def aspect_spec(spec):
+    """Parse the --aspect "W:H" argument into a ratio."""
+    width, _, height = spec.partition(":")
 
+    try:
+        ratio = float(width) / float(height)
+    except (ValueError, ZeroDivisionError):
+        ratio = 0
 
-def get_image_dir(img_dir):
-    """Get all images in a directory."""
-    current_wall = wallpaper.get()
-    current_wall = os.path.basename(current_wall)
+    if not ratio > 0:
+        raise argparse.ArgumentTypeError("expected W:H")
 
-    file_types = (".png", ".jpg", ".jpeg", ".jpe", ".gif")
+    return ratio
 
-    return [
-        img.name
-        for img in os.scandir(img_dir)
-        if img.name.lower().endswith(file_types)
-    ], current_wall
 
+def list_images(
+    img_dir, recursive=False, rebuild=False, cache_dir=CACHE_DIR, filters=None
+):
+    """Absolute paths of all images in a directory matching filters
+    (see index.filter_sql()), sorted."""
+    return index.images(img_dir, recursive, rebuild, cache_dir, filters)
 
-def get_random_image(img_dir, recursive):
-    """Pick a random image file from a directory."""
-    if recursive:
-        images, current_wall = get_image_dir_recursive(img_dir)
-    else:
-        images, current_wall = get_image_dir(img_dir)
 
-    if len(images) > 2 and current_wall in images:
-        images.remove(current_wall)
+def get_random_image(
+    img_dir, recursive, rebuild=False, cache_dir=CACHE_DIR, filters=None
+):
+    """Pick a random image file from a directory."""
+    image = index.random_image(
+        img_dir,
+        wallpaper.get(cache_dir),
+        recursive,
+        rebuild,
+        cache_dir,
+        filters,
+    )
 
-    elif not images:
+    if not image:
         logging.error("No images found in directory.")
         sys.exit(1)
 
-    random.shuffle(images)
-    return os.path.join(img_dir if not recursive else "", images[0])
+    return image
 
 
-def get_next_image(img_dir, recursive):
+def get_next_image(
+    img_dir, recursive, rebuild=False, cache_dir=CACHE_DIR, filters=None
+):
     """Get the next image in a dir."""
-    if recursive:
-        images, current_wall = get_image_dir_recursive(img_dir)
-    else:
-        images, current_wall = get_image_dir(img_dir)
-
-    images.sort(
-        key=lambda img: [
-            int(x) if x.isdigit() else x for x in re.split("([0-9]+)", img)
-        ]
+    image = index.next_image(
+        img_dir,
+        wallpaper.get(cache_dir),
+        recursive,
+        rebuild,
+        cache_dir,
+        filters,
     )
 
-    try:
-        next_index = images.index(current_wall) + 1
-
-    except ValueError:
-        next_index = 0
-
-    try:
-        image = images[next_index]
-
-    except IndexError:
-        image = images[0]
-
-    return os.path.join(img_dir if not recursive else "", image)
+    if not image:
+        logging.error("No images found in directory.")
+        sys.exit(1)
 
+    return image
+
+
+def get_similar_image(
+    img_dir,
+    mode,
+    options,
+    recursive,
+    rebuild=False,
+    cache_dir=CACHE_DIR,
+    filters=None,
+):
+    """Pick the image of a directory whose palette is the most similar
+    to or different from the current one, a random one when there
+    are no cached palettes to compare."""
+    image = similar.pick(
+        img_dir,
+        mode,
+        options,
+        wallpaper.get(cache_dir),
+        recursive,
+        rebuild,
+        cache_dir,
+        filters,
+    )
 
-def get(img, cache_dir=CACHE_DIR, iterative=False, recursive=False):
-    """Validate image input."""
+    if not image:
+        logging.warning(
+            "No current or cached colorschemes to compare, picking a "
+            "random image. Run 'wal --precompute' on the directory first."
+        )
+        image = get_random_image(img_dir, recursive, rebuild, cache_dir,
+                                 filters)
+
+    return image
+
+
+def get(
+    img,
+    cache_dir=CACHE_DIR,
+    iterative=False,
+    recursive=False,
+    rebuild=False,
+    filters=None,
+    select=None,
+    options=None,
+):
+    """Validate image input, filters only apply to directories.
+    select picks by palette ("similar" or "different") among the images
+    with a colorscheme cached for options."""
     if os.path.isfile(img):
         wal_img = img
 
     elif os.path.isdir(img):
-        if iterative:
-            wal_img = get_next_image(img, recursive)
+        if select:
+            wal_img = get_similar_image(
+                img, select, options, recursive, rebuild, cache_dir, filters
+            )
+
+        elif iterative:
+            wal_img = get_next_image(
+                img, recursive, rebuild, cache_dir, filters
+            )
 
         else:
-            wal_img = get_random_image(img, recursive)
+            wal_img = get_random_image(
+                img, recursive, rebuild, cache_dir, filters
+            )
 
     else:
         logging.error("No valid image file found.")
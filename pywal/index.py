@@ -0,0 +1,618 @@
+"""
+Wallpaper directory index.
+
+The images of the directories given to 'wal -i' are kept in an SQLite
+database, CACHE_DIR/index.db, with their size and mtime. A directory is
+only listed again when its own mtime changed, which is when files were
+added, removed or renamed in it, so picking an image from a large tree
+costs a stat per directory instead of reading every directory.
+
+Images are also stored with their natural sort key ("2.jpg" before
+"10.jpg") so 'wal -i DIR --iterative' finds the image after the current
+one with an indexed lookup instead of sorting the directory.
+
+The format and size of every image are read from its header when it is
+indexed, so filtering by resolution, aspect ratio or orientation is a
+query (see filter_sql()).
+
+The perceptual hashes and mean colors of images (see duplicates.py)
+are kept by checksum, they only change with the content of the file.
+
+Random picks draw from a shuffle bag kept per directory: every image
+gets a random position and a cursor walks through them, so each image
+is shown once per cycle before the bag is shuffled again. Images found
+in changed directories join the rest of the current cycle, removed
+ones are dropped when they're drawn.
+
+'wal --rebuild-index' drops what is known of the directory and lists
+it all again, for filesystems that don't update directory mtimes.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import struct
+import time
+
+from .settings import CACHE_DIR
+from . import cache
+from . import util
+
+
+DB_NAME = "index.db"
+
+# Directories modified less than this many nanoseconds before they were
+# listed are listed again next time, a file added in the same mtime
+# tick wouldn't change the mtime.
+RACY_MTIME = 2 * 10**9
+
+SCHEMA_VERSION = 1
+
+# Relative difference from the --aspect ratio that still matches it.
+ASPECT_TOLERANCE = 0.02
+
+FILE_TYPES = (".png", ".jpg", ".jpeg", ".jpe", ".gif", ".webp")
+
+# JPEG start of frame markers, the ones holding the image size.
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+            0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+ORIENTATIONS = ("landscape", "portrait", "square")
+
+SCHEMA = """
+CREATE TABLE dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX dirs_parent ON dirs (parent);
+CREATE TABLE images (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sort_key BLOB NOT NULL,
+    format TEXT,
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX images_dir_sort ON images (dir, sort_key);
+CREATE INDEX images_sort ON images (sort_key);
+CREATE TABLE bags (
+    bag TEXT NOT NULL,
+    path TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    position REAL NOT NULL,
+    PRIMARY KEY (bag, path)
+) WITHOUT ROWID;
+CREATE INDEX bags_position ON bags (bag, position);
+CREATE TABLE cursors (
+    bag TEXT PRIMARY KEY,
+    position REAL NOT NULL
+);
+CREATE TABLE generation (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    value INTEGER NOT NULL
+);
+INSERT INTO generation VALUES (0, 0);
+CREATE TABLE hashes (
+    checksum TEXT PRIMARY KEY,
+    dhash INTEGER NOT NULL,
+    color INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE hash_bands (
+    part INTEGER NOT NULL,
+    checksum TEXT NOT NULL,
+    PRIMARY KEY (part, checksum)
+) WITHOUT ROWID;
+"""
+
+# A random position in (0, 1] for the shuffle bags.
+RANDOM_POSITION = "(abs(random() % 1000000000) + 1) / 1e9"
+
+DIGITS = re.compile("([0-9]+)")
+
+_CONNECTIONS = {}
+
+
+def connect(cache_dir=CACHE_DIR):
+    """Open the index, it is created the first time."""
+    db_file = os.path.join(cache_dir, DB_NAME)
+
+    if db_file not in _CONNECTIONS:
+        util.create_dir(cache_dir)
+
+        conn = sqlite3.connect(db_file, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        # Other processes may be creating the index at the same time.
+        conn.execute("BEGIN IMMEDIATE")
+        with conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+            if version != SCHEMA_VERSION:
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+
+                conn.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+        _CONNECTIONS[db_file] = conn
+
+    return _CONNECTIONS[db_file]
+
+
+def close(cache_dir=CACHE_DIR):
+    """Close the index."""
+    conn = _CONNECTIONS.pop(os.path.join(cache_dir, DB_NAME), None)
+    if conn:
+        conn.close()
+
+
+def attach(conn, cache_dir=CACHE_DIR):
+    """Attach the scheme store to an index connection as "store"."""
+    names = [row[1] for row in conn.execute("PRAGMA database_list")]
+
+    if "store" not in names:
+        # Opening the store creates it first.
+        cache.connect(cache_dir)
+        conn.execute(
+            "ATTACH DATABASE ? AS store",
+            (os.path.join(cache_dir, cache.DB_NAME),),
+        )
+
+
+def sort_key(path):
+    """Natural sort key of a path as bytes that sort like the
+    [text, number, text, ...] lists of re.split("([0-9]+)", path).
+
+    Text parts end with a NUL so shorter ones sort first, numbers
+    are prefixed by their digit count so longer ones sort last. The
+    path itself comes last so "2.jpg" and "02.jpg" don't tie, the
+    next image is the first with a greater key."""
+    parts = []
+
+    for i, part in enumerate(DIGITS.split(path)):
+        if i % 2:
+            part = part.lstrip("0") or "0"
+            parts.append("%03d%s" % (min(len(part), 999), part))
+        else:
+            parts.append(part + "\0")
+
+    parts.append("\0" + path)
+    return "".join(parts).encode("utf-8", "surrogateescape")
+
+
+def subtree(column, path):
+    """SQL condition and arguments matching path and everything below
+    it in column, "/" sorts right before "0" so no LIKE escaping is
+    needed."""
+    prefix = path.rstrip(os.sep)
+    cond = "({0} = ? OR ({0} >= ? AND {0} < ?))".format(column)
+    return cond, (path, prefix + os.sep, prefix + chr(ord(os.sep) + 1))
+
+
+def generation(conn):
+    """Counter bumped whenever images are added to or removed from the
+    index, for the caches built from it."""
+    return conn.execute("SELECT value FROM generation").fetchone()[0]
+
+
+def bump(conn):
+    """Bump the index generation."""
+    conn.execute("UPDATE generation SET value = value + 1")
+
+
+def png_info(head):
+    """Size of a PNG from its IHDR chunk."""
+    if head[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", head[16:24])
+
+
+def gif_info(head):
+    """Size of a GIF from its logical screen descriptor."""
+    return struct.unpack("<HH", head[6:10])
+
+
+def webp_info(head):
+    """Size of a WebP from its first chunk."""
+    chunk = head[12:16]
+
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+
+    if chunk == b"VP8L" and head[20:21] == b"\x2f":
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, (bits >> 14 & 0x3FFF) + 1
+
+    if chunk == b"VP8X":
+        return (
+            int.from_bytes(head[24:27], "little") + 1,
+            int.from_bytes(head[27:30], "little") + 1,
+        )
+
+    return None
+
+
+def jpeg_info(file):
+    """Size of a JPEG from its start of frame segment, the segments
+    before it (EXIF, thumbnails) are skipped over, not read."""
+    file.seek(2)
+
+    while True:
+        byte = file.read(1)
+        if byte != b"\xff":
+            return None
+
+        marker = file.read(1)
+        # Fill bytes.
+        while marker == b"\xff":
+            marker = file.read(1)
+
+        if not marker or marker in (b"\xd9", b"\xda"):
+            return None
+
+        # Markers without a segment.
+        if 0xD0 <= marker[0] <= 0xD7 or marker[0] == 0x01:
+            continue
+
+        segment = file.read(2)
+        if len(segment) < 2:
+            return None
+        length = struct.unpack(">H", segment)[0]
+
+        if marker[0] in JPEG_SOF:
+            frame = file.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            return width, height
+
+        file.seek(length - 2, os.SEEK_CUR)
+
+
+# Magic bytes, format and the function reading the size, from the
+# first 32 bytes or from the file for JPEGs.
+MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "png", png_info),
+    (b"\xff\xd8", "jpeg", jpeg_info),
+    (b"GIF87a", "gif", gif_info),
+    (b"GIF89a", "gif", gif_info),
+    (b"RIFF", "webp", webp_info),
+)
+
+
+def image_info(img):
+    """Format, width and height of an image read from its header only,
+    the format comes from the magic bytes, not the extension.
+    None when it isn't a PNG, JPEG, GIF or WebP or can't be read."""
+    try:
+        with open(img, "rb") as file:
+            head = file.read(32)
+
+            for magic, fmt, info in MAGIC:
+                if not head.startswith(magic):
+                    continue
+
+                if fmt == "webp" and head[8:12] != b"WEBP":
+                    return None
+
+                size = info(file) if fmt == "jpeg" else info(head)
+                return (fmt, *size) if size else None
+
+    except (OSError, struct.error):
+        return None
+
+    return None
+
+
+def forget(conn, path):
+    """Drop a directory and everything below it from the index."""
+    cond, args = subtree("path", path)
+    conn.execute("DELETE FROM dirs WHERE " + cond, args)
+    cond, args = subtree("dir", path)
+    conn.execute("DELETE FROM images WHERE " + cond, args)
+    bump(conn)
+
+
+def scan_dir(conn, path, info):
+    """List a directory into the index, returns its subdirectories."""
+    files = []
+    subdirs = []
+
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                # Symlinked directories aren't followed, like os.walk().
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+
+                elif entry.is_dir():
+                    continue
+
+                elif entry.name.lower().endswith(FILE_TYPES):
+                    stat = entry.stat()
+                    header = image_info(entry.path) or (None,) * 3
+                    files.append(
+                        (
+                            entry.path,
+                            path,
+                            stat.st_size,
+                            stat.st_mtime_ns,
+                            sort_key(entry.path),
+                            *header,
+                        )
+                    )
+            except OSError:
+                continue
+
+    # A directory changing while it's listed is listed again next time.
+    mtime_ns = info.st_mtime_ns
+    if time.time_ns() - mtime_ns < RACY_MTIME:
+        mtime_ns = -1
+
+    with conn:
+        conn.execute("DELETE FROM images WHERE dir = ?", (path,))
+        conn.executemany(
+            "INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)", files
+        )
+        bump(conn)
+
+        known = conn.execute(
+            "SELECT path FROM dirs WHERE parent = ?", (path,)
+        ).fetchall()
+        for subdir in {row[0] for row in known} - set(subdirs):
+            forget(conn, subdir)
+
+        # Subdirectories are known before they're listed so that they
+        # are found through their parent once it stops changing.
+        conn.executemany(
+            "INSERT OR IGNORE INTO dirs VALUES (?, ?, -1)",
+            [(subdir, path) for subdir in subdirs],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+            (path, os.path.dirname(path), mtime_ns),
+        )
+
+    return subdirs
+
+
+def update(conn, img_dir, recursive=False):
+    """Bring the index of a directory up to date, only the directories
+    whose mtime changed are listed. Returns those that were."""
+    stack = [img_dir]
+    listed = []
+
+    while stack:
+        path = stack.pop()
+
+        try:
+            info = os.stat(path)
+        except OSError:
+            with conn:
+                forget(conn, path)
+            continue
+
+        row = conn.execute(
+            "SELECT mtime_ns FROM dirs WHERE path = ?", (path,)
+        ).fetchone()
+
+        if row and row[0] == info.st_mtime_ns:
+            if recursive:
+                stack.extend(
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT path FROM dirs WHERE parent = ?", (path,)
+                    )
+                )
+            continue
+
+        try:
+            subdirs = scan_dir(conn, path, info)
+        except OSError as err:
+            logging.warning("Couldn't read %s: %s", path, err)
+            continue
+
+        listed.append(path)
+        if recursive:
+            stack.extend(subdirs)
+
+    return listed
+
+
+def filter_sql(filters=None):
+    """SQL condition and arguments on the images table for the filters,
+    a dict of "min_resolution": (width, height), "aspect": width / height
+    and "orientation": one of ORIENTATIONS. Images whose size
+    couldn't be read only match when there are no filters."""
+    filters = filters or {}
+    conds = []
+    args = []
+
+    if filters.get("min_resolution"):
+        conds.append("width >= ? AND height >= ?")
+        args.extend(filters["min_resolution"])
+
+    if filters.get("aspect"):
+        conds.append("height > 0 AND abs(1.0 * width / height - ?) <= ?")
+        args.extend((filters["aspect"],
+                     filters["aspect"] * ASPECT_TOLERANCE))
+
+    orientation = filters.get("orientation")
+    if orientation:
+        conds.append({
+            "landscape": "width > height",
+            "portrait": "width < height",
+            "square": "width = height",
+        }[orientation])
+
+    return " AND ".join(conds) or "1", tuple(args)
+
+
+def refresh(img_dir, recursive=False, rebuild=False, cache_dir=CACHE_DIR):
+    """Update the index of img_dir, rebuild lists every directory again.
+    Returns the connection, the SQL condition and arguments selecting
+    the images of img_dir and the directories that were listed."""
+    img_dir = os.path.abspath(img_dir)
+    conn = connect(cache_dir)
+
+    if rebuild:
+        with conn:
+            forget(conn, img_dir)
+
+    start = time.perf_counter()
+    listed = update(conn, img_dir, recursive)
+    logging.debug(
+        "Index: listed %s directories in %.3fs.",
+        len(listed),
+        time.perf_counter() - start,
+    )
+
+    if recursive:
+        cond, args = subtree("dir", img_dir)
+    else:
+        cond, args = "dir = ?", (img_dir,)
+
+    return conn, cond, args, listed
+
+
+def images(
+    img_dir, recursive=False, rebuild=False, cache_dir=CACHE_DIR, filters=None
+):
+    """Absolute paths of the images in img_dir (and its subdirectories
+    when recursive) matching filters, sorted."""
+    conn, cond, args, _ = refresh(img_dir, recursive, rebuild, cache_dir)
+    filter_cond, filter_args = filter_sql(filters)
+    rows = conn.execute(
+        "SELECT path FROM images WHERE %s AND %s ORDER BY path"
+        % (cond, filter_cond),
+        args + filter_args,
+    )
+    return [row[0] for row in rows]
+
+
+def next_image(
+    img_dir,
+    current,
+    recursive=False,
+    rebuild=False,
+    cache_dir=CACHE_DIR,
+    filters=None,
+):
+    """Image of img_dir matching filters after current in natural
+    order, the first one after the last. None when there are none."""
+    conn, cond, args, _ = refresh(img_dir, recursive, rebuild, cache_dir)
+    filter_cond, filter_args = filter_sql(filters)
+    key = sort_key(os.path.abspath(current))
+
+    for extra, extra_args in ((" AND sort_key > ?", (key,)), ("", ())):
+        row = conn.execute(
+            "SELECT path FROM images WHERE %s AND %s%s "
+            "ORDER BY sort_key LIMIT 1" % (cond, filter_cond, extra),
+            args + filter_args + extra_args,
+        ).fetchone()
+
+        if row:
+            return row[0]
+
+    return None
+
+
+def fill_bag(conn, bag, cursor, cond, args):
+    """Add the images matching cond that aren't in a bag yet at random
+    positions after cursor, so they're drawn in the current cycle."""
+    conn.execute(
+        "INSERT OR IGNORE INTO bags SELECT ?, path, dir, "
+        "? + (1 - ?) * " + RANDOM_POSITION + " FROM images WHERE " + cond,
+        (bag, cursor, cursor, *args),
+    )
+
+
+def random_image(
+    img_dir,
+    current=None,
+    recursive=False,
+    rebuild=False,
+    cache_dir=CACHE_DIR,
+    filters=None,
+):
+    """Draw the next image matching filters of img_dir's shuffle bag,
+    current (the wallpaper) is skipped unless it's the only one.
+    None when there are no images."""
+    conn, cond, args, listed = refresh(img_dir, recursive, rebuild, cache_dir)
+    bag = "%s:%s" % ("recursive" if recursive else "dir",
+                     os.path.abspath(img_dir))
+    row = conn.execute(
+        "SELECT position FROM cursors WHERE bag = ?", (bag,)
+    ).fetchone()
+
+    with conn:
+        # The bag holds every image, filters only apply when drawing.
+        if not row:
+            cursor = 0.0
+            fill_bag(conn, bag, cursor, cond, args)
+        else:
+            cursor = row[0]
+            for path in listed:
+                fill_bag(conn, bag, cursor, "dir = ?", (path,))
+
+        img = draw(conn, bag, cursor, cond, args, current, filters)
+
+    return img
+
+
+def draw(conn, bag, cursor, cond, args, current=None, filters=None):
+    """Take the image matching filters after cursor out of a bag,
+    shuffling the bag again with every image matching cond at the end
+    of a cycle."""
+    filter_cond, filter_args = filter_sql(filters)
+    shuffled = False
+    fallback = None
+
+    while True:
+        row = conn.execute(
+            "SELECT bags.path, position FROM bags "
+            "JOIN images ON images.path = bags.path "
+            "WHERE bag = ? AND position > ? AND %s "
+            "ORDER BY position LIMIT 1" % filter_cond,
+            (bag, cursor, *filter_args),
+        ).fetchone()
+
+        if not row:
+            if shuffled:
+                img = fallback
+                break
+
+            # Images removed from the index leave the bag here, and the
+            # ones another command indexed first join it.
+            conn.execute(
+                "DELETE FROM bags WHERE bag = ? AND path NOT IN "
+                "(SELECT path FROM images)",
+                (bag,),
+            )
+            fill_bag(conn, bag, 0.0, cond, args)
+            conn.execute(
+                "UPDATE bags SET position = " + RANDOM_POSITION
+                + " WHERE bag = ?",
+                (bag,),
+            )
+            cursor = 0.0
+            shuffled = True
+            continue
+
+        img, cursor = row
+
+        if img == current:
+            fallback = img
+            continue
+
+        break
+
+    conn.execute(
+        "INSERT OR REPLACE INTO cursors VALUES (?, ?)", (bag, cursor)
+    )
+    return img
@@ -0,0 +1,44 @@
+"""
+Collect timings and counters of the current run.
+"""
+
+import collections
+import contextlib
+import logging
+import time
+
+
+# Events kept, the oldest are dropped so long runs don't grow.
+MAX_EVENTS = 4096
+
+EVENTS = collections.deque(maxlen=MAX_EVENTS)
+
+
+def record(kind, name, seconds=None, **fields):
+    """Record an event, ie: a subprocess or a backend iteration."""
+    event = {"kind": kind, "name": name, "seconds": seconds, **fields}
+    EVENTS.append(event)
+    logging.debug("%s %s %s", kind, name, fields)
+    return event
+
+
+@contextlib.contextmanager
+def timer(kind, name, **fields):
+    """Time the body of a with statement, the yielded dict can be
+    filled with extra fields while it runs."""
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record(kind, name, time.perf_counter() - start, **fields)
+
+
+def events(kind=None):
+    """Events recorded so far (the last MAX_EVENTS), optionally only of
+    one kind."""
+    return [event for event in EVENTS if kind in (None, event["kind"])]
+
+
+def reset():
+    """Forget all recorded events."""
+    EVENTS.clear()
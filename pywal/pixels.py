@@ -0,0 +1,261 @@
+"""
+Decode images into pixels for the in-process backends.
+"""
+
+import argparse
+import collections
+import importlib.util
+import logging
+import random
+import shutil
+import time
+
+from . import instrument
+from . import runner
+
+
+# Pillow is only imported to decode, it's slow to import.
+has_pil = importlib.util.find_spec("PIL") is not None
+
+MAX_PIXELS = 512 * 1024
+MAX_MEMORY = 64 * 1024**2
+
+PASSES = 8
+CONFIDENCE = 0.9
+
+
+def load(img, max_pixels=MAX_PIXELS, samples=0, budget=None):
+    """Decode img into packed 8 bit RGB bytes, downscaled to at most
+    max_pixels. JPEGs are scaled down while decoding.
+
+    With samples only a stratified sample of that many pixels, taken
+    in at most budget milliseconds, is returned, see sample()."""
+    from PIL import Image
+
+    with Image.open(img) as image:
+        image.seek(0)
+        width, height = image.size
+        scale = max((width * height / max_pixels) ** 0.5, 1)
+        size = (max(int(width / scale), 1), max(int(height / scale), 1))
+
+        image.draft("RGB", size)
+        image = image.convert("RGB")
+
+        if image.size != size:
+            image = image.resize(size, Image.Resampling.BOX)
+
+        logging.debug("Decoded %s at %sx%s.", img, *image.size)
+        data = image.tobytes()
+
+    if not samples:
+        return data
+
+    with instrument.timer("pixels", img) as event:
+        data, event["confidence"] = sample(data, *size, samples, budget)
+        event["pixels"] = len(data) // 3
+
+    logging.info(
+        "Sampled %s pixels, confidence %.2f.",
+        event["pixels"],
+        event["confidence"],
+    )
+    return data
+
+
+def histogram(data):
+    """Share of the pixels in each cell of an 8x8x8 color histogram."""
+    counts = collections.Counter(
+        (r >> 5) << 6 | (g >> 5) << 3 | b >> 5
+        for r, g, b in iter_pixels(data)
+    )
+    total = sum(counts.values())
+    return {cell: count / total for cell, count in counts.items()}
+
+
+def agreement(data, data2):
+    """Histogram intersection of two sets of pixels, 1.0 when their
+    colors are spread the same way and 0.0 when they share none."""
+    hist = histogram(data)
+    hist2 = histogram(data2)
+    return sum(min(share, hist2.get(cell, 0)) for cell, share in hist.items())
+
+
+def sample(data, width, height, count, budget=None, rng_seed=0):
+    """Stratified sample of up to count pixels of a width x height image.
+
+    The image is split in a grid of about count / PASSES cells and every
+    pass takes one random pixel of each cell, so small accent regions
+    are sampled as often as their area warrants. Sampling stops early
+    once two halves of the sample agree on the colors (CONFIDENCE) or
+    after budget milliseconds, checked between passes.
+
+    Returns (pixels, confidence), confidence is the agreement of the
+    two halves, a low value means more samples would change the palette.
+    """
+    if count >= width * height:
+        return data, 1.0
+
+    rng = random.Random(rng_seed)
+    cells = max(count // PASSES, 1)
+    grid_w = min(max(round((cells * width / height) ** 0.5), 1), width)
+    grid_h = min(max(cells // grid_w, 1), height)
+    cols = [(width * x // grid_w, width * (x + 1) // grid_w)
+            for x in range(grid_w)]
+    rows = [(height * y // grid_h, height * (y + 1) // grid_h)
+            for y in range(grid_h)]
+
+    start = time.perf_counter()
+    # Cells go to either half like the squares of a checkerboard,
+    # swapping colors every pass.
+    halves = (bytearray(), bytearray())
+    confidence = 0.0
+
+    for done in range(1, PASSES + 1):
+        for y, (y0, y1) in enumerate(rows):
+            for x, (x0, x1) in enumerate(cols):
+                i = (rng.randrange(y0, y1) * width + rng.randrange(x0, x1)) * 3
+                halves[(x + y + done) & 1].extend(data[i:i + 3])
+
+        if halves[0] and halves[1]:
+            confidence = agreement(*halves)
+
+        if confidence >= CONFIDENCE:
+            break
+
+        if budget and (time.perf_counter() - start) * 1000 >= budget:
+            break
+
+    return bytes(halves[0] + halves[1]), confidence
+
+
+def sample_spec(spec):
+    """Parse the --samples "count[:ms]" argument."""
+    count, _, budget = spec.partition(":")
+
+    try:
+        return int(count), float(budget) if budget else None
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected count[:ms]") from None
+
+
+def iter_pixels(data):
+    """Iterate over the (r, g, b) tuples of packed RGB bytes."""
+    return zip(data[0::3], data[1::3], data[2::3])
+
+
+def magick_command(tool):
+    """argv prefix to run an ImageMagick tool, None if it's missing."""
+    if shutil.which("magick"):
+        return ["magick", tool]
+
+    if shutil.which(tool):
+        return [tool]
+
+    return None
+
+
+def image_size(img):
+    """Width and height of the first frame, read from the header."""
+    if has_pil:
+        from PIL import Image
+
+        with Image.open(img) as image:
+            return image.size
+
+    identify = magick_command("identify")
+    if not identify:
+        raise runner.CommandNotFound(["identify"])
+
+    out = runner.run([*identify, "-format", "%w %h", img + "[0]"])
+    width, height = out.split()[:2]
+    return int(width), int(height)
+
+
+def thumbnail(img, width, height):
+    """Packed 8 bit RGB bytes of the first frame of img squashed to
+    width x height, JPEGs are scaled down while decoding."""
+    if has_pil:
+        from PIL import Image
+
+        with Image.open(img) as image:
+            image.seek(0)
+            image.draft("RGB", (width, height))
+            image = image.convert("RGB").resize(
+                (width, height), Image.Resampling.BOX
+            )
+            return image.tobytes()
+
+    convert = magick_command("convert")
+    if not convert:
+        raise runner.CommandNotFound(["convert"])
+
+    if convert[0] == "magick":
+        convert = ["magick"]
+
+    return runner.run(
+        [
+            *convert,
+            img + "[0]",
+            "-resize",
+            "%sx%s!" % (width, height),
+            "-depth",
+            "8",
+            "rgb:-",
+        ],
+        memo=False,
+    )
+
+
+def stream_rows(img, max_memory=MAX_MEMORY):
+    """Decode img into strips of packed RGB rows while holding at most
+    about max_memory bytes of pixels.
+
+    Returns (width, height, strips), ImageMagick's stream tool reads the
+    image a few rows at a time. Without it Pillow is used, JPEGs are then
+    scaled down while decoding to fit max_memory but other formats have
+    to be decoded whole first."""
+    stream = magick_command("stream")
+
+    if stream:
+        width, height = image_size(img)
+        rows = max(max_memory // 2 // (width * 3), 1)
+        argv = [
+            *stream,
+            "-map",
+            "rgb",
+            "-storage-type",
+            "char",
+            img + "[0]",
+            "-",
+        ]
+        return width, height, runner.stream(argv, rows * width * 3)
+
+    if not has_pil:
+        raise runner.CommandNotFound(["stream"])
+
+    from PIL import Image
+
+    image = Image.open(img)
+    width, height = image.size
+    scale = max((width * height * 3 / max_memory) ** 0.5, 1)
+    size = (max(int(width / scale), 1), max(int(height / scale), 1))
+
+    image.draft("RGB", size)
+    if image.format != "JPEG" and scale > 1:
+        logging.warning(
+            "%s can't be decoded in %s MiB without ImageMagick's stream.",
+            image.format,
+            max_memory // 1024**2,
+        )
+
+    image = image.convert("RGB")
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.BOX)
+
+    def strips():
+        rows = max(max_memory // 4 // (size[0] * 3), 1)
+        for y in range(0, size[1], rows):
+            box = (0, y, size[0], min(y + rows, size[1]))
+            yield image.crop(box).tobytes()
+
+    return size[0], size[1], strips()
@@ -0,0 +1,187 @@
+"""
+Precompute the colorschemes of a wallpaper library.
+
+    wal --precompute DIR [--recursive] [--jobs N] [--backend wal,wu] [-l]
+
+Every image gets a colorscheme for each backend with the options given
+on the command line, so later 'wal -i DIR' runs with the same options
+hit the cache. Images already in the cache are skipped, an interrupted
+run picks up where it left off.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import time
+
+try:
+    import resource
+
+except ImportError:
+    resource = None
+
+from .settings import CACHE_DIR
+from . import cache
+from . import colors
+from . import duplicates
+from . import image
+
+
+# Address space allowed to each worker, in bytes.
+MEMORY_LIMIT = int(os.getenv("PYWAL_PRECOMPUTE_MEMORY", 2048)) * 1024**2
+# Seconds between progress reports.
+REPORT_EVERY = 5.0
+
+
+def init_worker(memory_limit):
+    """Set up a worker process like the wal process that started it."""
+    if resource and memory_limit:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            memory_limit = min(memory_limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def scheme(
+    img, backend, light, sat, c16, cst, cache_dir=CACHE_DIR, samples=None
+):
+    """Generate and cache one colorscheme unless it's cached already.
+    Returns "cached", "generated", "reused" when the colorscheme of a
+    near-duplicate was cached, or the error that stopped it."""
+    options = cache.options_key(
+        backend,
+        light,
+        sat,
+        c16=c16,
+        cst=cst,
+        samples=samples[0] if samples else 0,
+    )
+
+    # Like colors.get() but without counting lookups in the cache stats.
+    try:
+        if cache.get(img, options, cache_dir, record=False):
+            return "cached"
+
+        with cache.lock(img, options, cache_dir):
+            if cache.get(img, options, cache_dir, record=False):
+                return "cached"
+
+            scheme_dict = duplicates.reuse(img, options, cache_dir)
+            if scheme_dict:
+                cache.put(img, options, scheme_dict, cache_dir)
+                return "reused"
+
+            scheme_dict = colors.generate(
+                img, light, backend, cache_dir, sat,
+                c16=c16, cst=cst, samples=samples,
+            )
+            cache.put(img, options, scheme_dict, cache_dir)
+
+    # Backends exit when their library is missing.
+    except (Exception, SystemExit) as err:
+        return "error: %s" % (str(err) or type(err).__name__)
+
+    return "generated"
+
+
+def worker_count(jobs=None, memory_limit=MEMORY_LIMIT):
+    """Number of workers, one per cpu unless that many can't get
+    memory_limit of memory each."""
+    jobs = jobs or os.cpu_count() or 1
+
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, OSError, ValueError):
+        return jobs
+
+    if memory_limit:
+        jobs = min(jobs, max(memory // memory_limit, 1))
+
+    return jobs
+
+
+def run(
+    img_dir,
+    backends,
+    light=False,
+    sat="",
+    c16=False,
+    cst="",
+    recursive=False,
+    jobs=None,
+    memory_limit=MEMORY_LIMIT,
+    cache_dir=CACHE_DIR,
+    filters=None,
+    samples=None,
+):
+    """Cache the colorschemes of every image in img_dir matching filters
+    for every backend in parallel, sampling (count, ms) pixels with the
+    backends that can. Returns the count of each result."""
+    images = image.list_images(
+        img_dir, recursive, cache_dir=cache_dir, filters=filters
+    )
+    tasks = [(img, backend) for img in images for backend in backends]
+    jobs = worker_count(jobs, memory_limit)
+    counts = collections.Counter()
+
+    if not tasks:
+        logging.error("No images found in directory.")
+        return counts
+
+    logging.info(
+        "Precomputing %s colorschemes of %s images with %s processes.",
+        len(tasks),
+        len(images),
+        jobs,
+    )
+
+    start = reported = time.perf_counter()
+    pool = concurrent.futures.ProcessPoolExecutor(
+        jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(memory_limit,),
+    )
+
+    with pool:
+        futures = {
+            pool.submit(
+                scheme, img, backend, light, sat, c16, cst, cache_dir,
+                samples,
+            ): (img, backend)
+            for img, backend in tasks
+        }
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                result = "error: a worker process died"
+
+            if result.startswith("error"):
+                logging.warning("%s (%s): %s", *futures[future], result[7:])
+                result = "error"
+
+            counts[result] += 1
+            done = sum(counts.values())
+            now = time.perf_counter()
+
+            if now - reported >= REPORT_EVERY or done == len(tasks):
+                reported = now
+                logging.info(
+                    "%s/%s colorschemes, %.1f/s, "
+                    "%s generated, %s reused, %s cached, %s failed.",
+                    done,
+                    len(tasks),
+                    done / (now - start),
+                    counts["generated"],
+                    counts["reused"],
+                    counts["cached"],
+                    counts["error"],
+                )
+
+    return counts
@@ -0,0 +1,226 @@
+"""
+Backend registry.
+
+Backends are described here without being imported, importing one of
+the optional backends exits when its library is missing so availability
+is checked through importlib and the PATH instead.
+
+Third party backends are discovered through the "pywal.backends" entry
+point group, the entry point name is the backend name and its value the
+module implementing the usual "get(img, light, **kwargs)" function.
+"""
+
+import importlib
+import importlib.metadata
+import importlib.util
+import logging
+import shutil
+
+ENTRY_POINT_GROUP = "pywal.backends"
+
+_BACKENDS = {}
+
+
+def has_module(mod):
+    """Check that a python module can be imported without importing it."""
+    try:
+        return importlib.util.find_spec(mod) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class BackendError(Exception):
+    """A backend couldn't generate a palette from an image."""
+
+
+class Backend:
+    """A color backend and what it needs to run.
+
+    requires:    python modules that must all be importable.
+    commands:    executables, at least one of them must be in PATH.
+    fallbacks:   python modules that can stand in for the commands,
+                 one of them being importable is enough.
+    subprocess:  the backend spawns external processes.
+    pixels:      the backend decodes through pixels.load() and takes
+                 the --samples option.
+    thread_safe: the backend keeps no global state between calls.
+    """
+
+    def __init__(
+        self,
+        name,
+        module,
+        requires=(),
+        commands=(),
+        fallbacks=(),
+        subprocess=False,
+        pixels=False,
+        thread_safe=False,
+        builtin=True,
+    ):
+        self.name = name
+        self.module = module
+        self.requires = tuple(requires)
+        self.commands = tuple(commands)
+        self.fallbacks = tuple(fallbacks)
+        self.subprocess = subprocess
+        self.pixels = pixels
+        self.thread_safe = thread_safe
+        self.builtin = builtin
+
+    def __repr__(self):
+        return "Backend(%r, %r)" % (self.name, self.module)
+
+    @property
+    def available(self):
+        """Check the backend dependencies without importing it."""
+        if not all(map(has_module, self.requires)):
+            return False
+
+        if self.commands:
+            return any(shutil.which(cmd) for cmd in self.commands) or any(
+                map(has_module, self.fallbacks)
+            )
+
+        return True
+
+    def load(self):
+        """Import the backend module."""
+        return importlib.import_module(self.module)
+
+
+BUILTIN = [
+    Backend(
+        "wal",
+        "pywal.backends.wal",
+        commands=("magick", "convert"),
+        subprocess=True,
+        thread_safe=True,
+    ),
+    Backend(
+        "colorthief",
+        "pywal.backends.colorthief",
+        requires=("colorthief",),
+        thread_safe=True,
+    ),
+    Backend(
+        "colorz",
+        "pywal.backends.colorz",
+        requires=("colorz",),
+        thread_safe=True,
+    ),
+    Backend(
+        "fast_colorthief",
+        "pywal.backends.fast_colorthief",
+        requires=("fast_colorthief",),
+        thread_safe=True,
+    ),
+    Backend(
+        "haishoku",
+        "pywal.backends.haishoku",
+        requires=("haishoku",),
+        thread_safe=True,
+    ),
+    Backend(
+        "modern_colorthief",
+        "pywal.backends.modern_colorthief",
+        requires=("modern_colorthief",),
+        thread_safe=True,
+    ),
+    Backend(
+        "okthief",
+        "pywal.backends.okthief",
+        commands=("okthief",),
+        subprocess=True,
+        thread_safe=True,
+    ),
+    Backend(
+        "schemer2",
+        "pywal.backends.schemer2",
+        commands=("schemer2",),
+        subprocess=True,
+        thread_safe=True,
+    ),
+    Backend(
+        "octree",
+        "pywal.backends.octree",
+        commands=("magick", "stream"),
+        fallbacks=("PIL",),
+        subprocess=True,
+        thread_safe=True,
+    ),
+    Backend(
+        "kmeans",
+        "pywal.backends.kmeans",
+        requires=("PIL",),
+        pixels=True,
+        thread_safe=True,
+    ),
+    Backend(
+        "wu",
+        "pywal.backends.wu",
+        requires=("PIL",),
+        pixels=True,
+        thread_safe=True,
+    ),
+]
+
+
+def entry_point_backends():
+    """Backends registered by other packages, nothing gets imported."""
+    found = []
+
+    try:
+        entry_points = importlib.metadata.entry_points(group=ENTRY_POINT_GROUP)
+    except Exception as err:  # broken metadata shouldn't break wal
+        logging.warning("Couldn't read backend entry points: %s", err)
+        return found
+
+    for entry in entry_points:
+        found.append(
+            Backend(
+                entry.name,
+                entry.module,
+                requires=(entry.module.split(".")[0],),
+                builtin=False,
+            )
+        )
+
+    return found
+
+
+def backends():
+    """All known backends by name, built-in ones take precedence."""
+    if not _BACKENDS:
+        for backend in BUILTIN:
+            _BACKENDS[backend.name] = backend
+
+        for backend in entry_point_backends():
+            _BACKENDS.setdefault(backend.name, backend)
+
+    return _BACKENDS
+
+
+def names():
+    """Names of all known backends."""
+    return list(backends())
+
+
+def available():
+    """Names of the backends whose dependencies are present."""
+    return [name for name, backend in backends().items() if backend.available]
+
+
+def get(name):
+    """Get a backend by name, None if it is unknown."""
+    return backends().get(name)
+
+
+def load(name):
+    """Import a backend module by name."""
+    backend = get(name)
+
+    if not backend:
+        raise ImportError("No backend named '%s'." % name)
+
+    return backend.load()
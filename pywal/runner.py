@@ -0,0 +1,325 @@
+"""
+Run external tools.
+
+Every external program used to generate colors goes through run(), it
+enforces a timeout and an output size limit, can apply cpu and memory
+rlimits to the child, reports its timing to the instrumentation and
+memoizes the output by (argv, checksum of the input file).
+
+The memoized outputs are kept in CACHE_DIR/runs/ up to MEMO_MAX_SIZE,
+the least recently used ones are evicted with the cached colorschemes
+(see cache.evict()).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+try:
+    import resource
+
+except ImportError:
+    resource = None
+
+from .settings import CACHE_DIR
+from . import instrument
+from . import util
+
+
+TIMEOUT = 120
+MAX_OUTPUT = 8 * 1024**2
+MEMO_MAX_SIZE = 64 * 1024**2
+MEMO_DIR = "runs"
+
+# Set to False to always run the commands, ie: when benchmarking them.
+MEMO = True
+# Outputs also kept in memory, the oldest are dropped first.
+MEMO_ENTRIES = 64
+
+_MEMO = {}
+_COUNTS = {"memo_hits": 0}
+
+
+class RunnerError(Exception):
+    """An external command couldn't produce an output."""
+
+    def __init__(self, argv, message):
+        super().__init__(message)
+        self.argv = argv
+
+
+class CommandNotFound(RunnerError):
+    """The command isn't installed."""
+
+    def __init__(self, argv):
+        super().__init__(argv, "%s wasn't found on your system." % argv[0])
+
+
+class CommandFailed(RunnerError):
+    """The command exited with an error."""
+
+    def __init__(self, argv, returncode, stderr=b""):
+        super().__init__(
+            argv,
+            "%s exited with status %s: %s"
+            % (
+                argv[0],
+                returncode,
+                stderr.decode("utf-8", "replace").strip()[-500:],
+            ),
+        )
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class CommandTimeout(RunnerError):
+    """The command took too long."""
+
+    def __init__(self, argv, timeout):
+        super().__init__(
+            argv, "%s timed out after %s seconds." % (argv[0], timeout)
+        )
+        self.timeout = timeout
+
+
+class OutputTooLarge(RunnerError):
+    """The command printed more than allowed."""
+
+    def __init__(self, argv, max_output):
+        super().__init__(
+            argv, "%s printed more than %s bytes." % (argv[0], max_output)
+        )
+        self.max_output = max_output
+
+
+def memo_key(argv, input_file, cache_dir=CACHE_DIR):
+    """Key for the memoized output of a command."""
+    checksum = (
+        util.get_img_checksum(input_file, cache_dir) if input_file else None
+    )
+    key = json.dumps([shutil.which(argv[0]), argv[1:], checksum])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def set_limits(cpu_limit, memory_limit):
+    """Build the preexec_fn applying the rlimits in the child."""
+    if not resource or not (cpu_limit or memory_limit):
+        return None
+
+    def apply_limits():
+        if cpu_limit:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+        if memory_limit:
+            resource.setrlimit(
+                resource.RLIMIT_AS, (memory_limit, memory_limit)
+            )
+
+    return apply_limits
+
+
+def read_pipe(pipe, chunks, max_output, proc, overflow):
+    """Read a pipe into chunks, kill the process past max_output."""
+    size = 0
+
+    for chunk in iter(lambda: pipe.read1(1 << 16), b""):
+        size += len(chunk)
+
+        if size > max_output:
+            overflow.set()
+            proc.kill()
+            break
+
+        chunks.append(chunk)
+
+    pipe.close()
+
+
+def communicate(argv, proc, timeout, max_output):
+    """Wait for the process and collect its bounded stdout and stderr."""
+    overflow = threading.Event()
+    output = {"stdout": [], "stderr": []}
+    readers = [
+        threading.Thread(
+            target=read_pipe,
+            args=(pipe, output[name], max_output, proc, overflow),
+            daemon=True,
+        )
+        for name, pipe in (("stdout", proc.stdout), ("stderr", proc.stderr))
+        if pipe
+    ]
+
+    for reader in readers:
+        reader.start()
+
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise CommandTimeout(argv, timeout) from None
+    finally:
+        for reader in readers:
+            reader.join()
+
+    if overflow.is_set():
+        raise OutputTooLarge(argv, max_output)
+
+    return b"".join(output["stdout"]), b"".join(output["stderr"])
+
+
+def run(
+    argv,
+    input_file=None,
+    timeout=TIMEOUT,
+    max_output=MAX_OUTPUT,
+    cpu_limit=None,
+    memory_limit=None,
+    merge_stderr=False,
+    memo=True,
+    cache_dir=CACHE_DIR,
+):
+    """Run argv and return its stdout as bytes.
+
+    input_file:   the file the command reads, its checksum is part of the
+                  memo key so the output is kept across runs.
+    cpu_limit:    cpu seconds allowed to the child.
+    memory_limit: address space in bytes allowed to the child.
+    """
+    key = memo_key(argv, input_file, cache_dir) if memo and MEMO else None
+    memo_file = os.path.join(cache_dir, MEMO_DIR, key) if key else None
+
+    if key in _MEMO:
+        memo_hit(argv)
+        return _MEMO[key]
+
+    if memo_file and input_file and os.path.isfile(memo_file):
+        with open(memo_file, "rb") as cached:
+            remember(key, cached.read())
+        # The mtime orders the memo for eviction.
+        os.utime(memo_file)
+        memo_hit(argv)
+        return _MEMO[key]
+
+    if not shutil.which(argv[0]):
+        raise CommandNotFound(argv)
+
+    with instrument.timer("subprocess", argv[0], cached=False) as event:
+        try:
+            proc = subprocess.Popen(
+                argv,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE,
+                preexec_fn=set_limits(cpu_limit, memory_limit),
+            )
+        except OSError as err:
+            raise RunnerError(argv, str(err)) from err
+
+        stdout, stderr = communicate(argv, proc, timeout, max_output)
+        event["returncode"] = proc.returncode
+        event["bytes"] = len(stdout)
+
+    if proc.returncode != 0:
+        raise CommandFailed(argv, proc.returncode, stderr or stdout)
+
+    if key:
+        remember(key, stdout)
+
+        if input_file:
+            util.create_dir(os.path.dirname(memo_file))
+            with open(memo_file + ".tmp", "wb") as cached:
+                cached.write(stdout)
+            os.replace(memo_file + ".tmp", memo_file)
+
+    return stdout
+
+
+def remember(key, output):
+    """Keep the output of a command in memory, up to MEMO_ENTRIES."""
+    _MEMO[key] = output
+
+    while len(_MEMO) > MEMO_ENTRIES:
+        del _MEMO[next(iter(_MEMO))]
+
+
+def memo_hit(argv):
+    """Count a command answered from the memo."""
+    _COUNTS["memo_hits"] += 1
+    instrument.record("subprocess", argv[0], 0.0, cached=True)
+
+
+def memo_hits():
+    """Number of commands answered from the memo so far, compared
+    before and after a backend runs to tell whether it really ran."""
+    return _COUNTS["memo_hits"]
+
+
+def evict_memo(cache_dir=CACHE_DIR, max_size=MEMO_MAX_SIZE, max_age=None):
+    """Delete the least recently used memoized outputs until they fit
+    in max_size bytes, and the ones unused for max_age seconds.
+    Returns how many were deleted."""
+    return util.evict_files(
+        os.path.join(cache_dir, MEMO_DIR), max_size, max_age
+    )
+
+
+def stream(
+    argv,
+    chunk_size,
+    timeout=TIMEOUT,
+    cpu_limit=None,
+    memory_limit=None,
+):
+    """Run argv and yield its stdout in chunk_size pieces, for output
+    too large to be held in memory. Nothing is memoized."""
+    if not shutil.which(argv[0]):
+        raise CommandNotFound(argv)
+
+    with instrument.timer(
+        "subprocess", argv[0], cached=False, streamed=True
+    ) as event, tempfile.TemporaryFile() as stderr:
+        try:
+            proc = subprocess.Popen(
+                argv,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                preexec_fn=set_limits(cpu_limit, memory_limit),
+            )
+        except OSError as err:
+            raise RunnerError(argv, str(err)) from err
+
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        killer = threading.Timer(timeout, kill)
+        killer.start()
+        event["bytes"] = 0
+
+        try:
+            for chunk in iter(lambda: proc.stdout.read(chunk_size), b""):
+                event["bytes"] += len(chunk)
+                yield chunk
+            proc.wait()
+        finally:
+            killer.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+
+        event["returncode"] = proc.returncode
+
+        if timed_out.is_set():
+            raise CommandTimeout(argv, timeout)
+
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise CommandFailed(argv, proc.returncode, stderr.read())
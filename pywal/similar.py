@@ -0,0 +1,253 @@
+"""
+Pick wallpapers by palette.
+
+    wal -i DIR --select similar|different
+
+The images of DIR with a cached colorscheme for the current options
+(see 'wal --precompute') are compared to the current colors.json, each
+palette being the 16 colors in OKLab as a 48 value vector. The closest
+or farthest one is picked with a brute-force distance computation over
+all of them, vectorized with NumPy when it's installed. The last RECENT
+picks are skipped so "similar" doesn't go back and forth between two
+images.
+
+The vectors are computed once per cached colorscheme and kept in the
+palettes table of the scheme store. The matrix of the vectors of a
+directory is saved to CACHE_DIR/palettes/ and reused until the index
+or the paths and palettes of the store change (their generations), so
+a pick reads one file instead of joining every image with its palette.
+The least recently used snapshots are evicted with the cache.
+"""
+
+import array
+import hashlib
+import heapq
+import json
+import logging
+import os
+
+from .settings import CACHE_DIR, __cache_version__
+from . import cache
+from . import codec
+from . import index
+from . import util
+
+
+MODES = ("similar", "different")
+FEATURES = 16 * 3
+RECENT = 16
+RECENT_FILE = "recent.json"
+
+
+def features(scheme):
+    """OKLab values of the 16 colors of a colorscheme as float32s."""
+    values = array.array("f")
+
+    for i in range(16):
+        color = util.hex_to_rgb(scheme["colors"]["color%s" % i])
+        values.extend(util.rgb_to_oklab(color))
+
+    return values.tobytes()
+
+
+def palette_count(conn, options):
+    """Number of cached colorschemes and palettes of options."""
+    return (
+        conn.execute(
+            "SELECT count(*) FROM schemes WHERE options = ? AND version = ?",
+            (options, __cache_version__),
+        ).fetchone()[0],
+        conn.execute(
+            "SELECT count(*) FROM palettes WHERE options = ?", (options,)
+        ).fetchone()[0],
+    )
+
+
+def backfill(options, cache_dir=CACHE_DIR):
+    """Compute the features of the cached colorschemes of options that
+    don't have them yet. Returns how many were computed."""
+    conn = cache.connect(cache_dir)
+    schemes, palettes = palette_count(conn, options)
+    if schemes == palettes:
+        return 0
+
+    rows = conn.execute(
+        "SELECT checksum, scheme FROM schemes "
+        "WHERE options = ? AND version = ? AND checksum NOT IN "
+        "(SELECT checksum FROM palettes WHERE options = ?)",
+        (options, __cache_version__, options),
+    ).fetchall()
+    palettes = []
+
+    for checksum, data in rows:
+        try:
+            palettes.append((checksum, options, features(codec.decode(data))))
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO palettes VALUES (?, ?, ?)", palettes
+        )
+        if palettes:
+            cache.bump(conn)
+
+    return len(palettes)
+
+
+def candidates(conn, cond, args, options, filters=None):
+    """Paths and packed features of the images of an index condition
+    matching filters that have a cached palette for options."""
+    filter_cond, filter_args = index.filter_sql(filters)
+
+    rows = conn.execute(
+        "SELECT images.path, palettes.features FROM images "
+        "JOIN store.paths AS paths ON paths.path = images.path "
+        "JOIN store.palettes AS palettes "
+        "ON palettes.options = ? AND palettes.checksum = paths.checksum "
+        "WHERE %s AND %s" % (cond, filter_cond),
+        (options, *args, *filter_args),
+    ).fetchall()
+
+    return [row[0] for row in rows], b"".join(row[1] for row in rows)
+
+
+def snapshot(
+    img_dir,
+    options,
+    recursive=False,
+    rebuild=False,
+    cache_dir=CACHE_DIR,
+    filters=None,
+):
+    """Paths and packed features of the images of img_dir matching
+    filters that have a cached palette for options, read from the last
+    snapshot when neither the index nor the palettes changed since."""
+    backfill(options, cache_dir)
+    store = cache.connect(cache_dir)
+    conn, cond, args, _ = index.refresh(img_dir, recursive, rebuild, cache_dir)
+    index.attach(conn, cache_dir)
+
+    key = json.dumps(
+        [os.path.abspath(img_dir), recursive, options, filters],
+        sort_keys=True,
+    )
+    stamp = [index.generation(conn), cache.generation(store)]
+    name = hashlib.sha256(key.encode()).hexdigest()[:32] + ".bin"
+    path = os.path.join(cache_dir, cache.SNAPSHOT_DIR, name)
+
+    try:
+        with open(path, "rb") as file:
+            header = json.loads(file.readline())
+            if header["stamp"] == stamp:
+                paths = file.read(header["paths"]).decode().split("\0")
+                vectors = file.read()
+                # Snapshots are evicted least recently used first.
+                os.utime(path)
+                return [p for p in paths if p], vectors
+    except (OSError, ValueError, KeyError, UnicodeDecodeError):
+        pass
+
+    paths, vectors = candidates(conn, cond, args, options, filters)
+    data = "\0".join(paths).encode()
+    header = {"stamp": stamp, "paths": len(data)}
+
+    util.create_dir(os.path.dirname(path))
+    with open(path + ".tmp", "wb") as file:
+        file.write(json.dumps(header).encode() + b"\n")
+        file.write(data)
+        file.write(vectors)
+    os.replace(path + ".tmp", path)
+
+    return paths, vectors
+
+
+def ranking(target, vectors, mode="similar", count=1):
+    """Indexes of the count packed vectors closest to target, or the
+    farthest for "different", best first."""
+    # NumPy is only imported for a pick, it's slow to import.
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    if numpy:
+        matrix = numpy.frombuffer(vectors, numpy.float32)
+        diff = matrix.reshape(-1, FEATURES) - numpy.frombuffer(
+            target, numpy.float32
+        )
+        dists = numpy.einsum("ij,ij->i", diff, diff)
+        if mode == "different":
+            dists = -dists
+
+        count = min(count, len(dists))
+        best = numpy.argpartition(dists, count - 1)[:count]
+        return best[numpy.argsort(dists[best])].tolist()
+
+    point = array.array("f", target)
+    values = array.array("f", vectors)
+    dists = []
+    for i in range(0, len(values), FEATURES):
+        dists.append(
+            sum((x - y) ** 2 for x, y in zip(values[i:i + FEATURES], point))
+        )
+
+    pick_best = heapq.nlargest if mode == "different" else heapq.nsmallest
+    return pick_best(count, range(len(dists)), key=dists.__getitem__)
+
+
+def current_features(cache_dir=CACHE_DIR):
+    """Features of the current colors.json, None without one."""
+    try:
+        scheme = util.read_file_json(os.path.join(cache_dir, "colors.json"))
+        return features(scheme)
+    except (OSError, KeyError, TypeError, ValueError):
+        return None
+
+
+def recent(cache_dir=CACHE_DIR):
+    """The last wallpapers picked by palette, newest last."""
+    try:
+        return util.read_file_json(os.path.join(cache_dir, RECENT_FILE))
+    except (OSError, ValueError):
+        return []
+
+
+def pick(
+    img_dir,
+    mode,
+    options,
+    current=None,
+    recursive=False,
+    rebuild=False,
+    cache_dir=CACHE_DIR,
+    filters=None,
+):
+    """Image of img_dir whose cached palette is the closest to (or
+    farthest from) the current colorscheme, skipping current and the
+    recent picks when there are others. None when there is no current
+    colorscheme or no image with a cached palette."""
+    target = current_features(cache_dir)
+    if target is None:
+        return None
+
+    paths, vectors = snapshot(
+        img_dir, options, recursive, rebuild, cache_dir, filters
+    )
+    if not paths:
+        return None
+
+    history = recent(cache_dir)
+    skipped = set(history)
+    skipped.add(current)
+    order = ranking(target, vectors, mode, len(skipped) + 1)
+
+    img = next((paths[i] for i in order if paths[i] not in skipped), None)
+    if not img:
+        img = next((paths[i] for i in order if paths[i] != current),
+                   paths[order[0]])
+
+    logging.info("Picked the most %s palette of %s.", mode, len(paths))
+    history = [path for path in history if path != img][1 - RECENT:]
+    util.save_file_json(history + [img], os.path.join(cache_dir, RECENT_FILE))
+    return img
@@ -97,8 +97,11 @@ def terminal_sexy_to_wal(data):
 
 def parse(theme_file):
     """Parse the theme file."""
-    data = util.read_file_json(theme_file)
+    return normalize(util.read_file_json(theme_file))
 
+
+def normalize(data):
+    """Fill in the defaults of parsed theme data."""
     if "checksum" not in data:
         data["checksum"] = "None"
 
@@ -13,6 +13,12 @@ import subprocess
 import sys
 import hashlib
 import copy
+import mmap
+import sqlite3
+import time
+
+from . import runner
+from .settings import CACHE_DIR
 
 has_fcntl = False
 fcntl_warning = ""
@@ -27,6 +33,19 @@ except ImportError:
         "program could hang indefinitely",
     )
 
+CHECKSUM_DB = "checksums.db"
+# Checksums kept, enough for the largest wallpaper libraries.
+CHECKSUM_MEMO_SIZE = 250000
+# Seconds between updates of the last use of a checksum.
+CHECKSUM_TOUCH = 24 * 3600
+# The memo is trimmed every time this many checksums were added.
+CHECKSUM_PRUNE = 1024
+_CHECKSUMS = {}
+
+FINGERPRINT = os.getenv("PYWAL_FINGERPRINT", "md5")
+READ_SIZE = 1024**2
+QUICK_SIZE = 1024**2
+
 
 class Color:
     """Color formats."""
@@ -257,14 +276,246 @@ def save_file_json(data, export_file):
         json.dump(data, file, indent=4)
 
 
-def get_img_checksum(img):
-    checksum = hashlib.new("md5", usedforsecurity=False)
+def stat_key(img):
+    """Identify a version of a file by its device, inode, size and
+    modification time in nanoseconds."""
+    info = os.stat(img)
+    return "%s:%s:%s:%s" % (
+        info.st_dev,
+        info.st_ino,
+        info.st_size,
+        info.st_mtime_ns,
+    )
+
+
+def checksum_memo(cache_dir=CACHE_DIR):
+    """Checksums of the files seen before by stat_key(), an SQLite
+    database in cache_dir with the last time each one was used."""
+    memo_file = os.path.join(cache_dir, CHECKSUM_DB)
+
+    if memo_file not in _CHECKSUMS:
+        create_dir(cache_dir)
+
+        conn = sqlite3.connect(memo_file, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checksums ("
+                "key TEXT PRIMARY KEY, checksum TEXT NOT NULL, "
+                "used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS checksums_used "
+                "ON checksums (used)"
+            )
+
+        _CHECKSUMS[memo_file] = conn
+
+    return _CHECKSUMS[memo_file]
+
+
+def close_checksum_memo(cache_dir=CACHE_DIR):
+    """Close the checksum memo."""
+    conn = _CHECKSUMS.pop(os.path.join(cache_dir, CHECKSUM_DB), None)
+    if conn:
+        conn.close()
+
+
+def memo_checksum(key, cache_dir=CACHE_DIR):
+    """Remembered checksum of a stat_key(), None if there is none."""
+    try:
+        conn = checksum_memo(cache_dir)
+        row = conn.execute(
+            "SELECT checksum, used FROM checksums WHERE key = ?", (key,)
+        ).fetchone()
+
+        # Hits are rare writes, enough to keep the least recently
+        # used checksums last in line.
+        if row and row[1] < time.time() - CHECKSUM_TOUCH:
+            with conn:
+                conn.execute(
+                    "UPDATE checksums SET used = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+    except sqlite3.Error as err:
+        logging.warning("Couldn't read the checksum memo: %s", err)
+        return None
+
+    return row[0] if row else None
+
+
+def save_checksum(key, checksum, cache_dir=CACHE_DIR):
+    """Remember the checksum of a stat_key(), dropping the least
+    recently used ones past CHECKSUM_MEMO_SIZE now and then."""
+    try:
+        conn = checksum_memo(cache_dir)
+        with conn:
+            cur = conn.execute(
+                "INSERT OR REPLACE INTO checksums VALUES (?, ?, ?)",
+                (key, checksum, time.time()),
+            )
+
+        if cur.lastrowid % CHECKSUM_PRUNE == 0:
+            prune_checksums(cache_dir)
+    except sqlite3.Error as err:
+        logging.warning("Couldn't save the checksum memo: %s", err)
+
+
+def prune_checksums(cache_dir=CACHE_DIR, max_size=None):
+    """Drop the least recently used checksums past max_size
+    (default: CHECKSUM_MEMO_SIZE), returns how many were dropped."""
+    max_size = CHECKSUM_MEMO_SIZE if max_size is None else max_size
+    conn = checksum_memo(cache_dir)
+
+    with conn:
+        return conn.execute(
+            "DELETE FROM checksums WHERE key IN (SELECT key FROM checksums "
+            "ORDER BY used "
+            "LIMIT max((SELECT count(*) FROM checksums) - ?, 0))",
+            (max_size,),
+        ).rowcount
+
+
+def hash_file(img, checksum):
+    """Feed a whole file to a hashlib object, READ_SIZE at a time."""
+    buf = bytearray(READ_SIZE)
+    view = memoryview(buf)
+
+    with open(img, "rb", buffering=0) as f:
+        while size := f.readinto(buf):
+            checksum.update(view[:size])
+
+    return checksum.hexdigest()
+
+
+def fingerprint_md5(img):
+    """md5 of the whole file."""
+    return hash_file(img, hashlib.new("md5", usedforsecurity=False))
+
+
+def fingerprint_blake2b(img):
+    """BLAKE2b of the whole file."""
+    return hash_file(img, hashlib.blake2b(digest_size=16))
+
+
+def fingerprint_mmap(img):
+    """BLAKE2b of the whole file mapped in memory, the same digest
+    as fingerprint_blake2b() without copying the file to a buffer."""
+    checksum = hashlib.blake2b(digest_size=16)
+
+    with open(img, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                checksum.update(data)
+
+    return checksum.hexdigest()
+
+
+def fingerprint_quick(img):
+    """BLAKE2b of the file size, its first and its last QUICK_SIZE bytes.
+    Only changes that touch neither end or the size go unnoticed,
+    which is unlikely for images."""
+    checksum = hashlib.blake2b(digest_size=16)
+
     with open(img, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            checksum.update(chunk)
+        size = os.fstat(f.fileno()).st_size
+        checksum.update(str(size).encode())
+        checksum.update(f.read(QUICK_SIZE))
+
+        if size > QUICK_SIZE:
+            f.seek(max(size - QUICK_SIZE, QUICK_SIZE))
+            checksum.update(f.read(QUICK_SIZE))
+
     return checksum.hexdigest()
 
 
+FINGERPRINTS = {
+    "md5": fingerprint_md5,
+    "blake2b": fingerprint_blake2b,
+    "mmap": fingerprint_mmap,
+    "quick": fingerprint_quick,
+}
+
+
+def checksum_algorithm(checksum):
+    """Fingerprint algorithm of a checksum, md5 ones have no prefix."""
+    algorithm, sep, _ = str(checksum).rpartition(":")
+    return algorithm if sep else "md5"
+
+
+def get_img_checksum(img, cache_dir=CACHE_DIR, algorithm=None):
+    """Fingerprint of a file with algorithm (default: FINGERPRINT),
+    only read again once its stat_key() changes.
+
+    Checksums other than md5 are prefixed with the algorithm name,
+    ie: "quick:0123..." so they can be checked with the same one later.
+    """
+    algorithm = algorithm or FINGERPRINT
+
+    if algorithm not in FINGERPRINTS:
+        raise ValueError("Unknown fingerprint algorithm '%s'." % algorithm)
+
+    key = stat_key(img)
+
+    if algorithm != "md5":
+        key += ":" + algorithm
+
+    memoized = memo_checksum(key, cache_dir)
+    if memoized:
+        return memoized
+
+    checksum = FINGERPRINTS[algorithm](img)
+    if algorithm != "md5":
+        checksum = "%s:%s" % (algorithm, checksum)
+
+    save_checksum(key, checksum, cache_dir)
+    return checksum
+
+
+def check_img_checksum(img, checksum, cache_dir=CACHE_DIR):
+    """Check a file against a checksum made with any algorithm."""
+    algorithm = checksum_algorithm(checksum)
+
+    if algorithm not in FINGERPRINTS:
+        return False
+
+    return get_img_checksum(img, cache_dir, algorithm) == checksum
+
+
+def evict_files(directory, max_size, max_age=None):
+    """Delete the least recently modified files of a directory until
+    they fit in max_size bytes, and the ones older than max_age seconds.
+    Returns how many were deleted."""
+    try:
+        entries = [
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(directory)
+            if entry.is_file()
+        ]
+    except OSError:
+        return 0
+
+    size = sum(entry[1] for entry in entries)
+    oldest = time.time() - max_age if max_age else 0
+    deleted = 0
+
+    for mtime, file_size, path in sorted(entries):
+        if mtime >= oldest and not (max_size and size > max_size):
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+        size -= file_size
+        deleted += 1
+
+    return deleted
+
+
 def create_dir(directory):
     """Alias to create the cache dir."""
     os.makedirs(directory, exist_ok=True)
@@ -397,6 +648,89 @@ def rgb_to_yiq(color):
     return colorsys.rgb_to_yiq(*hex_to_rgb(color))
 
 
+def srgb_to_linear(channel):
+    """Linearize an 8 bit sRGB channel."""
+    channel /= 255
+    if channel <= 0.04045:
+        return channel / 12.92
+    return ((channel + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(channel):
+    """Gamma encode a linear channel back to 8 bits, clamped."""
+    channel = min(max(channel, 0.0), 1.0)
+    if channel <= 0.0031308:
+        channel *= 12.92
+    else:
+        channel = 1.055 * channel ** (1 / 2.4) - 0.055
+    return int(channel * 255 + 0.5)
+
+
+def rgb_to_oklab(color):
+    """Convert an (r, g, b) color to OKLab (L, a, b)."""
+    r, g, b = [srgb_to_linear(col) for col in color]
+
+    lng = (0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b) ** (1 / 3)
+    mid = (0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b) ** (1 / 3)
+    sht = (0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b) ** (1 / 3)
+
+    return (
+        0.2104542553 * lng + 0.7936177850 * mid - 0.0040720468 * sht,
+        1.9779984951 * lng - 2.4285922050 * mid + 0.4505937099 * sht,
+        0.0259040371 * lng + 0.7827717662 * mid - 0.8086757660 * sht,
+    )
+
+
+def oklab_to_rgb(lab):
+    """Convert an OKLab (L, a, b) color to [r, g, b], clamped to sRGB."""
+    light, a, b = lab
+
+    lng = (light + 0.3963377774 * a + 0.2158037573 * b) ** 3
+    mid = (light - 0.1055613458 * a - 0.0638541728 * b) ** 3
+    sht = (light - 0.0894841775 * a - 1.2914855480 * b) ** 3
+
+    r = 4.0767416621 * lng - 3.3077115913 * mid + 0.2309699292 * sht
+    g = -1.2684380046 * lng + 2.6097574011 * mid - 0.3413193965 * sht
+    b = -0.0041960863 * lng - 0.7034186147 * mid + 1.7076147010 * sht
+
+    return [linear_to_srgb(col) for col in (r, g, b)]
+
+
+def contrast_ratio(color, color2):
+    """W3 contrast ratio between two hex colors, from 1 to 21."""
+    lum = Color(color).w3_luminance
+    lum2 = Color(color2).w3_luminance
+    return (max(lum, lum2) + 0.05) / (min(lum, lum2) + 0.05)
+
+
+def palette_distinctness(colors):
+    """Smallest rgb distance between the accent colors (1-6),
+    scaled to [0, 1]."""
+    accents = [hex_to_rgb(color) for color in colors[1:7]]
+    distances = [
+        sum((c1 - c2) ** 2 for c1, c2 in zip(col, col2)) ** 0.5
+        for i, col in enumerate(accents)
+        for col2 in accents[i + 1:]
+    ]
+    if not distances:
+        return 0.0
+    return min(distances) / (3 * 255**2) ** 0.5
+
+
+def palette_contrast(colors):
+    """Mean contrast ratio of colors 1-15 against color0."""
+    ratios = [contrast_ratio(colors[0], color) for color in colors[1:16]]
+    return sum(ratios) / len(ratios)
+
+
+def palette_score(colors):
+    """Palette quality between 0 and 1, the mean of the accent
+    distinctness and the contrast against the background
+    (4.5:1 and up counts as full contrast)."""
+    contrast = min(palette_contrast(colors) / 4.5, 1.0)
+    return (palette_distinctness(colors) + contrast) / 2
+
+
 def disown(cmd):
     """Call a system command in the background,
     disown it and hide it's output."""
@@ -428,9 +762,7 @@ def has_im():
     if shutil.which("convert"):
         return "convert"
 
-    logging.error("Problem running image averaging command.")
-    logging.error("Imagemagick wasn't found on your system.")
-    sys.exit(1)
+    raise runner.CommandNotFound(["magick"])
 
 
 def image_average_color(img):
@@ -448,12 +780,11 @@ def image_average_color(img):
         '"%[fx:int(255*r+.5)],%[fx:int(255*g+.5)],%[fx:int(255*b+.5)]"',
         "txt:-",
     ]
-    magick_command = has_im()
     try:
-        magick_output = subprocess.run(
-            [magick_command, img] + cmd_flags, stdout=subprocess.PIPE
+        magick_output = runner.run(
+            [has_im(), img] + cmd_flags, input_file=img
         )
-    except subprocess.CalledProcessError as Err:
+    except runner.RunnerError as Err:
         logging.error(
             "Problem running image averaging command. Is imagemagick installed?"
         )
@@ -461,4 +792,5 @@ def image_average_color(img):
         return ""
 
     # Regex hex code from the command output
-    return re.search("#[0-9A-Fa-f]{6}", magick_output.stdout.decode("utf-8"))[0]
+    average = re.search("#[0-9A-Fa-f]{6}", magick_output.decode("utf-8"))
+    return average[0] if average else ""
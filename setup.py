@@ -58,12 +58,16 @@ setuptools.setup(
         "modern_colorthief": [
             "modern_colorthief",
         ],
+        "pillow": [
+            "pillow",
+        ],  # in-process backends: kmeans, wu
         "all": [
             "colorthief",
             "colorz",
             "fast-colorthief",
             "haishoku",
             "modern_colorthief",
+            "pillow",
         ],  # convience, all of the above
     },
     include_package_data=True,
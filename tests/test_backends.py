@@ -0,0 +1,88 @@
+"""Test the in-process backends."""
+
+import importlib.util
+import unittest
+import unittest.mock
+
+from pywal.backends import octree
+
+HAS_PIL = importlib.util.find_spec("PIL") is not None
+
+FLAT = bytes((200, 30, 30)) * 40 + bytes((30, 200, 30)) * 30
+FLAT += bytes((30, 30, 200)) * 20 + bytes((10, 10, 10)) * 10
+FLAT_COLORS = [[200, 30, 30], [30, 200, 30], [30, 30, 200], [10, 10, 10]]
+
+
+@unittest.skipUnless(HAS_PIL, "Pillow isn't installed")
+class TestWu(unittest.TestCase):
+    """Test the wu backend."""
+
+    def test_quantize_flat(self):
+        """> Quantize an image made of four colors."""
+        from pywal.backends import wu
+
+        result = wu.quantize(FLAT, 8)
+        self.assertEqual(result, FLAT_COLORS)
+
+    def test_get(self):
+        """> Generate a colorscheme."""
+        from pywal.backends import wu
+
+        result = wu.get("tests/test_files/test.jpg")
+        self.assertEqual(len(result[0]), 7)
+
+    def test_no_palette(self):
+        """> Raise BackendError for an image without pixels."""
+        from pywal import registry
+        from pywal.backends import wu
+
+        with unittest.mock.patch("pywal.pixels.load", return_value=b""), \
+                self.assertRaises(registry.BackendError):
+            wu.gen_colors("tests/test_files/test.jpg")
+
+
+@unittest.skipUnless(HAS_PIL, "Pillow isn't installed")
+class TestKmeans(unittest.TestCase):
+    """Test the kmeans backend."""
+
+    def test_quantize_flat(self):
+        """> Cluster an image made of four colors."""
+        from pywal.backends import kmeans
+
+        result = kmeans.quantize(FLAT, 8)
+        self.assertEqual(result, FLAT_COLORS)
+
+    def test_reseed_empty(self):
+        """> Move the centers left without pixels onto distant pixels."""
+        from pywal import util
+        from pywal.backends import kmeans
+
+        points = [util.rgb_to_oklab((r, g, b)) for r in (20, 230)
+                  for g in (20, 230) for b in (20, 230)]
+        centers = [list(points[0]) for _ in points]
+        counts = [0] * len(centers)
+
+        self.assertEqual(kmeans.reseed_empty(points, centers, counts), 7)
+        self.assertEqual(sorted(map(tuple, centers)), sorted(points))
+
+
+class TestOctree(unittest.TestCase):
+    """Test the octree backend."""
+
+    def test_quantize_strips(self):
+        """> Quantize an image streamed in uneven strips."""
+        strips = [FLAT[:100], FLAT[100:250], FLAT[250:]]
+        result = octree.quantize(10, 10, iter(strips), 8)
+        self.assertEqual(result, FLAT_COLORS)
+
+    def test_leaves_bounded(self):
+        """> Keep the octree under its leaf limit."""
+        tree = octree.Octree(max_leaves=16)
+        for i in range(0, 256, 4):
+            tree.add(i, 255 - i, i // 2)
+        self.assertLessEqual(tree.leaves, 16)
+        self.assertLessEqual(len(tree.palette(8)), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Test the benchmark corpus."""
+
+import os
+import shutil
+import unittest
+
+from pywal import bench
+from pywal import util
+
+
+TMP_DIR = "/tmp/wal_bench"
+
+
+class TestCorpus(unittest.TestCase):
+    """Test the corpus generation."""
+
+    def tearDown(self):
+        """> Clean up the corpus."""
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    def test_corpus(self):
+        """> Generate the benchmark images."""
+        result = bench.corpus(TMP_DIR, ["360p"])
+        self.assertEqual(len(result), len(bench.KINDS))
+        self.assertTrue(all(os.path.isfile(img["path"]) for img in result))
+
+    def test_corpus_deterministic(self):
+        """> Generate the same images twice."""
+        img = bench.corpus(TMP_DIR, ["360p"], ["noise"])[0]["path"]
+        checksum = util.fingerprint_md5(img)
+        os.remove(img)
+        bench.corpus(TMP_DIR, ["360p"], ["noise"])
+        self.assertEqual(util.fingerprint_md5(img), checksum)
+
+    def test_fingerprints(self):
+        """> Time the fingerprint algorithms."""
+        img = bench.large_image(TMP_DIR, 1)
+        result = bench.fingerprints(img, repeat=1)
+        self.assertEqual(
+            [res["algorithm"] for res in result], list(util.FINGERPRINTS)
+        )
+        self.assertTrue(all(res["bytes"] >= 1024**2 - 8192 * 3
+                            for res in result))
+
+    def test_scheme_formats(self):
+        """> Time the scheme formats."""
+        result = bench.scheme_formats(10, repeat=1)
+        self.assertEqual(
+            [res["format"] for res in result],
+            ["json-indent", "json", "binary"],
+        )
+        self.assertLess(result[2]["bytes"], result[1]["bytes"])
+
+    def test_png_header(self):
+        """> Write a PNG header."""
+        img = bench.corpus(TMP_DIR, ["360p"], ["flat"])[0]["path"]
+        with open(img, "rb") as png:
+            header = png.read(24)
+        self.assertEqual(header[:8], b"\x89PNG\r\n\x1a\n")
+        self.assertEqual(header[16:24], bytes.fromhex("0000028000000168"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""Test the cache bundles."""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from pywal import bundle
+from pywal import cache
+from pywal import colors
+from pywal import util
+
+
+IMG = os.path.abspath("tests/test_files/test.jpg")
+PALETTE = ["#%02x%02x%02x" % (i * 16, i * 8, i * 4) for i in range(16)]
+
+
+class TestBundle(unittest.TestCase):
+    """Test exporting and importing bundles."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(cache.close, self.cache_dir)
+        self.addCleanup(util.close_checksum_memo, self.cache_dir)
+        self.scheme = colors.colors_to_dict(PALETTE, IMG, self.cache_dir)
+
+    def test_bundle(self):
+        """> Export colorschemes and import them elsewhere."""
+        options = cache.options_key("wal", False)
+        cache.put(IMG, options, self.scheme, self.cache_dir)
+        path = os.path.join(self.cache_dir, "bundle.tar.gz")
+        self.assertEqual(bundle.export(path, self.cache_dir), 1)
+
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        self.addCleanup(cache.close, other)
+        self.addCleanup(util.close_checksum_memo, other)
+
+        counts = bundle.merge(path, other)
+        self.assertEqual(counts["imported"], 1)
+        self.assertEqual(cache.get(IMG, options, other), self.scheme)
+
+        counts = bundle.merge(path, other)
+        self.assertEqual(counts["existing"], 1)
+
+    def test_reject(self):
+        """> Skip colorschemes with invalid colors."""
+        bad = {**self.scheme, "special": dict(self.scheme["special"])}
+        bad["special"]["cursor"] = "red; rm -rf ~"
+        cache.put(IMG, cache.options_key("wal", False), bad, self.cache_dir)
+
+        missing = {**self.scheme, "special": {}}
+        cache.put(IMG, cache.options_key("wal", True), missing,
+                  self.cache_dir)
+
+        path = os.path.join(self.cache_dir, "bundle.tar")
+        self.assertEqual(bundle.export(path, self.cache_dir), 2)
+
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        self.addCleanup(cache.close, other)
+        self.addCleanup(util.close_checksum_memo, other)
+
+        counts = bundle.merge(path, other)
+        self.assertEqual(counts["rejected"], 2)
+        self.assertEqual(counts["imported"], 0)
+
+    def test_reject_options(self):
+        """> Skip colorschemes with invalid options or times."""
+        cache.put(IMG, "bogus", self.scheme, self.cache_dir)
+        cache.put(IMG, '["wal","dark","","",""]', self.scheme,
+                  self.cache_dir)
+        options = cache.options_key("wal", False)
+        cache.put(IMG, options, self.scheme, self.cache_dir)
+        with cache.connect(self.cache_dir) as conn:
+            conn.execute("UPDATE schemes SET created = 'now' "
+                         "WHERE options = ?", (options,))
+
+        path = os.path.join(self.cache_dir, "bundle.tar")
+        self.assertEqual(bundle.export(path, self.cache_dir), 3)
+
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        self.addCleanup(cache.close, other)
+        self.addCleanup(util.close_checksum_memo, other)
+
+        counts = bundle.merge(path, other)
+        self.assertEqual(counts["rejected"], 3)
+        self.assertEqual(cache.stats(other)["options"], {})
+
+    def test_export_error(self):
+        """> Raise OSError when the bundle can't be written."""
+        path = os.path.join(self.cache_dir, "missing", "bundle.tar")
+        with self.assertRaises(OSError):
+            bundle.export(path, self.cache_dir)
+
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+    def test_read_manifest(self):
+        """> Reject bundles whose manifest isn't an object."""
+        path = os.path.join(self.cache_dir, "bundle.tar")
+        with tarfile.open(path, "w") as tar:
+            for name in ("manifest.json", "schemes.json"):
+                info = tarfile.TarInfo(name)
+                info.size = 2
+                tar.addfile(info, io.BytesIO(b"[]"))
+
+        with self.assertRaises(ValueError):
+            bundle.read(path)
+
+    def test_normalize_options(self):
+        """> Normalize the options of imported colorschemes."""
+        self.assertEqual(
+            bundle.normalize_options('["wal","light",0.5,false,"",64]'),
+            cache.options_key("wal", True, "0.5"),
+        )
+        self.assertIsNone(bundle.normalize_options('"bogus!"'))
+        self.assertIsNone(bundle.normalize_options(
+            '["wal","light","x",false,"",0]'
+        ))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+"""Test the colorscheme cache."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+from pywal import cache
+from pywal import colors
+from pywal import util
+
+
+IMG = os.path.abspath("tests/test_files/test.jpg")
+PALETTE = ["#%02x%02x%02x" % (i * 16, i * 8, i * 4) for i in range(16)]
+
+
+class TestCache(unittest.TestCase):
+    """Test the scheme store."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(cache.close, self.cache_dir)
+        self.addCleanup(util.close_checksum_memo, self.cache_dir)
+        self.scheme = colors.colors_to_dict(PALETTE, IMG, self.cache_dir)
+
+    def test_options_key(self):
+        """> Normalize the options."""
+        self.assertEqual(
+            cache.options_key("wal", False, "0.5", cst=None),
+            cache.options_key("wal", False, 0.5, cst=""),
+        )
+        self.assertNotEqual(
+            cache.options_key("wal", False),
+            cache.options_key("wal", True),
+        )
+        # Only the backends sampling pixels depend on --samples.
+        self.assertEqual(
+            cache.options_key("wal", False, samples=2000),
+            cache.options_key("wal", False),
+        )
+        self.assertNotEqual(
+            cache.options_key("wu", False, samples=2000),
+            cache.options_key("wu", False),
+        )
+
+    def test_put_get(self):
+        """> Store a colorscheme and read it back."""
+        options = cache.options_key("wal", False)
+        cache.put(IMG, options, self.scheme, self.cache_dir)
+
+        result = cache.get(IMG, options, self.cache_dir)
+        self.assertEqual(result, self.scheme)
+
+        other = cache.options_key("wal", True)
+        self.assertIsNone(cache.get(IMG, other, self.cache_dir))
+
+    def test_stats(self):
+        """> Count hits and misses."""
+        options = cache.options_key("wal", False)
+        cache.get(IMG, options, self.cache_dir)
+        cache.put(IMG, options, self.scheme, self.cache_dir)
+        cache.get(IMG, options, self.cache_dir)
+        cache.get(IMG, options, self.cache_dir, record=False)
+        cache.connect(self.cache_dir).execute(
+            "UPDATE schemes SET version = '0.0.0'"
+        )
+        cache.get(IMG, options, self.cache_dir)
+        cache.record_latency("wal", 0.1, self.cache_dir)
+
+        result = cache.stats(self.cache_dir)
+        row = result["options"][options]
+        self.assertEqual((row["hit"], row["no_entry"], row["version"]),
+                         (1, 1, 1))
+        self.assertEqual(result["latency"]["wal"]["buckets"], {7: 1})
+        self.assertEqual(cache.describe(options), "wal dark")
+
+    def test_renamed(self):
+        """> Hit the cache for a renamed copy of an image."""
+        options = cache.options_key("wal", False)
+        cache.put(IMG, options, self.scheme, self.cache_dir)
+
+        copy = os.path.join(self.cache_dir, "renamed.jpg")
+        shutil.copy(IMG, copy)
+        self.assertEqual(cache.get(copy, options, self.cache_dir), self.scheme)
+
+        paths = cache.connect(self.cache_dir).execute(
+            "SELECT path FROM paths ORDER BY path"
+        )
+        self.assertEqual([row[0] for row in paths], sorted([IMG, copy]))
+
+    def test_other_fingerprint(self):
+        """> Hit the cache after the fingerprint algorithm changed."""
+        options = cache.options_key("wal", False)
+        cache.put(IMG, options, self.scheme, self.cache_dir)
+
+        with unittest.mock.patch.object(util, "FINGERPRINT", "quick"):
+            result = cache.get(IMG, options, self.cache_dir)
+        self.assertEqual(result, self.scheme)
+
+    def test_stale(self):
+        """> Miss when the image or the cache version changed."""
+        options = cache.options_key("wal", False)
+        cache.put(IMG, options, self.scheme, self.cache_dir)
+        conn = cache.connect(self.cache_dir)
+
+        conn.execute("UPDATE schemes SET checksum = 'edited'")
+        self.assertIsNone(cache.get(IMG, options, self.cache_dir))
+
+        conn.execute(
+            "UPDATE schemes SET checksum = ?, version = '0.0.0'",
+            (self.scheme["checksum"],),
+        )
+        self.assertIsNone(cache.get(IMG, options, self.cache_dir))
+
+    def test_evict(self):
+        """> Evict the least recently used schemes."""
+        conn = cache.connect(self.cache_dir)
+        for i in range(5):
+            options = cache.options_key("wal", False, cst=i + 1)
+            cache.put(IMG, options, self.scheme, self.cache_dir)
+            conn.execute(
+                "UPDATE schemes SET last_hit = ? WHERE options = ?",
+                (time.time() - i * 86400, options),
+            )
+
+        self.assertEqual(cache.evict(self.cache_dir, 4, 0, 0, batch=1), 1)
+        self.assertEqual(cache.evict(self.cache_dir, 4, 0, 0), 0)
+        self.assertEqual(cache.evict(self.cache_dir, 0, 0, 2 * 86400 - 60), 2)
+
+        rows = conn.execute("SELECT options FROM schemes ORDER BY last_hit")
+        self.assertEqual(
+            [row[0] for row in rows],
+            [cache.options_key("wal", False, cst=i) for i in (2, 1)],
+        )
+
+        size = conn.execute("SELECT size FROM schemes").fetchone()[0]
+        self.assertEqual(cache.evict(self.cache_dir, 0, size, 0), 1)
+
+    def test_evict_snapshots(self):
+        """> Evict palette snapshots unused for the max age."""
+        snapshots = os.path.join(self.cache_dir, cache.SNAPSHOT_DIR)
+        util.create_dir(snapshots)
+        for name, age in (("old.bin", 86400), ("new.bin", 0)):
+            path = os.path.join(snapshots, name)
+            util.save_file("", path)
+            os.utime(path, (time.time() - age,) * 2)
+
+        cache.evict(self.cache_dir, max_age=3600)
+        self.assertEqual(os.listdir(snapshots), ["new.bin"])
+
+    @unittest.skipUnless(util.has_fcntl, "fcntl isn't available")
+    def test_lock(self):
+        """> Wait for the lock of a cache key."""
+        options = cache.options_key("wal", False)
+        path = cache.lock_file(IMG, options, self.cache_dir)
+
+        with cache.lock(IMG, options, self.cache_dir) as locked:
+            self.assertTrue(locked)
+            with cache.lock(IMG, options, self.cache_dir, 0.1) as locked:
+                self.assertFalse(locked)
+
+        self.assertFalse(os.path.exists(path))
+
+    @unittest.skipUnless(util.has_fcntl, "fcntl isn't available")
+    def test_lock_stale(self):
+        """> Break an abandoned lock."""
+        options = cache.options_key("wal", False)
+        path = cache.lock_file(IMG, options, self.cache_dir)
+        util.create_dir(os.path.dirname(path))
+
+        fd = cache.acquire(path)
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, b"%d 0.0" % os.getpid(), 0)
+
+        with cache.lock(IMG, options, self.cache_dir, 0.1) as locked:
+            self.assertTrue(locked)
+        os.close(fd)
+
+    def test_migrate(self):
+        """> Import the json files of older versions."""
+        legacy = [
+            (("None", False, "None"), {}),
+            (("wal", False, "None"), {}),
+            (("random", True, "0.5"), {}),
+            (("fast_colorthief", False, "None"), {"cst": 4.5}),
+            (("colorthief", False, "None"), {"c16": "lighten"}),
+        ]
+        for (backend, light, sat), kwargs in legacy:
+            name = cache.legacy_fname(
+                IMG, backend, light, self.cache_dir, sat, **kwargs
+            )
+            util.save_file_json(self.scheme, os.path.join(*name))
+
+        util.save_file_json(
+            self.scheme,
+            os.path.join(self.cache_dir, "schemes", "unrelated.json"),
+        )
+
+        expected = [
+            cache.options_key(None, False),
+            cache.options_key("wal", False),
+            cache.options_key("random", True, 0.5),
+            cache.options_key("fast_colorthief", False, cst=4.5),
+            cache.options_key("colorthief", False, c16="lighten"),
+        ]
+        for options in expected:
+            result = cache.get(IMG, options, self.cache_dir)
+            self.assertEqual(result, self.scheme)
+
+        rows = cache.connect(self.cache_dir).execute(
+            "SELECT COUNT(*) FROM schemes"
+        )
+        self.assertEqual(rows.fetchone()[0], len(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Test the colorscheme encoding."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pywal import codec
+from pywal import colors
+from pywal import util
+
+
+IMG = os.path.abspath("tests/test_files/test.jpg")
+PALETTE = ["#%02x%02x%02x" % (i * 16, i * 8, i * 4) for i in range(16)]
+
+
+class TestCodec(unittest.TestCase):
+    """Test the binary layout."""
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.addCleanup(util.close_checksum_memo, cache_dir)
+        self.scheme = colors.colors_to_dict(PALETTE, IMG, cache_dir)
+
+    def test_encode(self):
+        """> Pack colorschemes that fit the binary layout."""
+        data = codec.encode(self.scheme, "binary")
+        self.assertEqual(data[:4], codec.MAGIC)
+        self.assertEqual(codec.decode(data), self.scheme)
+
+        self.scheme["alpha"] = 85
+        self.assertEqual(codec.decode(codec.encode(self.scheme)), self.scheme)
+
+        self.scheme["colors"]["color3"] = "#FFF"
+        data = codec.encode(self.scheme, "binary")
+        self.assertIsInstance(data, str)
+        self.assertEqual(codec.decode(data), self.scheme)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,31 @@
 """Test imagemagick functions."""
 
+import shutil
+import tempfile
+import types
 import unittest
+import unittest.mock
 
+from pywal import cache
 from pywal import colors
+from pywal import registry
+from pywal import runner
+from pywal import util
 
 
 class TestGenColors(unittest.TestCase):
     """Test the gen_colors functions."""
 
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(cache.close, self.cache_dir)
+        self.addCleanup(util.close_checksum_memo, self.cache_dir)
+
     def test_gen_colors(self):
         """> Generate a colorscheme."""
-        result = colors.get("tests/test_files/test.jpg")
+        result = colors.get("tests/test_files/test.jpg",
+                            cache_dir=self.cache_dir)
         self.assertEqual(len(result["colors"]["color0"]), 7)
 
     def test_color_import(self):
@@ -35,9 +50,96 @@ class TestGenColors(unittest.TestCase):
 
     def test_gen_colors_checksum(self):
         """> Generate a colorscheme with the wallpaper's checksum"""
-        result = colors.get("tests/test_files/test.jpg")
+        result = colors.get("tests/test_files/test.jpg",
+                            cache_dir=self.cache_dir)
         self.assertEqual(len(result["checksum"]), 32)
 
+    def test_predict_latency(self):
+        """> Predict a backend latency from its history."""
+        samples = [[1, 100, 0.5], [3, 300, 0.5]]
+        self.assertAlmostEqual(colors.predict_latency(samples, 2), 200)
+        self.assertEqual(colors.predict_latency(samples[:1], 5), 100)
+
+    def test_auto_backend_no_history(self):
+        """> Pick a backend without any history."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        result = colors.get_backend(
+            "auto:100", "tests/test_files/test.jpg", tmp_dir
+        )
+        self.assertIn(result, colors.list_backends())
+        history = colors.backend_history(tmp_dir)
+        self.assertEqual(history["decisions"][0]["budget"], 100)
+
+    def test_auto_backend_invalid_budget(self):
+        """> Fall back to the default budget when it isn't a number."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        colors.get_backend("auto:fast", "tests/test_files/test.jpg", tmp_dir)
+        history = colors.backend_history(tmp_dir)
+        self.assertEqual(history["decisions"][0]["budget"], colors.AUTO_BUDGET)
+
+    def test_record_backend_run(self):
+        """> Record a backend run against the image's pixel count."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        img = "tests/test_files/test.jpg"
+        colors.record_backend_run("wu", img, 0.5, ["#000000"] * 16, tmp_dir)
+        colors.record_backend_run("wu", img, 0.7, ["#000000"] * 16, tmp_dir)
+
+        samples = colors.backend_history(tmp_dir)["backends"]["wu"]
+        self.assertEqual(len(samples), 2)
+        self.assertAlmostEqual(samples[0][0], colors.megapixels(img))
+        self.assertAlmostEqual(samples[1][1], 700)
+
+    def test_memoized_run(self):
+        """> Don't record the latency of a memoized backend run."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        def get(img, light, **kwargs):
+            runner.memo_hit(["magick"])
+            return ["#000000"] * 16
+
+        module = types.SimpleNamespace(get=get)
+        with unittest.mock.patch("pywal.registry.load", return_value=module):
+            colors.generate("tests/test_files/test.jpg", cache_dir=tmp_dir)
+
+        self.assertEqual(colors.backend_history(tmp_dir)["backends"], {})
+
+    def test_unavailable_backend(self):
+        """> Fall back to wal before importing a missing backend."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        module = types.SimpleNamespace(get=lambda *_, **__: ["#000000"] * 16)
+        missing = registry.Backend("missing", "pywal.backends.missing",
+                                   requires=("pywal_missing_module",))
+
+        with unittest.mock.patch.dict(registry.backends(),
+                                      {"missing": missing}), \
+                unittest.mock.patch("pywal.registry.load",
+                                    return_value=module) as load:
+            colors.generate("tests/test_files/test.jpg", backend="missing",
+                            cache_dir=tmp_dir)
+
+        load.assert_called_once_with("wal")
+
+    def test_default_backend(self):
+        """> Use wal without a warning when no backend is given."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        module = types.SimpleNamespace(get=lambda *_, **__: ["#000000"] * 16)
+
+        with unittest.mock.patch("pywal.registry.load",
+                                 return_value=module) as load, \
+                self.assertNoLogs(level="WARNING"):
+            colors.generate("tests/test_files/test.jpg", backend=None,
+                            cache_dir=tmp_dir)
+
+        load.assert_called_once_with("wal")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,142 @@
+"""Test the near-duplicate detection."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from pywal import cache
+from pywal import colors
+from pywal import duplicates
+from pywal import index
+from pywal import util
+
+
+IMG = os.path.abspath("tests/test_files/test.jpg")
+PALETTE = ["#%02x%02x%02x" % (i * 16, i * 8, i * 4) for i in range(16)]
+OPTIONS = cache.options_key("wal", False)
+
+
+class TestDuplicates(unittest.TestCase):
+    """Test the perceptual hashes."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.img_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(shutil.rmtree, self.img_dir)
+        self.addCleanup(index.close, self.cache_dir)
+        self.addCleanup(cache.close, self.cache_dir)
+        self.addCleanup(util.close_checksum_memo, self.cache_dir)
+        self.imgs = []
+
+        for i, name in enumerate(("a.jpg", "b.jpg", "c.jpg")):
+            img = os.path.join(self.img_dir, name)
+            shutil.copy(IMG, img)
+            with open(img, "ab") as file:
+                file.write(bytes([i]))
+            self.imgs.append(img)
+
+        # Stand-ins for the hashes and colors of the images, b is a
+        # near-duplicate of a and c is unrelated.
+        self.store_hashes([(0xF0F0F0F0F0F0F0F0, 0x804020),
+                           (0xF0F0F0F0F0F0F0F1, 0x814020),
+                           (0x0F, 0x804020)])
+        reuse = unittest.mock.patch.object(duplicates, "REUSE", True)
+        reuse.start()
+        self.addCleanup(reuse.stop)
+
+    def store_hashes(self, sigs):
+        """Store the hashes and colors of the test images."""
+        conn = index.connect(self.cache_dir)
+
+        for img, (value, color) in zip(self.imgs, sigs):
+            checksum = util.get_img_checksum(img, self.cache_dir)
+            duplicates.store_hash(conn, checksum, value, color)
+
+    def test_difference_hash(self):
+        """> Hash brightness gradients."""
+        falling = bytes(range(72, 0, -1))
+        self.assertEqual(duplicates.difference_hash(falling), 2**64 - 1)
+        self.assertEqual(duplicates.difference_hash(falling[::-1]), 0)
+
+    def test_image_hash(self):
+        """> Read stored hashes back unsigned."""
+        self.assertEqual(
+            duplicates.image_hash(self.imgs[1], cache_dir=self.cache_dir),
+            (0xF0F0F0F0F0F0F0F1, 0x814020),
+        )
+
+    def test_mean_color(self):
+        """> Average packed pixels."""
+        self.assertEqual(
+            duplicates.mean_color(bytes([0, 10, 255, 20, 30, 255])),
+            0x0A14FF,
+        )
+
+    def test_clusters(self):
+        """> Group hashes within the distance."""
+        sigs = {"a": (0, 0), "b": (0b11, 0), "c": (0b111, 0),
+                "d": (2**64 - 1, 0), "e": (0b11, 0xFFFFFF)}
+        self.assertEqual(duplicates.clusters(sigs, 1), [["b", "c"]])
+        self.assertEqual(duplicates.clusters(sigs, 2), [["a", "b", "c"]])
+        self.assertEqual(duplicates.clusters(sigs, 0), [])
+
+    def test_find(self):
+        """> Find the duplicates of a directory."""
+        self.assertEqual(
+            duplicates.find(self.img_dir, cache_dir=self.cache_dir),
+            [self.imgs[:2]],
+        )
+
+    def test_reuse(self):
+        """> Reuse the colorscheme of a near-duplicate."""
+        self.assertIsNone(
+            duplicates.reuse(self.imgs[1], OPTIONS, self.cache_dir)
+        )
+
+        scheme = colors.colors_to_dict(PALETTE, self.imgs[0], self.cache_dir)
+        cache.put(self.imgs[0], OPTIONS, scheme, self.cache_dir)
+        self.assertIsNone(
+            duplicates.reuse(self.imgs[2], OPTIONS, self.cache_dir)
+        )
+
+        reused = colors.get(self.imgs[1], cache_dir=self.cache_dir)
+        self.assertEqual(reused["colors"], scheme["colors"])
+        self.assertEqual(
+            reused["checksum"],
+            util.get_img_checksum(self.imgs[1], self.cache_dir),
+        )
+        self.assertEqual(reused["wallpaper"], self.imgs[1])
+        self.assertTrue(
+            cache.get(self.imgs[1], OPTIONS, self.cache_dir, record=False)
+        )
+
+    def test_reuse_off(self):
+        """> Don't reuse colorschemes unless asked to."""
+        scheme = colors.colors_to_dict(PALETTE, self.imgs[0], self.cache_dir)
+        cache.put(self.imgs[0], OPTIONS, scheme, self.cache_dir)
+
+        with unittest.mock.patch.object(duplicates, "REUSE", False):
+            self.assertIsNone(
+                duplicates.reuse(self.imgs[1], OPTIONS, self.cache_dir)
+            )
+
+    def test_different_colors(self):
+        """> Don't reuse the colorscheme of an image of another color."""
+        conn = index.connect(self.cache_dir)
+        # Solid red and solid blue images have the same flat hash.
+        for img, color in ((self.imgs[0], 0xC81E1E), (self.imgs[1], 0x1E1EC8)):
+            checksum = util.get_img_checksum(img, self.cache_dir)
+            duplicates.store_hash(conn, checksum, 0, color)
+
+        scheme = colors.colors_to_dict(PALETTE, self.imgs[0], self.cache_dir)
+        cache.put(self.imgs[0], OPTIONS, scheme, self.cache_dir)
+        self.assertIsNone(
+            duplicates.reuse(self.imgs[1], OPTIONS, self.cache_dir)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,30 +1,47 @@
 """Test image functions."""
+import argparse
+import shutil
+import tempfile
 import unittest
 
 from pywal import image
+from pywal import index
 
 
 class TestImage(unittest.TestCase):
     """Test image functions."""
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(index.close, self.cache_dir)
+
     def test_get_img(self):
         """> Validate image file."""
-        result = image.get("tests/test_files/test.jpg")
+        result = image.get("tests/test_files/test.jpg", self.cache_dir)
         self.assertIn("tests/test_files/test.jpg", result)
 
     def test_get_img_dir(self):
         """> Validate image directory."""
-        result = image.get("tests/test_files")
+        result = image.get("tests/test_files", self.cache_dir)
         self.assertEqual(result.endswith((".jpg", ".png")), True)
 
     def test_get_img_fail(self):
         """> Validate image file. (fail)"""
         with self.assertRaises(SystemExit):
-            image.get("tests/test_files/test_fail.jpg")
+            image.get("tests/test_files/test_fail.jpg", self.cache_dir)
 
     def test_get_img_dir_fail(self):
         """> Validate image directory. (fail)"""
         with self.assertRaises(SystemExit):
-            image.get("tests")
+            image.get("tests", self.cache_dir)
+
+    def test_aspect_spec(self):
+        """> Parse the --aspect ratio."""
+        self.assertEqual(image.aspect_spec("16:10"), 1.6)
+
+        for spec in ("16", "16:", "16:0", "-16:9", "a:b"):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                image.aspect_spec(spec)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+"""Test the wallpaper directory index."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pywal import index
+
+
+class TestIndex(unittest.TestCase):
+    """Test the index functions."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.img_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(shutil.rmtree, self.img_dir)
+        self.addCleanup(index.close, self.cache_dir)
+        os.mkdir(os.path.join(self.img_dir, "sub"))
+        self.imgs = [
+            os.path.join(self.img_dir, "a.jpg"),
+            os.path.join(self.img_dir, "sub", "b.png"),
+        ]
+        for img in self.imgs:
+            shutil.copy("tests/test_files/test.jpg", img)
+
+    def age(self, path):
+        """Make a directory look unchanged for a while."""
+        os.utime(path, ns=(0, 10**9))
+
+    def test_images(self):
+        """> Index a directory."""
+        self.assertEqual(
+            index.images(self.img_dir, cache_dir=self.cache_dir),
+            self.imgs[:1],
+        )
+        self.assertEqual(
+            index.images(self.img_dir, True, cache_dir=self.cache_dir),
+            self.imgs,
+        )
+
+    def test_unchanged(self):
+        """> Only list the directories that changed."""
+        self.age(self.img_dir)
+        self.age(os.path.join(self.img_dir, "sub"))
+        conn = index.connect(self.cache_dir)
+        self.assertEqual(len(index.update(conn, self.img_dir, True)), 2)
+        self.assertEqual(len(index.update(conn, self.img_dir, True)), 0)
+
+        new = os.path.join(self.img_dir, "sub", "c.gif")
+        shutil.copy("tests/test_files/test.jpg", new)
+        self.assertEqual(len(index.update(conn, self.img_dir, True)), 1)
+        self.assertIn(
+            new, index.images(self.img_dir, True, cache_dir=self.cache_dir)
+        )
+
+    def test_sort_key(self):
+        """> Sort paths naturally."""
+        paths = ["/w/10.jpg", "/w/2.jpg", "/w/a/1.jpg", "/w/02b.jpg",
+                 "/w/a.jpg", "/w1/1.jpg"]
+        self.assertEqual(
+            sorted(paths, key=index.sort_key),
+            ["/w1/1.jpg", "/w/2.jpg", "/w/02b.jpg", "/w/10.jpg", "/w/a.jpg",
+             "/w/a/1.jpg"],
+        )
+
+    def test_next_image(self):
+        """> Go through the images in natural order."""
+        for name in ("10.jpg", "2.jpg", "02.jpg"):
+            shutil.copy("tests/test_files/test.jpg",
+                        os.path.join(self.img_dir, name))
+
+        order = []
+        current = "None"
+        for _ in range(5):
+            current = index.next_image(
+                self.img_dir, current, cache_dir=self.cache_dir
+            )
+            order.append(os.path.basename(current))
+        self.assertEqual(
+            order, ["02.jpg", "2.jpg", "10.jpg", "a.jpg", "02.jpg"]
+        )
+
+    def test_random_image(self):
+        """> Show every image once per cycle."""
+        imgs = [os.path.join(self.img_dir, "%s.jpg" % i) for i in range(5)]
+        for img in imgs:
+            shutil.copy("tests/test_files/test.jpg", img)
+        imgs.append(self.imgs[0])
+
+        def cycle(current=None):
+            return [
+                index.random_image(self.img_dir, current,
+                                   cache_dir=self.cache_dir)
+                for _ in range(len(imgs))
+            ]
+
+        self.assertEqual(sorted(cycle()), imgs)
+        self.assertEqual(sorted(cycle()), imgs)
+
+        os.remove(imgs[0])
+        drawn = cycle(imgs[1])
+        self.assertNotIn(imgs[0], drawn)
+        self.assertNotIn(imgs[1], drawn)
+
+    def test_random_indexed_elsewhere(self):
+        """> Add the images another command indexed to the bag."""
+        shutil.copy(self.imgs[0], os.path.join(self.img_dir, "b.jpg"))
+        index.random_image(self.img_dir, cache_dir=self.cache_dir)
+
+        new = os.path.join(self.img_dir, "new.jpg")
+        shutil.copy(self.imgs[0], new)
+        self.age(self.img_dir)
+        index.next_image(self.img_dir, new, cache_dir=self.cache_dir)
+
+        drawn = [
+            index.random_image(self.img_dir, cache_dir=self.cache_dir)
+            for _ in range(6)
+        ]
+        self.assertIn(new, drawn)
+
+    def test_filters(self):
+        """> Filter images by their header size."""
+        shutil.copy("tests/test_files/test.png",
+                    os.path.join(self.img_dir, "c.jpg"))
+        filters = {"min_resolution": (100, 60), "aspect": 1.5,
+                   "orientation": "landscape"}
+        self.assertEqual(
+            index.images(self.img_dir, True, cache_dir=self.cache_dir,
+                         filters=filters),
+            self.imgs,
+        )
+
+        filters = {"orientation": "square"}
+        self.assertEqual(
+            index.images(self.img_dir, True, cache_dir=self.cache_dir,
+                         filters=filters),
+            [os.path.join(self.img_dir, "c.jpg")],
+        )
+        row = index.connect(self.cache_dir).execute(
+            "SELECT format FROM images WHERE path LIKE '%c.jpg'"
+        ).fetchone()
+        self.assertEqual(row, ("png",))
+
+    def test_removed(self):
+        """> Forget removed directories."""
+        index.images(self.img_dir, True, cache_dir=self.cache_dir)
+        shutil.rmtree(os.path.join(self.img_dir, "sub"))
+        self.assertEqual(
+            index.images(self.img_dir, True, cache_dir=self.cache_dir),
+            self.imgs[:1],
+        )
+
+    def test_image_info(self):
+        """> Read the image size from the header."""
+        self.assertEqual(
+            index.image_info("tests/test_files/test.jpg"), ("jpeg", 100, 67)
+        )
+        self.assertEqual(
+            index.image_info("tests/test_files/test.png"), ("png", 1, 1)
+        )
+        self.assertIsNone(index.image_info("tests/test_files/test_file"))
+
+    def test_image_info_webp_gif(self):
+        """> Read the size of WebP and GIF headers."""
+        headers = {
+            b"GIF89a\x40\x01\xf0\x00": ("gif", 320, 240),
+            b"RIFF\0\0\0\0WEBPVP8L\0\0\0\0\x2f\x3f\xc1\x3b\x00":
+                ("webp", 320, 240),
+            b"RIFF\0\0\0\0WEBPVP8X\0\0\0\0\0\0\0\0"
+            b"\x3f\x01\x00\xef\x00\x00": ("webp", 320, 240),
+        }
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for header, info in headers.items():
+                path = os.path.join(tmp, "img")
+                with open(path, "wb") as file:
+                    file.write(header.ljust(32, b"\0"))
+                self.assertEqual(index.image_info(path), info)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Test pixel sampling."""
+
+import argparse
+import unittest
+
+from pywal import pixels
+
+
+def image(width, height, accent):
+    """Gray image with an accent square in the top left corner."""
+    rows = []
+    for y in range(height):
+        for x in range(width):
+            inside = x < accent and y < accent
+            rows.append(bytes((220, 40, 40) if inside else (90, 90, 90)))
+    return b"".join(rows)
+
+
+class TestSample(unittest.TestCase):
+    """Test the stratified sampler."""
+
+    def test_small_image(self):
+        """> Keep every pixel when there are fewer than requested."""
+        data = image(4, 4, 1)
+        self.assertEqual(pixels.sample(data, 4, 4, 100), (data, 1.0))
+
+    def test_accent(self):
+        """> Sample a small accent region."""
+        data = image(200, 100, 20)
+        result, confidence = pixels.sample(data, 200, 100, 800)
+        accent = list(pixels.iter_pixels(result)).count((220, 40, 40))
+        self.assertLessEqual(len(result) // 3, 800)
+        self.assertGreater(accent, 0)
+        self.assertGreaterEqual(confidence, pixels.CONFIDENCE)
+
+    def test_sample_spec(self):
+        """> Parse the --samples argument."""
+        self.assertEqual(pixels.sample_spec("5000"), (5000, None))
+        self.assertEqual(pixels.sample_spec("5000:20"), (5000, 20.0))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            pixels.sample_spec("many")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Test library precomputation."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pywal import cache
+from pywal import colors
+from pywal import image
+from pywal import index
+from pywal import precompute
+from pywal import util
+
+
+IMG = os.path.abspath("tests/test_files/test.jpg")
+
+
+class TestPrecompute(unittest.TestCase):
+    """Test the precompute functions."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.img_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(shutil.rmtree, self.img_dir)
+        self.addCleanup(index.close, self.cache_dir)
+        self.addCleanup(cache.close, self.cache_dir)
+        self.addCleanup(util.close_checksum_memo, self.cache_dir)
+        self.img = os.path.join(self.img_dir, "test.jpg")
+        shutil.copy(IMG, self.img)
+
+    def test_list_images(self):
+        """> List the images of a directory."""
+        self.assertEqual(
+            image.list_images(self.img_dir, cache_dir=self.cache_dir),
+            [self.img],
+        )
+        self.assertEqual(
+            image.list_images(self.img_dir, True, cache_dir=self.cache_dir),
+            [self.img],
+        )
+
+    def test_worker_count(self):
+        """> Fit the workers in memory."""
+        self.assertEqual(precompute.worker_count(4, 0), 4)
+        self.assertEqual(precompute.worker_count(4, 1 << 60), 1)
+
+    def test_run_cached(self):
+        """> Skip cached images."""
+        options = cache.options_key("wal", False)
+        scheme = colors.colors_to_dict(
+            ["#000000"] * 16, self.img, self.cache_dir
+        )
+        cache.put(self.img, options, scheme, self.cache_dir)
+
+        counts = precompute.run(
+            self.img_dir, ["wal"], jobs=1, cache_dir=self.cache_dir
+        )
+        self.assertEqual(counts, {"cached": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""Test the backend registry."""
+
+import sys
+import unittest
+
+from pywal import colors
+from pywal import registry
+
+
+class TestRegistry(unittest.TestCase):
+    """Test the registry functions."""
+
+    def test_builtin_backends(self):
+        """> List the built-in backends."""
+        result = colors.list_backends()
+        self.assertIn("wal", result)
+        self.assertIn("schemer2", result)
+
+    def test_available_without_import(self):
+        """> Check availability without importing backends."""
+        result = registry.available()
+        self.assertTrue(set(result) <= set(registry.names()))
+        self.assertNotIn("pywal.backends.colorz", sys.modules)
+
+    def test_backend_metadata(self):
+        """> Read backend metadata."""
+        result = registry.get("okthief")
+        self.assertTrue(result.subprocess)
+        self.assertFalse(result.pixels)
+
+    def test_fallbacks(self):
+        """> Accept a python module in place of a missing command."""
+        backend = registry.Backend("test", "pywal.backends.test",
+                                   commands=("pywal-missing-command",))
+        self.assertFalse(backend.available)
+
+        backend.fallbacks = ("json",)
+        self.assertTrue(backend.available)
+
+    def test_unknown_backend(self):
+        """> Load an unknown backend. (fail)"""
+        self.assertIsNone(registry.get("nope"))
+        with self.assertRaises(ImportError):
+            registry.load("nope")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Test the subprocess runner."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pywal import instrument
+from pywal import runner
+
+
+class TestRunner(unittest.TestCase):
+    """Test the runner functions."""
+
+    def setUp(self):
+        """> Use a temporary cache dir."""
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+
+    def test_run(self):
+        """> Run a command."""
+        result = runner.run(["echo", "hello"], memo=False)
+        self.assertEqual(result, b"hello\n")
+
+    def test_run_not_found(self):
+        """> Run a missing command. (fail)"""
+        with self.assertRaises(runner.CommandNotFound):
+            runner.run(["pywal-no-such-command"])
+
+    def test_run_failed(self):
+        """> Run a failing command. (fail)"""
+        with self.assertRaises(runner.CommandFailed) as err:
+            runner.run(["false"], memo=False)
+        self.assertEqual(err.exception.returncode, 1)
+
+    def test_run_timeout(self):
+        """> Run a command for too long. (fail)"""
+        with self.assertRaises(runner.CommandTimeout):
+            runner.run(["sleep", "5"], timeout=0.2, memo=False)
+
+    def test_run_output_limit(self):
+        """> Run a command printing too much. (fail)"""
+        with self.assertRaises(runner.OutputTooLarge):
+            runner.run(["yes"], max_output=4096, memo=False)
+
+    def test_run_memo(self):
+        """> Reuse the output of an identical command."""
+        img = "tests/test_files/test.jpg"
+        argv = ["wc", "-c", img]
+        runner.run(argv, input_file=img, cache_dir=self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir + "/runs")), 1)
+        instrument.reset()
+        hits = runner.memo_hits()
+        result = runner.run(argv, input_file=img, cache_dir=self.cache_dir)
+        self.assertTrue(result.startswith(b"%d " % os.path.getsize(img)))
+        self.assertTrue(instrument.events("subprocess")[0]["cached"])
+        self.assertEqual(runner.memo_hits(), hits + 1)
+
+    def test_memo_entries(self):
+        """> Keep at most MEMO_ENTRIES outputs in memory."""
+        for i in range(runner.MEMO_ENTRIES + 2):
+            runner.remember("test%s" % i, b"")
+
+        self.assertLessEqual(len(runner._MEMO), runner.MEMO_ENTRIES)
+        self.assertIn("test%s" % (runner.MEMO_ENTRIES + 1), runner._MEMO)
+
+    def test_memo_off(self):
+        """> Always run the commands with the memo off."""
+        img = "tests/test_files/test.jpg"
+        runner.MEMO = False
+        self.addCleanup(setattr, runner, "MEMO", True)
+        runner.run(["wc", "-c", img], input_file=img,
+                   cache_dir=self.cache_dir)
+        self.assertFalse(os.path.exists(self.cache_dir + "/runs"))
+
+    def test_evict_memo(self):
+        """> Evict the least recently used outputs past the limits."""
+        runs = os.path.join(self.cache_dir, "runs")
+        os.mkdir(runs)
+        now = time.time()
+
+        for i in range(4):
+            with open(os.path.join(runs, str(i)), "wb") as file:
+                file.write(bytes(100))
+            os.utime(os.path.join(runs, str(i)), (now - i, now - i))
+
+        self.assertEqual(runner.evict_memo(self.cache_dir, 250), 2)
+        self.assertEqual(sorted(os.listdir(runs)), ["0", "1"])
+        self.assertEqual(runner.evict_memo(self.cache_dir, 0, 0.5), 1)
+        self.assertEqual(os.listdir(runs), ["0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Test picking wallpapers by palette."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pywal import cache
+from pywal import colors
+from pywal import index
+from pywal import similar
+from pywal import util
+
+
+IMG = os.path.abspath("tests/test_files/test.jpg")
+OPTIONS = cache.options_key("wal", False)
+
+
+def palette(shade):
+    """16 colors of one shade of grey."""
+    return ["#%02x%02x%02x" % (shade, shade, shade)] * 16
+
+
+class TestSimilar(unittest.TestCase):
+    """Test the palette picks."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.img_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(shutil.rmtree, self.img_dir)
+        self.addCleanup(index.close, self.cache_dir)
+        self.addCleanup(cache.close, self.cache_dir)
+        self.addCleanup(util.close_checksum_memo, self.cache_dir)
+        self.imgs = {}
+
+        for name, shade in (("dark.jpg", 0x10), ("grey.jpg", 0x80),
+                            ("light.jpg", 0xf0)):
+            img = os.path.join(self.img_dir, name)
+            shutil.copy(IMG, img)
+            scheme = colors.colors_to_dict(palette(shade), img,
+                                           self.cache_dir)
+            scheme["checksum"] = name * 4
+            cache.put(img, OPTIONS, scheme, self.cache_dir)
+            self.imgs[name] = img
+
+        self.current(0x00)
+
+    def current(self, shade):
+        """Set the current colorscheme."""
+        util.save_file_json(
+            colors.colors_to_dict(palette(shade), IMG, self.cache_dir),
+            os.path.join(self.cache_dir, "colors.json"),
+        )
+
+    def pick(self, mode, current=None):
+        """Pick an image of the test directory."""
+        return similar.pick(self.img_dir, mode, OPTIONS, current,
+                            cache_dir=self.cache_dir)
+
+    def test_features(self):
+        """> Convert a palette to 48 float32s."""
+        scheme = colors.colors_to_dict(palette(0xff), IMG, self.cache_dir)
+        self.assertEqual(len(similar.features(scheme)), similar.FEATURES * 4)
+
+    def test_ranking(self):
+        """> Rank vectors by distance."""
+        vectors = [bytes(similar.FEATURES * 4)] * 3
+        scheme = colors.colors_to_dict(palette(0x80), IMG, self.cache_dir)
+        vectors[1] = similar.features(scheme)
+        target = similar.features(scheme)
+
+        self.assertEqual(similar.ranking(target, b"".join(vectors)), [1])
+        self.assertEqual(
+            similar.ranking(target, b"".join(vectors), "different", 3)[2], 1
+        )
+
+    def test_pick(self):
+        """> Pick the closest and farthest palettes."""
+        self.assertEqual(self.pick("similar"), self.imgs["dark.jpg"])
+        self.assertEqual(self.pick("different"), self.imgs["light.jpg"])
+
+    def test_recent(self):
+        """> Skip the current and recent picks."""
+        current = self.pick("similar")
+        self.assertEqual(self.pick("similar", current), self.imgs["grey.jpg"])
+        self.assertEqual(self.pick("similar"), self.imgs["light.jpg"])
+
+    def test_snapshot(self):
+        """> Rebuild the snapshot when the index changes."""
+        paths, _ = similar.snapshot(self.img_dir, OPTIONS,
+                                    cache_dir=self.cache_dir)
+        self.assertEqual(sorted(paths), sorted(self.imgs.values()))
+
+        os.remove(self.imgs["dark.jpg"])
+        os.utime(self.img_dir, ns=(0, 10**9))
+        paths, vectors = similar.snapshot(self.img_dir, OPTIONS,
+                                          cache_dir=self.cache_dir)
+        self.assertEqual(len(paths), 2)
+        self.assertEqual(len(vectors), 2 * similar.FEATURES * 4)
+
+    def test_snapshot_rehash(self):
+        """> Rebuild the snapshot when an image is hashed again."""
+        # Old enough for the index not to list the directory again.
+        os.utime(self.img_dir, ns=(0, 10**9))
+        _, vectors = similar.snapshot(self.img_dir, OPTIONS,
+                                      cache_dir=self.cache_dir)
+
+        img = self.imgs["grey.jpg"]
+        scheme = colors.colors_to_dict(palette(0x40), img, self.cache_dir)
+        scheme["checksum"] = "rehashed" * 4
+        cache.put(img, OPTIONS, scheme, self.cache_dir)
+        # As many palettes as before once the oldest scheme is evicted.
+        cache.evict(self.cache_dir, max_entries=3)
+
+        paths, rebuilt = similar.snapshot(self.img_dir, OPTIONS,
+                                          cache_dir=self.cache_dir)
+        self.assertNotIn(self.imgs["dark.jpg"], paths)
+        self.assertEqual(len(rebuilt), len(vectors) - similar.FEATURES * 4)
+        self.assertIn(similar.features(scheme), rebuilt)
+
+    def test_no_current(self):
+        """> Pick nothing without a current colorscheme."""
+        os.remove(os.path.join(self.cache_dir, "colors.json"))
+        self.assertIsNone(self.pick("similar"))
+
+
+if __name__ == "__main__":
+    unittest.main()
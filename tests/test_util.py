@@ -2,6 +2,10 @@
 
 import unittest
 import os
+import shutil
+import tempfile
+import time
+import unittest.mock
 
 from pywal import util
 
@@ -91,9 +95,95 @@ class TestUtil(unittest.TestCase):
 
     def test_gen_color_checksum(self):
         """> Generate checksum from image file"""
-        result = util.get_img_checksum("tests/test_files/test.jpg")
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.addCleanup(util.close_checksum_memo, tmp_dir)
+        result = util.get_img_checksum("tests/test_files/test.jpg", tmp_dir)
         self.assertEqual(result, "8e21a704294404a9084375f1761aaa51")
 
+    def test_checksum_memo(self):
+        """> Reuse the checksum until the file changes."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.addCleanup(util.close_checksum_memo, tmp_dir)
+        img = os.path.join(tmp_dir, "img")
+        util.save_file("pixels", img)
+
+        checksum = util.get_img_checksum(img, tmp_dir)
+        self.assertEqual(
+            util.memo_checksum(util.stat_key(img), tmp_dir), checksum
+        )
+
+        # Known file versions aren't read again.
+        util.save_checksum(util.stat_key(img), "memoized", tmp_dir)
+        self.assertEqual(util.get_img_checksum(img, tmp_dir), "memoized")
+
+        os.utime(img, ns=(0, 0))
+        self.assertEqual(util.get_img_checksum(img, tmp_dir), checksum)
+
+    def test_prune_checksums(self):
+        """> Drop the least recently used checksums."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.addCleanup(util.close_checksum_memo, tmp_dir)
+
+        for i in range(3):
+            util.save_checksum("key%s" % i, "checksum%s" % i, tmp_dir)
+
+        # Hits long after the last use move a checksum to the back.
+        with unittest.mock.patch.object(util.time, "time",
+                                        return_value=time.time() + 10**6):
+            self.assertEqual(util.memo_checksum("key0", tmp_dir), "checksum0")
+
+        self.assertEqual(util.prune_checksums(tmp_dir, 1), 2)
+        self.assertEqual(util.memo_checksum("key0", tmp_dir), "checksum0")
+        self.assertIsNone(util.memo_checksum("key1", tmp_dir))
+
+    def test_fingerprints(self):
+        """> Fingerprint a file with every algorithm."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.addCleanup(util.close_checksum_memo, tmp_dir)
+        img = "tests/test_files/test.jpg"
+
+        blake2b = util.get_img_checksum(img, tmp_dir, "blake2b")
+        self.assertTrue(blake2b.startswith("blake2b:"))
+        self.assertEqual(
+            util.fingerprint_mmap(img), util.fingerprint_blake2b(img)
+        )
+        self.assertEqual(
+            util.fingerprint_md5(img), "8e21a704294404a9084375f1761aaa51"
+        )
+
+        for algorithm in util.FINGERPRINTS:
+            checksum = util.get_img_checksum(img, tmp_dir, algorithm)
+            self.assertEqual(util.checksum_algorithm(checksum), algorithm)
+            self.assertTrue(util.check_img_checksum(img, checksum, tmp_dir))
+
+        self.assertFalse(util.check_img_checksum(img, "None", tmp_dir))
+        with self.assertRaises(ValueError):
+            util.get_img_checksum(img, tmp_dir, "crc")
+
+    def test_contrast_ratio(self):
+        """> Contrast ratio of black and white."""
+        result = util.contrast_ratio("#000000", "#ffffff")
+        self.assertAlmostEqual(result, 21.0)
+
+    def test_oklab(self):
+        """> Convert a color to OKLab and back."""
+        lab = util.rgb_to_oklab((200, 30, 30))
+        self.assertAlmostEqual(lab[0], 0.5349, places=3)
+        self.assertEqual(util.oklab_to_rgb(lab), [200, 30, 30])
+
+    def test_palette_score(self):
+        """> Score a palette."""
+        flat = ["#000000"] * 16
+        result = util.palette_score(flat)
+        self.assertAlmostEqual(result, 1 / 9)
+        result = util.palette_score([COLORS["colors"]["color%s" % i]
+                                     for i in range(16)])
+        self.assertGreater(result, 1 / 9)
+
 
 if __name__ == "__main__":
     unittest.main()